@@ -7,6 +7,7 @@ config = {
     'author_email': 'simon.clement@gmail.com',
     'version': '0.3dev',
     'install_requires': ['requests', 'beautifulsoup4', 'lxml'],
+    'extras_require': {'export': ['numpy', 'pyarrow'], 'compression': ['zstandard']},
     'packages': find_packages(exclude='*.tests'),
     'name': 'SuSaKi'}
 
@@ -4,3 +4,10 @@ ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
 LOG_DIR = os.path.join(ROOT_DIR, 'logs')
 CRASH_DIR = os.path.join(LOG_DIR, 'crash')
 QUERY_DIR = os.path.join(LOG_DIR, 'query')
+SLOW_DIR = os.path.join(LOG_DIR, 'slow')
+FAILURE_DIR = os.path.join(LOG_DIR, 'failures')
+CACHE_DIR = os.path.join(ROOT_DIR, 'cache')
+SNAPSHOT_PATH = os.path.join(CACHE_DIR, 'hot_cache.json')
+# The list translator keeps its own snapshot, so bulk runs don't evict the
+# words of the interactive dictionary
+LIST_SNAPSHOT_PATH = os.path.join(CACHE_DIR, 'list_cache.json')
@@ -0,0 +1,309 @@
+"""
+Local article archive: a single indexed file of compressed raw articles.
+
+Layout of the file:
+    magic (8 bytes)
+    the compression dictionary of the codec, if any
+    the compressed articles, one after the other
+    the index: zlib compressed JSON with the metadata (format, codec and
+        location of the dictionary) and the offset, length and revision id
+        of every article
+    footer: offset and length of the index (2 x uint64), magic (8 bytes)
+
+The archive is opened with mmap, so a lookup only decompresses the one
+article it needs and the operating system keeps the hot pages in memory.
+ArchiveConnector serves the articles with the same interface as the
+network connectors, so everything can run offline at disk speed.
+"""
+import json
+import mmap
+import os
+import struct
+import zlib
+
+import logging
+
+from susaki.wiktionary import codec as codecs
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SUSAKIA1'
+FOOTER = struct.Struct('<QQ8s')
+FORMATS = ('html', 'wikitext')
+
+
+class ArchiveError(Exception):
+    pass
+
+
+########################################
+# Writing
+########################################
+class ArchiveWriter:
+    """
+    Writes an archive. Use as a context manager, or call close() to write
+    the index.
+    article_format: 'html' for articles rendered by the API, 'wikitext' for
+        raw wikitext. Stored in the archive so readers pick the right parser.
+    codec: one of the codecs of codec.py, plain zlib if None
+    """
+
+    def __init__(self, path, article_format='html', codec=None):
+        if article_format not in FORMATS:
+            raise ValueError('Unknown article format: {}'.format(article_format))
+        self.path = path
+        self.article_format = article_format
+        self.codec = codec or codecs.ZlibCodec()
+        self.index = {}
+        self._target = None
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._dictionary = (self._file.tell(), len(self.codec.dictionary))
+        self._file.write(self.codec.dictionary)
+
+    @classmethod
+    def append(cls, path):
+        """
+        Opens an existing archive to add, replace or remove articles. The
+        archive is rewritten to a temporary file which replaces it when the
+        writer is closed, so readers which have the old file open and a crash
+        midway both leave the old archive intact. The kept articles are
+        copied still compressed; the replaced and removed ones are dropped.
+        """
+        with ArchiveReader(path) as reader:
+            writer = cls(path + '.tmp', reader.article_format, reader.codec)
+            for word, entry in reader.index.items():
+                offset, length = entry[:2]
+                writer._write(word, reader._map[offset:offset + length],
+                              entry[2] if len(entry) > 2 else None)
+        writer._target = path
+        return writer
+
+    def add(self, word, raw_article, revision=None):
+        """
+        Adds the article. A word added a second time replaces the first article.
+        revision: the revision id of the article, used by incremental updates
+        """
+        self._write(word, self.codec.compress(raw_article.encode('utf-8')), revision)
+
+    def _write(self, word, data, revision):
+        offset = self._file.tell()
+        self._file.write(data)
+        self.index[word] = (offset, len(data), revision)
+
+    def remove(self, word):
+        self.index.pop(word, None)
+
+    def close(self):
+        if self._file.closed:
+            return
+        index = {'format': self.article_format, 'codec': self.codec.name,
+                 'dictionary': self._dictionary, 'articles': self.index}
+        data = zlib.compress(json.dumps(index, ensure_ascii=False).encode('utf-8'), 9)
+        offset = self._file.tell()
+        self._file.write(data)
+        self._file.write(FOOTER.pack(offset, len(data), MAGIC))
+        if self._target is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._file.close()
+        if self._target is not None:
+            os.replace(self.path, self._target)
+            self.path = self._target
+        logger.info('Wrote {} articles to {}'.format(len(self.index), self.path))
+
+    def discard(self):
+        """Drops the changes of an append, the archive stays as it was"""
+        self._file.close()
+        if self._target is not None:
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self._target is not None:
+            self.discard()
+        else:
+            self.close()
+
+
+########################################
+# Reading
+########################################
+class ArchiveReader:
+    """Random access to the articles of an archive through mmap"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ArchiveError('{} is empty'.format(path))
+        if len(self._map) < len(MAGIC) + FOOTER.size or self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ArchiveError('{} is not an article archive'.format(path))
+        offset, length, magic = FOOTER.unpack(self._map[-FOOTER.size:])
+        if magic != MAGIC:
+            self._map.close()
+            raise ArchiveError('{} is truncated'.format(path))
+        index = json.loads(zlib.decompress(self._map[offset:offset + length]).decode('utf-8'))
+        self.index_offset = offset
+        self.article_format = index['format']
+        self.index = index['articles']
+        self.dictionary_location = index.get('dictionary', (0, 0))
+        dictionary_offset, dictionary_length = self.dictionary_location
+        self.codec = codecs.create_codec(
+            index['codec'], self._map[dictionary_offset:dictionary_offset + dictionary_length])
+
+    def get(self, word):
+        """Returns the raw article. Raises a KeyError if the word isn't archived."""
+        offset, length = self.index[word][:2]
+        return self.codec.decompress(self._map[offset:offset + length]).decode('utf-8')
+
+    def revision(self, word):
+        """Returns the revision id of the archived article, None if unknown"""
+        entry = self.index[word]
+        return entry[2] if len(entry) > 2 else None
+
+    def words(self):
+        return self.index.keys()
+
+    def __contains__(self, word):
+        return word in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ArchiveConnector:
+    """
+    Collects the articles from a local archive instead of Wiktionary.
+    Parse the results with article_parsing or wikitext_parsing depending on
+    article_format.
+    """
+
+    def __init__(self, path):
+        logger.debug('Initializing ArchiveConnector for {}'.format(path))
+        self.path = path
+        self.archive = ArchiveReader(path)
+        self.article_format = self.archive.article_format
+
+    def reload(self):
+        """
+        Reopens the archive to see the articles added since it was opened.
+        The old map is left to the garbage collector, as other threads may
+        still be reading from it.
+        """
+        self.archive = ArchiveReader(self.path)
+
+    def collect_raw_article(self, word):
+        logger.debug('Collecting the raw article for "{}" from the archive'.format(word))
+        try:
+            return self.archive.get(word)
+        except KeyError:
+            raise LookupError('The word "{}" is not in the archive'.format(word))
+
+    @property
+    def parser(self):
+        """The parsing module for the archived articles"""
+        from susaki.wiktionary.wiki_parsing import article_parsing, wikitext_parsing
+        return wikitext_parsing if self.article_format == 'wikitext' else article_parsing
+
+
+########################################
+# Building
+########################################
+EXTENSIONS = {'.html': 'html', '.wikitext': 'wikitext'}
+
+
+def read_article_directory(directory):
+    """Yields (word, raw article, format) for every <word>.html or <word>.wikitext file"""
+    for file_name in sorted(os.listdir(directory)):
+        word, extension = os.path.splitext(file_name)
+        if extension in EXTENSIONS:
+            with open(os.path.join(directory, file_name), encoding='utf-8') as f:
+                yield word, f.read(), EXTENSIONS[extension]
+
+
+def fetch_articles(words, connector):
+    """Yields (word, raw article) for every word the connector can collect"""
+    from susaki.wiktionary.throttling import TransientError
+    for word in words:
+        try:
+            yield word, connector.collect_raw_article(word)
+        except LookupError:
+            logger.info('No article for "{}"'.format(word))
+        except TransientError as err:
+            logger.warning('Skipping "{}": {}'.format(word, err))
+
+
+def build_archive(path, articles, article_format='html', codec_name='zlib', sample_size=200):
+    """
+    articles: iterable of (word, raw article) pairs
+    codec_name: the name of the codec. The dictionary of a dictionary codec
+        is trained on the first sample_size articles.
+    Return: the number of archived articles
+    """
+    articles = iter(articles)
+    samples = []
+    dictionary = b''
+    if codec_name != codecs.ZlibCodec.name:
+        for word, raw_article in articles:
+            samples.append((word, raw_article))
+            if len(samples) >= sample_size:
+                break
+        dictionary = codecs.train_dictionary(
+            [raw_article.encode('utf-8') for _, raw_article in samples], codec_name)
+        logger.info('Trained a {} byte dictionary on {} articles'.format(
+            len(dictionary), len(samples)))
+    codec = codecs.create_codec(codec_name, dictionary)
+    with ArchiveWriter(path, article_format, codec) as writer:
+        for word, raw_article in samples:
+            writer.add(word, raw_article)
+        for word, raw_article in articles:
+            writer.add(word, raw_article)
+    return len(writer.index)
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(
+        description='Build an article archive from a directory of articles '
+                    '(<word>.html or <word>.wikitext files) or by fetching a list of words')
+    argparser.add_argument('target', help='Path of the archive to write')
+    source = argparser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--directory', help='Directory containing the articles')
+    source.add_argument('--fetch', help='File with one word per line to fetch from Wiktionary')
+    argparser.add_argument('-w', '--wikitext', action='store_true',
+                           help='Fetch the raw wikitext instead of the rendered html')
+    argparser.add_argument('-c', '--codec', choices=sorted(codecs.CODECS),
+                           default=codecs.best_dictionary_codec(),
+                           help='Compression codec (default: %(default)s)')
+    args = argparser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.directory:
+        articles = list(read_article_directory(args.directory))
+        formats = {article_format for _, _, article_format in articles}
+        if len(formats) > 1:
+            argparser.error('The directory mixes html and wikitext articles')
+        count = build_archive(args.target, [(word, raw) for word, raw, _ in articles],
+                              formats.pop() if formats else 'html', args.codec)
+    else:
+        from susaki.wiktionary.connectors import APIConnector, WikitextConnector
+        connector = WikitextConnector() if args.wikitext else APIConnector()
+        with open(args.fetch, encoding='utf-8') as f:
+            words = [line.strip().lower() for line in f if line.strip()]
+        count = build_archive(args.target, fetch_articles(words, connector),
+                              'wikitext' if args.wikitext else 'html', args.codec)
+    print('Archived {} articles in {}'.format(count, args.target))
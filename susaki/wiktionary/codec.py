@@ -0,0 +1,155 @@
+"""
+Compression codecs for stored raw and parsed articles.
+
+The articles are very repetitive across pages (the same table markup, css
+classes and navigation), but each record is too small for a compressor to
+learn much from on its own. The dictionary codecs are therefore primed
+with a dictionary trained on a sample of articles, which is stored once
+next to the records. Every record is still compressed on its own, so any
+record can be decompressed without touching the others.
+
+zstandard is used when installed (pip install zstandard); otherwise the
+standard library zlib is used with a preset dictionary built from the most
+common markup of the samples.
+"""
+import re
+import zlib
+from collections import Counter
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# zlib can only look 32 KiB back, so a larger dictionary wouldn't be used
+ZLIB_DICTIONARY_SIZE = 32 * 1024
+ZSTD_DICTIONARY_SIZE = 110 * 1024
+SEGMENT_PATTERN = re.compile(rb'<[^<>]{1,400}>|[^<>\n]{4,200}')
+
+
+########################################
+# Codecs
+########################################
+class ZlibCodec:
+    """Compresses every record on its own, without a dictionary"""
+
+    name = 'zlib'
+
+    def __init__(self, dictionary=b'', level=9):
+        self.dictionary = b''
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class ZlibDictionaryCodec:
+    """Raw deflate primed with a preset dictionary (zdict)"""
+
+    name = 'zlib-dict'
+
+    def __init__(self, dictionary, level=9):
+        self.dictionary = dictionary
+        self.level = level
+
+    def compress(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=self.dictionary)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        decompressor = zlib.decompressobj(-15, zdict=self.dictionary)
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+class ZstdDictionaryCodec:
+    """zstandard with a trained dictionary"""
+
+    name = 'zstd-dict'
+
+    def __init__(self, dictionary, level=19):
+        if zstandard is None:
+            raise ImportError('zstandard is needed for the {} codec'.format(self.name))
+        self.dictionary = dictionary
+        self.level = level
+        self._dictionary = zstandard.ZstdCompressionDict(dictionary)
+        self._dictionary.precompute_compress(level=level)
+
+    def compress(self, data):
+        # The compressors aren't thread-safe, but creating one is cheap
+        compressor = zstandard.ZstdCompressor(
+            level=self.level, dict_data=self._dictionary, write_content_size=True,
+            write_dict_id=False)
+        return compressor.compress(data)
+
+    def decompress(self, data):
+        return zstandard.ZstdDecompressor(dict_data=self._dictionary).decompress(data)
+
+
+CODECS = {codec.name: codec for codec in [ZlibCodec, ZlibDictionaryCodec, ZstdDictionaryCodec]}
+
+
+def create_codec(name, dictionary=b''):
+    try:
+        codec = CODECS[name]
+    except KeyError:
+        raise ValueError('Unknown codec: {}'.format(name))
+    return codec(dictionary)
+
+
+def best_dictionary_codec():
+    """The name of the best dictionary codec available"""
+    return ZstdDictionaryCodec.name if zstandard is not None else ZlibDictionaryCodec.name
+
+
+########################################
+# Dictionary training
+########################################
+def train_dictionary(samples, codec_name=None):
+    """
+    Trains a compression dictionary for the codec on the samples (bytes).
+    Return: the dictionary as bytes
+    """
+    codec_name = codec_name or best_dictionary_codec()
+    samples = [sample for sample in samples if sample]
+    if codec_name == ZstdDictionaryCodec.name:
+        if zstandard is None:
+            raise ImportError('zstandard is needed for the {} codec'.format(codec_name))
+        size = min(ZSTD_DICTIONARY_SIZE, max(1024, sum(len(sample) for sample in samples) // 10))
+        try:
+            return zstandard.train_dictionary(size, samples).as_bytes()
+        except zstandard.ZstdError as err:
+            # Too few samples for the zstd trainer, fall back to the markup dictionary
+            logger.info('Falling back to the markup dictionary: {}'.format(err))
+            return train_markup_dictionary(samples, size)
+    if codec_name == ZlibDictionaryCodec.name:
+        return train_markup_dictionary(samples)
+    return b''
+
+
+def train_markup_dictionary(samples, size=ZLIB_DICTIONARY_SIZE):
+    """
+    Builds a dictionary from the tags and text segments found in several
+    samples. Segments are ranked by the bytes they would save, and the most
+    valuable ones are placed last, where matches are cheapest to encode.
+    """
+    document_frequency = Counter()
+    for sample in samples:
+        document_frequency.update(set(SEGMENT_PATTERN.findall(sample)))
+    ranked = sorted(
+        ((count - 1) * len(segment), segment)
+        for segment, count in document_frequency.items() if count > 1)
+    chosen = []
+    total = 0
+    for _, segment in reversed(ranked):
+        if total + len(segment) > size:
+            continue
+        chosen.append(segment)
+        total += len(segment)
+    return b''.join(reversed(chosen))
@@ -4,8 +4,13 @@ Created on Apr 21, 2016
 @author: simon
 '''
 import abc
+import threading
+from urllib.parse import quote
 import requests
 from bs4 import BeautifulSoup
+from lxml import etree
+from susaki.wiktionary.throttling import TransientError, get_with_retry
+from susaki.wiktionary.wiki_parsing.util import decompose
 import logging
 logger = logging.getLogger(__name__)
 
@@ -20,41 +25,182 @@ class Connector(metaclass=abc.ABCMeta):
         """Access Wiktionary to collect the article for the given word.
            Returns a HTTPError if the page doesn't exists.
            Returns a LookupError if the page does exists but no definitions exists for the given word
-           in the target language """
+           in the target language
+           Raises a TransientError if Wiktionary couldn't be reached, in which case
+           nothing is known about the page """
         raise NotImplementedError
 
 
 class APIConnector:
+    """
+    Collects the article as html rendered by the server.
+    A connector keeps no state between requests, so one connector (and its
+    session) can be shared by all the threads of a process.
+    """
 
-    def __init__(self):
-        logger.debug('Initializing APIConnector')
+    url = 'https://en.wiktionary.org/w/api.php?format=xml&action=query&prop=revisions&titles={}&rvprop=ids|content&rvparse&redirects=true&maxlag=5'
+
+    def __init__(self, session=None, rate_limiter=None, max_retries=4, url=None):
+        """
+        session: requests.Session used for all requests. Share one session
+            between connectors to reuse its connection pool.
+        rate_limiter: throttling.RateLimiter, the one shared by all connectors if None
+        url: overrides the url template, e.g. to use a mirror
+        """
+        logger.debug('Initializing {}'.format(type(self).__name__))
+        self.session = session or requests.Session()
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        if url is not None:
+            self.url = url
 
     def collect_raw_article(self, word):
+        return self.collect_revision(word)[0]
+
+    def collect_revision(self, word):
+        """
+        Same as collect_raw_article, but returns (raw article, revision id)
+        """
         logger.debug('Collecting the raw article for "{}" using the API'.format(word))
-        url = 'https://en.wiktionary.org/w/api.php?format=xml&action=query&prop=revisions&titles={}&rvprop=content&rvparse&redirects=true'.format(word)
-        req = requests.get(url)
+        url = self.url.format(quote(word))
+        req = get_with_retry(self.session, url, self.rate_limiter, self.max_retries)
         soup = BeautifulSoup(req.content, 'lxml')
-        content = soup.find('rev', {'xml:space': 'preserve'})
         try:
-            content_text = content.text
-        except AttributeError:
-            raise LookupError("Article can't be accessed by API")
-        logger.debug('Article found')
-        return content_text
+            error = soup.find('error')
+            if error is not None:
+                raise TransientError('The API returned the error "{}"'.format(error.get('code')))
+            content = soup.find('rev', {'xml:space': 'preserve'})
+            try:
+                content_text = content.text
+            except AttributeError:
+                raise LookupError("Article can't be accessed by API")
+            logger.debug('Article found')
+            revision_id = content.get('revid')
+        finally:
+            decompose(soup)
+        return content_text, int(revision_id) if revision_id else None
+
+
+class WikitextConnector(APIConnector):
+    """
+    Collects the raw wikitext of the article instead of the rendered html.
+    Parse the result with wikitext_parsing.parse_article.
+    """
+
+    url = 'https://en.wiktionary.org/w/api.php?format=xml&action=query&prop=revisions&titles={}&rvprop=ids|content&redirects=true&maxlag=5'
+
+
+class SectionConnector:
+    """
+    Collects only the rendered section of one language instead of the whole
+    article. The sections of a title are listed first (action=parse with
+    prop=sections) and the index of the language section is cached, so
+    later lookups of the title take a single request. The result can be
+    parsed with article_parsing, but only for this language: the other
+    languages need the whole article (full_connector).
+    A page without a section for the language gives an empty article, which
+    parse_article reports as missing the language, like a full article would.
+    """
+
+    api_url = 'https://en.wiktionary.org/w/api.php'
+    sections_query = '?format=xml&action=parse&page={}&prop=sections&redirects=1&maxlag=5'
+    section_query = '?format=xml&action=parse&page={}&section={}&prop=text|revid&redirects=1&maxlag=5'
+    MISSING_PAGE_ERRORS = {'missingtitle', 'invalidtitle'}
+
+    def __init__(self, language='Finnish', session=None, rate_limiter=None, max_retries=4,
+                 api_url=None, cache_size=10000):
+        logger.debug('Initializing SectionConnector')
+        self.language = language
+        self.session = session or requests.Session()
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        if api_url is not None:
+            self.api_url = api_url
+        self.cache_size = cache_size
+        self._section_indexes = {}
+        self._lock = threading.Lock()
+
+    def full_connector(self):
+        """Returns an APIConnector collecting the whole articles from the same API"""
+        return APIConnector(self.session, self.rate_limiter, self.max_retries,
+                            self.api_url + APIConnector.url[APIConnector.url.index('?'):])
+
+    def _query(self, query):
+        req = get_with_retry(self.session, self.api_url + query, self.rate_limiter,
+                             self.max_retries)
+        try:
+            root = etree.fromstring(req.content)
+        except etree.XMLSyntaxError:
+            raise TransientError('The API returned an invalid response')
+        error = root.find('error')
+        if error is not None:
+            code = error.get('code')
+            if code in self.MISSING_PAGE_ERRORS:
+                raise LookupError("Article can't be accessed by API")
+            raise TransientError('The API returned the error "{}"'.format(code))
+        return root.find('parse')
+
+    def section_index(self, word):
+        """Returns the index of the language section of the page, None if it has none"""
+        with self._lock:
+            if word in self._section_indexes:
+                return self._section_indexes[word]
+        parse = self._query(self.sections_query.format(quote(word)))
+        index = None
+        for section in parse.iter('s'):
+            if section.get('level') == '2' and section.get('line') == self.language:
+                index = section.get('index')
+                break
+        with self._lock:
+            if len(self._section_indexes) >= self.cache_size:
+                del self._section_indexes[next(iter(self._section_indexes))]
+            self._section_indexes[word] = index
+        return index
+
+    def _collect_section(self, word, index):
+        parse = self._query(self.section_query.format(quote(word), index))
+        revision_id = parse.get('revid')
+        return parse.findtext('text') or '', int(revision_id) if revision_id else None
+
+    def collect_revision(self, word):
+        """Returns (html of the language section, revision id)"""
+        logger.debug('Collecting the {} section of "{}" using the API'.format(self.language, word))
+        index = self.section_index(word)
+        if index is None:
+            return '', None
+        content, revision_id = self._collect_section(word, index)
+        if '>{}</span>'.format(self.language) not in content:
+            # The page was edited since the index was cached and the sections moved
+            logger.debug('The cached section index of "{}" is stale'.format(word))
+            with self._lock:
+                self._section_indexes.pop(word, None)
+            index = self.section_index(word)
+            if index is None:
+                return '', None
+            content, revision_id = self._collect_section(word, index)
+        return content, revision_id
+
+    def collect_raw_article(self, word):
+        return self.collect_revision(word)[0]
 
 
 class HTMLConnector(Connector):
+    """Collects the article page, or the suggestions of the search page. Thread-safe."""
 
-    def __init__(self, language, server_location='https://'):
+    def __init__(self, language, server_location='https://', session=None, rate_limiter=None,
+                 max_retries=4):
         logger.debug('Initializing HTMLConnector')
         super().__init__(language)
         self.server_location = server_location
+        self.session = session or requests.Session()
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
 
     def _collect_page(self, word):
         """Collects the html page for the given word"""
         url = '{}en.wiktionary.org/wiki/Special:Search?search={}&go=Try+exact+match'.format(
-            self.server_location, word)
-        req = requests.get(url)
+            self.server_location, quote(word))
+        req = get_with_retry(self.session, url, self.rate_limiter, self.max_retries)
         return req
 
     def collect_raw_article(self, word):
@@ -67,6 +213,12 @@ class HTMLConnector(Connector):
         # Collect html page
         req = self._collect_page(word)
         soup = BeautifulSoup(req.content, 'html.parser')
+        try:
+            return self._read_page(soup, word, req)
+        finally:
+            decompose(soup)
+
+    def _read_page(self, soup, word, req):
         content = soup.body.find('div', id='content')
         heading = content.find('h1', id='firstHeading')
         article_content = content.find('div', id='mw-content-text')
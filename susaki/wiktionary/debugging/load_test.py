@@ -0,0 +1,253 @@
+#############################
+# Drives the lookups at set concurrency levels against the local mock of
+# Wiktionary (mock_wiktionary.py) and reports the throughput and the latency
+# percentiles of every level. The targets are:
+#   connector: the bare connector, one request (or two for sections) per lookup
+#   lookup: a Lookup with the search page as suggestion connector
+#   translator: ListTranslator.translate_word of examples/translate.py
+#   service: GET /lookup of the lookup service, over HTTP
+# The caches of the lookup and the translator are emptied before every call
+# unless --warm is given.
+#
+#   python load_test.py [-t TARGET ...] [-k KIND] [-c 1 4 16] [-n REQUESTS]
+#                       [--latency S] [--error-rate P] [--max-rate R]
+#############################
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from susaki.definitions import ROOT_DIR
+from susaki.wiktionary.debugging.mock_wiktionary import MockWiktionary
+
+EXAMPLES_DIR = os.path.join(ROOT_DIR, 'susaki', 'wiktionary', 'examples')
+TARGETS = ('connector', 'lookup', 'translator', 'service')
+KINDS = ('api', 'wikitext', 'sections')
+# Words with an article, words with suggestions and words without any
+DEFAULT_WORDS = ('koira', 'kuu', 'ilma', 'olla', 'sää', 'haluta', 'lämmin', 'päästä',
+                 'koiralle', 'kuussa', 'ilmassa', 'xyzzy')
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_load(function, words, concurrency, requests):
+    """
+    Calls function(word) requests times from concurrency threads, cycling
+    through the words. An exception raised by the function counts as an error.
+    Return: dict of the requests, errors, seconds, throughput (requests per
+        second) and the mean, p50, p99 and max latencies in seconds
+    """
+    words = list(words)
+    counter = itertools.count()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            index = next(counter)
+            if index >= requests:
+                return
+            start = time.perf_counter()
+            try:
+                function(words[index % len(words)])
+                error = None
+            except Exception as err:
+                error = err
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if error is not None:
+                    errors.append(error)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'seconds': seconds,
+        'throughput': len(latencies) / seconds if seconds else 0.0,
+        'mean': sum(latencies) / len(latencies) if latencies else 0.0,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'max': latencies[-1] if latencies else 0.0,
+    }
+
+
+########################################
+# Targets
+########################################
+def create_connector(mock, kind, rate_limiter, session=None):
+    """Returns (connector, parser) of the kind, asking the mock"""
+    from susaki.wiktionary.connectors import APIConnector, SectionConnector, WikitextConnector
+    from susaki.wiktionary.wiki_parsing import article_parsing, wikitext_parsing
+    kwargs = dict(mock.connector_kwargs(kind), session=session, rate_limiter=rate_limiter)
+    if kind == 'sections':
+        return SectionConnector('Finnish', **kwargs), article_parsing
+    if kind == 'wikitext':
+        return WikitextConnector(**kwargs), wikitext_parsing
+    return APIConnector(**kwargs), article_parsing
+
+
+def create_lookup(mock, kind, rate_limiter):
+    import requests
+    from susaki.wiktionary.connectors import HTMLConnector
+    from susaki.wiktionary.lookup import Lookup
+    session = requests.Session()
+    connector, parser = create_connector(mock, kind, rate_limiter, session)
+    suggestion_connector = HTMLConnector('Finnish', session=session, rate_limiter=rate_limiter,
+                                         **mock.connector_kwargs('html'))
+    return Lookup(connector, parser, suggestion_connector, session=session)
+
+
+def clear_caches(lookup):
+    for cache in (lookup.raw_articles, lookup.results):
+        for key in cache.keys():
+            cache.pop(key)
+
+
+def _collect(connector, word):
+    try:
+        connector.collect_raw_article(word)
+    except LookupError:
+        # A missing article is an answer too
+        pass
+
+
+def _create_translator(mock, kind, rate_limiter):
+    if EXAMPLES_DIR not in sys.path:
+        sys.path.insert(0, EXAMPLES_DIR)
+    from translate import ListTranslator
+    # The translator sets up the logging of a command line run, undone here
+    root = logging.getLogger()
+    level, handlers = root.level, list(root.handlers)
+    translator = ListTranslator(snapshot_path=None)
+    root.setLevel(level)
+    root.handlers[:] = handlers
+    translator._connector, translator._parser = create_connector(mock, kind, rate_limiter)
+    return translator
+
+
+@contextmanager
+def target(name, mock, kind='api', rate_limiter=None, warm=False, workers=8):
+    """Yields function(word) looking the word up through the target"""
+    from susaki.wiktionary.throttling import RateLimiter
+    rate_limiter = rate_limiter or RateLimiter(rate=1000.0, burst=100, max_rate=1000.0)
+    if name == 'connector':
+        connector, _ = create_connector(mock, kind, rate_limiter)
+        yield lambda word: _collect(connector, word)
+    elif name == 'lookup':
+        lookup = create_lookup(mock, kind, rate_limiter)
+
+        def look_up(word):
+            if not warm:
+                clear_caches(lookup)
+            return lookup.lookup(word)
+        yield look_up
+    elif name == 'translator':
+        from susaki.wiktionary.snapshot import HotCache
+        translator = _create_translator(mock, kind, rate_limiter)
+
+        def translate(word):
+            if not warm:
+                translator.hot_cache = HotCache(mode=translator.mode)
+                clear_caches(translator.lookup)
+            return translator.translate_word(word)
+        yield translate
+    elif name == 'service':
+        import requests
+        lookup = create_lookup(mock, kind, rate_limiter)
+        local = threading.local()
+        with _service(lookup, workers) as url:
+
+            def get(word):
+                if not warm:
+                    clear_caches(lookup)
+                if not hasattr(local, 'session'):
+                    local.session = requests.Session()
+                response = local.session.get(url + '/lookup', params={'word': word})
+                response.raise_for_status()
+                return response.json()
+            yield get
+    else:
+        raise ValueError('Unknown target: {}'.format(name))
+
+
+@contextmanager
+def _service(lookup, workers):
+    """Runs a LookupService on an event loop in a thread, yields its url"""
+    from susaki.wiktionary.service import LookupService
+    service = LookupService(lookup, workers=workers)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = asyncio.run_coroutine_threadsafe(service.start('127.0.0.1', 0), loop).result()
+    host, port = server.sockets[0].getsockname()[:2]
+    try:
+        yield 'http://{}:{}'.format(host, port)
+    finally:
+        asyncio.run_coroutine_threadsafe(service.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        description='Measure the lookups under load against a local mock of Wiktionary')
+    argparser.add_argument('words', nargs='*', default=DEFAULT_WORDS)
+    argparser.add_argument('-t', '--targets', nargs='+', choices=TARGETS, default=TARGETS)
+    argparser.add_argument('-k', '--kind', choices=KINDS, default='api',
+                           help='The connector used (default: %(default)s)')
+    argparser.add_argument('-c', '--concurrency', type=int, nargs='+', default=[1, 4, 16],
+                           help='The numbers of concurrent clients (default: %(default)s)')
+    argparser.add_argument('-n', '--requests', type=int, default=200,
+                           help='Requests per concurrency level (default: %(default)s)')
+    argparser.add_argument('--warm', action='store_true',
+                           help="Don't empty the caches before every call")
+    argparser.add_argument('--workers', type=int, default=8, help='Threads of the service')
+    argparser.add_argument('--client-rate', type=float, default=1000.0,
+                           help='Requests per second the rate limiter of the connectors allows')
+    argparser.add_argument('--latency', type=float, default=0.05,
+                           help='Seconds added to every response of the mock')
+    argparser.add_argument('--jitter', type=float, default=0.0)
+    argparser.add_argument('--error-rate', type=float, default=0.0,
+                           help='Fraction of the responses failing with HTTP 503')
+    argparser.add_argument('--max-rate', type=float,
+                           help='Requests per second above which the mock returns HTTP 429')
+    args = argparser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    from susaki.wiktionary.throttling import RateLimiter
+    print('{:<11} {:>5} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9}  {}'.format(
+        'target', 'conc', 'requests', 'errors', 'req/s', 'p50 ms', 'p99 ms', 'max ms',
+        'mock requests'))
+    for name in args.targets:
+        for concurrency in args.concurrency:
+            with MockWiktionary(latency=args.latency, jitter=args.jitter,
+                                error_rate=args.error_rate, max_rate=args.max_rate) as mock:
+                rate_limiter = RateLimiter(rate=args.client_rate, burst=max(1, concurrency),
+                                           max_rate=args.client_rate)
+                with target(name, mock, args.kind, rate_limiter, args.warm, args.workers) as function:
+                    report = run_load(function, args.words, concurrency, args.requests)
+                print('{:<11} {:>5} {:>8} {:>7} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}  {}'.format(
+                    name, concurrency, report['requests'], report['errors'],
+                    report['throughput'], report['p50'] * 1000, report['p99'] * 1000,
+                    report['max'] * 1000,
+                    ', '.join('{} {}'.format(key, count)
+                              for key, count in sorted(mock.counts.items()))))
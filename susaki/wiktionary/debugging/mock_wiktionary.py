@@ -0,0 +1,260 @@
+#############################
+# A local stand-in for en.wiktionary.org, for measuring the lookups without
+# touching the real site. It serves the responses the connectors expect
+# from the pages of the test fixtures:
+#   /w/api.php action=query (rendered html, or wikitext where a fixture
+#       exists), action=parse (sections of the rendered html)
+#   /wiki/Special:Search (the article page, the search page with
+#       suggestions, or the page without results)
+# Latency, failures (HTTP 503) and throttling (HTTP 429 with Retry-After
+# above max_rate requests per second) can be injected.
+#
+#   python mock_wiktionary.py [-p PORT] [--latency S] [--error-rate P] [--max-rate R]
+#############################
+
+import argparse
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from susaki.definitions import ROOT_DIR
+
+FIXTURE_DIR = os.path.join(ROOT_DIR, 'tests', 'wiktionary')
+PAGES_DIR = os.path.join(FIXTURE_DIR, 'parsing_test', 'raw_pages')
+WIKITEXT_DIR = os.path.join(FIXTURE_DIR, 'parsing_test', 'wikitext_parsing_data')
+SEARCH_DIR = os.path.join(FIXTURE_DIR, 'connectors_test')
+HEADER_PATTERN = re.compile(
+    r'<h(\d)><span class="mw-headline" id="[^"]*">(.*?)</span>'
+    r'<span class="mw-editsection">.*?section=(\d+)')
+SUGGESTION_SUFFIXES = ('ta', 'lle', 'ssa', 'n')
+
+
+class MockWiktionary:
+    """
+    pages_dir: the rendered articles, <title>.html
+    wikitext_dir: the wikitext of the articles, input_<title>.wikitext
+    latency: seconds added to every response, jitter: random extra seconds
+    error_rate: fraction of the requests answered with HTTP 503
+    max_rate: requests per second above which the requests are throttled
+        (HTTP 429), unlimited if None
+    Words which are a title plus a common ending (koiralle) have
+    suggestions on the search page, all other unknown words have none.
+    """
+
+    def __init__(self, pages_dir=PAGES_DIR, wikitext_dir=WIKITEXT_DIR, search_dir=SEARCH_DIR,
+                 latency=0.0, jitter=0.0, error_rate=0.0, max_rate=None, retry_after=1,
+                 seed=None):
+        self.pages = {}
+        for file_name in os.listdir(pages_dir):
+            title, extension = os.path.splitext(file_name)
+            if extension == '.html':
+                with open(os.path.join(pages_dir, file_name), encoding='utf-8') as f:
+                    self.pages[title] = f.read()
+        self.wikitext = {}
+        for file_name in os.listdir(wikitext_dir):
+            if file_name.startswith('input_') and file_name.endswith('.wikitext'):
+                with open(os.path.join(wikitext_dir, file_name), encoding='utf-8') as f:
+                    self.wikitext[file_name[len('input_'):-len('.wikitext')]] = f.read()
+        self.search_pages = {}
+        for name in ('article_exists', 'multiple_suggestions', 'no_result'):
+            with open(os.path.join(search_dir, name + '.html'), 'rb') as f:
+                self.search_pages[name] = f.read()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_rate = max_rate
+        self.retry_after = retry_after
+        self.counts = Counter()
+        self._random = random.Random(seed)
+        self._tokens = float(max_rate or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.server = None
+
+    ########################################
+    # Server
+    ########################################
+    def start(self, host='127.0.0.1', port=0):
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def __enter__(self):
+        return self.start() if self.server is None else self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def connector_kwargs(self, kind):
+        """The arguments pointing a connector of the kind at the mock"""
+        if kind in ('api', 'wikitext'):
+            from susaki.wiktionary.connectors import APIConnector, WikitextConnector
+            template = WikitextConnector.url if kind == 'wikitext' else APIConnector.url
+            return {'url': template.replace('https://en.wiktionary.org', self.url)}
+        if kind == 'sections':
+            return {'api_url': self.url + '/w/api.php'}
+        if kind == 'html':
+            return {'server_location': self.url + '/'}
+        raise ValueError('Unknown connector kind: {}'.format(kind))
+
+    ########################################
+    # Fault injection
+    ########################################
+    def _admit(self):
+        """Returns None, or the (status, headers, body) of an injected failure"""
+        if self.max_rate:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.max_rate, self._tokens + (now - self._updated) * self.max_rate)
+                self._updated = now
+                throttled = self._tokens < 1
+                if throttled:
+                    self.counts['throttled'] += 1
+                else:
+                    self._tokens -= 1
+            if throttled:
+                return 429, {'Retry-After': str(self.retry_after)}, b'Too many requests'
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.count('errors')
+            return 503, {}, b'Service unavailable'
+        return None
+
+    def count(self, name):
+        """The handler threads update the counts concurrently"""
+        with self._lock:
+            self.counts[name] += 1
+
+    def _delay(self):
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    ########################################
+    # Responses
+    ########################################
+    def query(self, query):
+        title = query.get('titles', '')
+        if 'rvparse' in query:
+            content = self.pages.get(title)
+        else:
+            content = self.wikitext.get(title)
+        if content is None:
+            return '<api><query><pages><page ns="0" title="{}" missing=""/></pages></query></api>'.format(
+                escape(title))
+        return ('<api><query><pages><page ns="0" title="{0}"><revisions>'
+                '<rev revid="1" parentid="0" xml:space="preserve">{1}</rev>'
+                '</revisions></page></pages></query></api>').format(escape(title), escape(content))
+
+    def sections(self, title):
+        html = self.pages[title]
+        return html, [(match.start(), int(match.group(1)), match.group(2), int(match.group(3)))
+                      for match in HEADER_PATTERN.finditer(html)]
+
+    def parse(self, query):
+        title = query.get('page', '')
+        if title not in self.pages:
+            return '<api><error code="missingtitle" info="The page you specified doesn\'t exist."/></api>'
+        html, headers = self.sections(title)
+        if query.get('prop') == 'sections':
+            return '<api><parse title="{}"><sections>{}</sections></parse></api>'.format(
+                escape(title), ''.join('<s level="{}" line="{}" index="{}"/>'.format(
+                    level, escape(line), number) for _, level, line, number in headers))
+        index = int(query.get('section', 0))
+        text = ''
+        for i, (start, level, _, number) in enumerate(headers):
+            if number == index:
+                end = next((other[0] for other in headers[i + 1:] if other[1] <= level), len(html))
+                text = html[start:end]
+        return '<api><parse title="{}" revid="1"><text xml:space="preserve">{}</text></parse></api>'.format(
+            escape(title), escape(text))
+
+    def search(self, query):
+        word = query.get('search', '')
+        if word in self.pages:
+            return self.search_pages['article_exists']
+        if any(word.endswith(suffix) and word[:-len(suffix)] in self.pages
+               for suffix in SUGGESTION_SUFFIXES):
+            return self.search_pages['multiple_suggestions']
+        return self.search_pages['no_result']
+
+    def respond(self, path, query):
+        """Returns (status, headers, body) for the request"""
+        failure = self._admit()
+        if failure is not None:
+            return failure
+        self._delay()
+        if path.endswith('/w/api.php'):
+            action = query.get('action')
+            self.count(action)
+            if action == 'query':
+                return 200, {'Content-Type': 'text/xml'}, self.query(query).encode('utf-8')
+            if action == 'parse':
+                return 200, {'Content-Type': 'text/xml'}, self.parse(query).encode('utf-8')
+        elif path.endswith('/wiki/Special:Search'):
+            self.count('search')
+            return 200, {'Content-Type': 'text/html'}, self.search(query)
+        self.count('unknown')
+        return 404, {}, b'Not found'
+
+    def handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                query = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+                status, headers, body = mock.respond(url.path, query)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+        return Handler
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        description='Serve the fixture pages like en.wiktionary.org does')
+    argparser.add_argument('--host', default='127.0.0.1')
+    argparser.add_argument('-p', '--port', type=int, default=8090)
+    argparser.add_argument('--latency', type=float, default=0.0,
+                           help='Seconds added to every response')
+    argparser.add_argument('--jitter', type=float, default=0.0,
+                           help='Random seconds added on top of the latency')
+    argparser.add_argument('--error-rate', type=float, default=0.0,
+                           help='Fraction of the requests failing with HTTP 503')
+    argparser.add_argument('--max-rate', type=float,
+                           help='Requests per second above which HTTP 429 is returned')
+    args = argparser.parse_args()
+    mock = MockWiktionary(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                          max_rate=args.max_rate).start(args.host, args.port)
+    print('Serving {} pages at {}'.format(len(mock.pages), mock.url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.close()
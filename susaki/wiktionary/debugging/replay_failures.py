@@ -0,0 +1,181 @@
+#############################
+# Parses stored articles again across a process pool, to check parser
+# changes against real pages without asking Wiktionary:
+#   - the failures of the failure store (logs/failures)
+#   - the captured slow lookups (logs/slow)
+#   - the articles of an archive built by archive.py
+#   - a directory of <word>.html or <word>.wikitext files
+# Every article is reported as passed, failed or changed: changed means it
+# parses, but not to the output saved in the baseline of an earlier run.
+#
+#   python replay_failures.py [--archive FILE] [--directory DIR] [-j WORKERS]
+#                             [--save-baseline FILE] [--baseline FILE]
+#############################
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from susaki.definitions import FAILURE_DIR, SLOW_DIR
+from susaki.wiktionary.lookup import is_missing_language
+from susaki.wiktionary.slow_queries import article_file_name, load_captures
+
+ARTICLE_PARSING = 'susaki.wiktionary.wiki_parsing.article_parsing'
+WIKITEXT_PARSING = 'susaki.wiktionary.wiki_parsing.wikitext_parsing'
+PARSERS = {'.html': ARTICLE_PARSING, '.wikitext': WIKITEXT_PARSING}
+
+
+def collect_cases(failure_dir=None, capture_dir=None, archive=None, directory=None,
+                  language='Finnish', parse_tables=False):
+    """
+    Yields the articles to parse as
+    (key, source, word, language, parser module, parse tables, recorded error)
+    where source is ('file', path) or ('archive', archive path, word).
+    """
+    if failure_dir:
+        from susaki.wiktionary.failures import FailureStore
+        for path, failure in FailureStore(failure_dir).failures():
+            yield ('failure:' + os.path.basename(path),
+                   ('file', os.path.join(path, article_file_name(failure['parser']))),
+                   failure['word'], failure['language'], failure['parser'],
+                   failure['parse_tables'], '{}: {}'.format(failure['exception'],
+                                                            failure['message']))
+    if capture_dir:
+        for path, capture in load_captures(capture_dir):
+            yield ('slow:' + os.path.basename(path),
+                   ('file', os.path.join(path, article_file_name(capture['parser']))),
+                   capture['word'], capture['language'], capture['parser'],
+                   capture.get('parse_tables', False), None)
+    if archive:
+        from susaki.wiktionary.archive import ArchiveReader
+        with ArchiveReader(archive) as reader:
+            parser = WIKITEXT_PARSING if reader.article_format == 'wikitext' else ARTICLE_PARSING
+            for word in sorted(reader.words()):
+                yield ('archive:' + word, ('archive', archive, word), word, language, parser,
+                       parse_tables, None)
+    if directory:
+        for file_name in sorted(os.listdir(directory)):
+            word, extension = os.path.splitext(file_name)
+            if extension in PARSERS:
+                yield ('file:' + file_name, ('file', os.path.join(directory, file_name)), word,
+                       language, PARSERS[extension], parse_tables, None)
+
+
+########################################
+# Worker processes
+########################################
+_archives = {}
+
+
+def _read_article(source):
+    if source[0] == 'archive':
+        _, path, word = source
+        if path not in _archives:
+            from susaki.wiktionary.archive import ArchiveReader
+            _archives[path] = ArchiveReader(path)
+        return _archives[path].get(word)
+    with open(source[1], encoding='utf-8') as f:
+        return f.read()
+
+
+def replay_case(case):
+    """
+    Parses the article of the case.
+    Return: (key, output digest or None, error or None, seconds)
+    """
+    from lxml import etree
+    key, source, word, language, parser_name, parse_tables, _ = case
+    start = time.perf_counter()
+    try:
+        raw_article = _read_article(source)
+        parser = importlib.import_module(parser_name)
+    except Exception as err:
+        # The article or the parser of the case is gone, the other cases go on
+        return key, None, '{}: {}'.format(type(err).__name__, err), time.perf_counter() - start
+    start = time.perf_counter()
+    try:
+        article_root = parser.parse_article(raw_article, word, language,
+                                            parse_tables=parse_tables)
+    except Exception as err:
+        if isinstance(err, LookupError) and is_missing_language(err):
+            # The article has no part for the language, that's an output too
+            return key, 'missing: {}'.format(err), None, time.perf_counter() - start
+        return key, None, '{}: {}'.format(type(err).__name__, err), time.perf_counter() - start
+    elapsed = time.perf_counter() - start
+    digest = hashlib.sha1(etree.tostring(article_root)).hexdigest()
+    return key, digest, None, elapsed
+
+
+def outcome(digest, error, baseline):
+    """Returns 'failed', 'changed' (the output differs from the baseline) or 'passed'"""
+    if error is not None:
+        return 'failed'
+    if baseline is not None and baseline != digest:
+        return 'changed'
+    return 'passed'
+
+
+def run(cases, workers=None, baseline=None, chunksize=8):
+    """
+    Parses the cases in a pool of worker processes.
+    baseline: {key: digest or error} saved by an earlier run
+    Return: [(key, outcome, digest, error, recorded error, seconds)]
+    """
+    baseline = baseline or {}
+    cases = list(cases)
+    recorded = {case[0]: case[6] for case in cases}
+    with ProcessPoolExecutor(workers) as executor:
+        results = list(executor.map(replay_case, cases, chunksize=chunksize))
+    return [(key, outcome(digest, error, baseline.get(key)), digest, error, recorded[key],
+             seconds) for key, digest, error, seconds in results]
+
+
+def to_baseline(report):
+    return {key: digest or 'error: ' + error for key, _, digest, error, _, _ in report}
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        description='Parse the stored failures, slow captures and article corpora again')
+    argparser.add_argument('--failures', default=FAILURE_DIR,
+                           help='The failure store (default: %(default)s)')
+    argparser.add_argument('--captures', default=SLOW_DIR,
+                           help='The captured slow lookups (default: %(default)s)')
+    argparser.add_argument('--archive', help='An article archive built by archive.py')
+    argparser.add_argument('--directory', help='A directory of <word>.html/.wikitext files')
+    argparser.add_argument('-l', '--language', default='Finnish',
+                           help='The language of the archive and directory articles')
+    argparser.add_argument('-t', '--tables', action='store_true',
+                           help='Also parse the inflection tables of the corpus articles')
+    argparser.add_argument('-j', '--workers', type=int, help='Number of processes')
+    argparser.add_argument('--baseline', help='Report the outputs differing from this baseline')
+    argparser.add_argument('--save-baseline', help='Save the outputs of this run as a baseline')
+    argparser.add_argument('-v', '--verbose', action='store_true',
+                           help='List every article, not only the failed and changed ones')
+    args = argparser.parse_args()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    start = time.time()
+    report = run(collect_cases(args.failures, args.captures, args.archive, args.directory,
+                               args.language, args.tables), args.workers, baseline)
+    for key, result, _, error, recorded_error, seconds in report:
+        if args.verbose or result != 'passed' or recorded_error:
+            print('{:<8} {:<50} {:6.3f} s  {}'.format(
+                result, key, seconds, error or ('fixed, was ' + recorded_error
+                                                if recorded_error else '')))
+    counts = Counter(result for _, result, _, _, _, _ in report)
+    fixed = sum(1 for _, result, _, _, recorded_error, _ in report
+                if recorded_error and result != 'failed')
+    print('{} articles in {:.1f} s: {} passed, {} failed, {} changed, {} stored failures fixed'
+          .format(len(report), time.time() - start, counts['passed'], counts['failed'],
+                  counts['changed'], fixed))
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(to_baseline(report), f, ensure_ascii=False, indent=0, sort_keys=True)
@@ -0,0 +1,60 @@
+#############################
+# Measures the start up time of the command line tools: the time taken to
+# import a module in a fresh interpreter, and which of the heavy modules
+# (network and html parsing) it pulled in.
+#
+#   python startup_benchmark.py [-r REPEAT] [module ...]
+#
+# Run with -X importtime to see the cost of every single import.
+#############################
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+from susaki.definitions import ROOT_DIR
+
+EXAMPLES_DIR = os.path.join(ROOT_DIR, 'susaki', 'wiktionary', 'examples')
+HEAVY_MODULES = ('requests', 'bs4', 'lxml')
+DEFAULT_MODULES = ('dictionary', 'translate', 'susaki.wiktionary.lookup')
+
+SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, ','.join(m for m in {heavy!r} if m in sys.modules))
+'''
+
+
+def measure_import(module, repeat=5):
+    """
+    Imports the module in repeat fresh interpreters.
+    Return: (the median import time in seconds, the heavy modules imported)
+    """
+    environment = dict(os.environ)
+    paths = [ROOT_DIR, EXAMPLES_DIR]
+    if environment.get('PYTHONPATH'):
+        paths.append(environment['PYTHONPATH'])
+    environment['PYTHONPATH'] = os.pathsep.join(paths)
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+            env=environment, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        elapsed, heavy = output.split(' ')
+        times.append(float(elapsed))
+    return statistics.median(times), [m for m in heavy.strip().split(',') if m]
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Measure the import time of modules')
+    argparser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    argparser.add_argument('-r', '--repeat', type=int, default=5)
+    args = argparser.parse_args()
+    for module in args.modules:
+        elapsed, heavy = measure_import(module, args.repeat)
+        print('{:<30} {:8.1f} ms   heavy modules: {}'.format(
+            module, elapsed * 1000, ', '.join(heavy) or '-'))
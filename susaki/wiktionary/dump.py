@@ -0,0 +1,256 @@
+"""
+Random access to the articles of a Wiktionary multistream dump.
+
+A multistream dump (enwiktionary-...-pages-articles-multistream.xml.bz2) is a
+series of independent bz2 streams of about 100 pages each. The index file
+which comes with it (...-multistream-index.txt.bz2) has one line per page:
+    <offset of the stream>:<page id>:<title>
+The index is turned once into a title map: the titles sorted by their
+UTF-8 bytes together with the offsets of their streams, in a binary file
+which is opened with mmap and searched with bisection. A lookup then only
+decompresses the one stream which contains the page.
+
+The dump contains the raw wikitext, so the articles are parsed with
+wikitext_parsing.
+"""
+import bz2
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from xml.etree import ElementTree
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SUSAKIT1'
+HEADER = struct.Struct('<8sQ')
+OFFSET = struct.Struct('<Q')
+MAX_REDIRECTS = 2
+
+
+class DumpError(Exception):
+    pass
+
+
+########################################
+# Title map
+########################################
+def read_index(index_path):
+    """Yields (title, stream offset) for every line of a (bz2 compressed) index"""
+    opener = bz2.open if index_path.endswith('.bz2') else open
+    with opener(index_path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            offset, _, title = line.rstrip('\n').split(':', 2)
+            yield title, int(offset)
+
+
+def build_title_map(entries, path):
+    """
+    Writes the title map.
+    entries: iterable of (title, stream offset)
+    Layout: header (magic, number of titles), the start of every title in the
+    title blob (number of titles + 1 offsets), the stream offset of every
+    title, the blob of the sorted UTF-8 titles.
+    Return: the number of titles
+    """
+    entries = sorted((title.encode('utf-8'), offset) for title, offset in entries)
+    temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(entries)))
+        start = 0
+        for title, _ in entries:
+            f.write(OFFSET.pack(start))
+            start += len(title)
+        f.write(OFFSET.pack(start))
+        for _, offset in entries:
+            f.write(OFFSET.pack(offset))
+        for title, _ in entries:
+            f.write(title)
+    os.replace(temporary_path, path)
+    logger.info('Wrote a title map of {} titles to {}'.format(len(entries), path))
+    return len(entries)
+
+
+class TitleMap:
+    """The memory-mapped title map, searched with bisection"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise DumpError('{} is empty'.format(path))
+        if len(self._map) < HEADER.size:
+            raise DumpError('{} is not a title map'.format(path))
+        magic, self.count = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise DumpError('{} is not a title map'.format(path))
+        self._starts = HEADER.size
+        self._offsets = self._starts + (self.count + 1) * OFFSET.size
+        self._titles = self._offsets + self.count * OFFSET.size
+
+    def _title(self, i):
+        start, end = struct.unpack_from('<QQ', self._map, self._starts + i * OFFSET.size)
+        return self._map[self._titles + start:self._titles + end]
+
+    def get(self, title):
+        """Returns the offset of the stream containing the title, None if it's missing"""
+        key = title.encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._title(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._title(low) == key:
+            return OFFSET.unpack_from(self._map, self._offsets + low * OFFSET.size)[0]
+        return None
+
+    def __contains__(self, title):
+        return self.get(title) is not None
+
+    def __len__(self):
+        return self.count
+
+    def titles(self):
+        for i in range(self.count):
+            yield self._title(i).decode('utf-8')
+
+    def close(self):
+        self._map.close()
+
+
+def open_title_map(index_path, map_path=None):
+    """
+    Opens the title map of the index, building it first if it's missing or
+    older than the index.
+    map_path: where the map is stored, next to the index by default
+    """
+    map_path = map_path or index_path + '.titles'
+    if not os.path.exists(map_path) or os.path.getmtime(map_path) < os.path.getmtime(index_path):
+        build_title_map(read_index(index_path), map_path)
+    return TitleMap(map_path)
+
+
+########################################
+# Streams
+########################################
+def read_stream(f, offset, chunk_size=256 * 1024):
+    """Decompresses the bz2 stream starting at the offset of the open dump"""
+    f.seek(offset)
+    decompressor = bz2.BZ2Decompressor()
+    parts = []
+    while not decompressor.eof:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            raise DumpError('The stream at {} is truncated'.format(offset))
+        parts.append(decompressor.decompress(chunk))
+    return b''.join(parts)
+
+
+def parse_stream(data):
+    """
+    Returns {title: (wikitext, revision id, redirect target)} for the pages
+    of a decompressed stream.
+    """
+    # The streams are fragments of the <mediawiki> document: a series of
+    # <page> elements, with the closing tag of the document after the last one
+    data = data.strip()
+    if data.endswith(b'</mediawiki>'):
+        data = data[:-len(b'</mediawiki>')]
+    try:
+        root = ElementTree.fromstring(b'<pages>' + data + b'</pages>')
+    except ElementTree.ParseError as err:
+        raise DumpError('Invalid stream: {}'.format(err))
+    pages = {}
+    for page in root.iter('page'):
+        redirect = page.find('redirect')
+        revision = page.find('revision')
+        revision_id = revision.findtext('id')
+        pages[page.findtext('title')] = (
+            revision.findtext('text') or '', int(revision_id) if revision_id else None,
+            redirect.get('title') if redirect is not None else None)
+    return pages
+
+
+########################################
+# Connector
+########################################
+class DumpConnector:
+    """
+    Collects the articles from a multistream dump instead of Wiktionary.
+    The pages of the last few streams read are kept, as words looked up
+    together are often close in the dump.
+    dump_path: the ...-pages-articles-multistream.xml.bz2 file
+    index_path: the ...-multistream-index.txt(.bz2) file
+    """
+
+    def __init__(self, dump_path, index_path, map_path=None, cached_streams=4):
+        logger.debug('Initializing DumpConnector for {}'.format(dump_path))
+        self.dump_path = dump_path
+        self.titles = open_title_map(index_path, map_path)
+        self.cached_streams = cached_streams
+        self._streams = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pages(self, offset):
+        with self._lock:
+            pages = self._streams.get(offset)
+            if pages is not None:
+                self._streams.move_to_end(offset)
+                return pages
+        with open(self.dump_path, 'rb') as f:
+            pages = parse_stream(read_stream(f, offset))
+        with self._lock:
+            self._streams[offset] = pages
+            while len(self._streams) > self.cached_streams:
+                self._streams.popitem(last=False)
+        return pages
+
+    def collect_revision(self, word):
+        """Returns (wikitext, revision id), following redirects like the API does"""
+        title = word
+        for _ in range(MAX_REDIRECTS + 1):
+            offset = self.titles.get(title)
+            if offset is None:
+                raise LookupError('The word "{}" is not in the dump'.format(title))
+            try:
+                text, revision_id, redirect = self._pages(offset)[title]
+            except KeyError:
+                raise DumpError('"{}" is missing from the stream at {}'.format(title, offset))
+            if redirect is None:
+                return text, revision_id
+            logger.debug('Following the redirect from "{}" to "{}"'.format(title, redirect))
+            title = redirect
+        raise LookupError('Too many redirects for "{}"'.format(word))
+
+    def collect_raw_article(self, word):
+        logger.debug('Collecting the raw article for "{}" from the dump'.format(word))
+        return self.collect_revision(word)[0]
+
+    @property
+    def parser(self):
+        """The parsing module for the articles of the dump"""
+        from susaki.wiktionary.wiki_parsing import wikitext_parsing
+        return wikitext_parsing
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(
+        description='Print the wikitext of words from a multistream dump')
+    argparser.add_argument('dump', help='The ...-pages-articles-multistream.xml.bz2 file')
+    argparser.add_argument('index', help='The ...-multistream-index.txt.bz2 file')
+    argparser.add_argument('words', nargs='+')
+    args = argparser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    connector = DumpConnector(args.dump, args.index)
+    for word in args.words:
+        try:
+            print(connector.collect_raw_article(word))
+        except LookupError as err:
+            print(err)
@@ -1,18 +1,32 @@
 import argparse
 from collections import defaultdict
-from susaki.wiktionary.connectors import HTMLConnector, APIConnector
-from susaki.wiktionary.wiki_parsing import article_parsing
 import re
 from examplelogging import setup_logging
+from susaki.definitions import SNAPSHOT_PATH
+from susaki.wiktionary.snapshot import HotCache
 
 
 class Wiktionary:
+    """
+    Only the standard library is imported at start up. Words found in the
+    snapshot of the hot cache are answered without loading the network and
+    parsing modules.
+    prefetch: look up the words referenced by an answer in the background
+        while the user reads it
+    slow_threshold: lookups taking longer (in seconds) are captured in
+        SLOW_DIR for replaying them later, None to turn it off
+    """
 
-    def __init__(self, language, debugging=False):
+    def __init__(self, language, debugging=False, snapshot_path=SNAPSHOT_PATH, prefetch=True,
+                 slow_threshold=None):
         self.language = language
         self._setup_command_dict()
-        self.api_connector = APIConnector()
-        self.html_connector = HTMLConnector(language)
+        self._lookup = None
+        self._prefetcher = None
+        self.prefetch = prefetch
+        self.slow_threshold = slow_threshold
+        self.snapshot_path = snapshot_path
+        self.hot_cache = HotCache.load(snapshot_path) if snapshot_path else HotCache()
         self.logger = setup_logging(debugging)
         self.logger.info('Initialized Wiktionary class')
 
@@ -37,26 +51,40 @@ class Wiktionary:
         # self.logger.info('Changedlanguage from {} to {}'.format(old_language, new_language))
         return True
 
-    def print_information(self, article_root):
-        language_part = article_root.find('Languages').find(self.language)
-        pos_parts = language_part.find('POS-parts')
-        for pos in pos_parts:
-            print('\n   {}'.format(pos.tag))
-            translations = pos.find('Translations')
-            for translation in translations:
+    @property
+    def lookup(self):
+        """
+        The network and parsing modules are only imported on the first
+        lookup which isn't answered by the snapshot.
+        """
+        if self._lookup is None:
+            from susaki.wiktionary.lookup import Lookup
+            slow_recorder = None
+            if self.slow_threshold:
+                from susaki.wiktionary.slow_queries import SlowQueryRecorder
+                slow_recorder = SlowQueryRecorder(threshold=self.slow_threshold)
+            from susaki.wiktionary.failures import FailureStore
+            self._lookup = Lookup.with_suggestions(self.language, slow_recorder=slow_recorder,
+                                                   failure_store=FailureStore())
+        return self._lookup
+
+    @property
+    def prefetcher(self):
+        if self._prefetcher is None:
+            from susaki.wiktionary.prefetch import Prefetcher
+            self._prefetcher = Prefetcher(self.lookup)
+        return self._prefetcher
+
+    def print_information(self, pos_list):
+        for pos in pos_list:
+            print('\n   {}'.format(pos['pos']))
+            for translation in pos['translations']:
                 print('')
-                text = translation.find('Text')
-                print('      - ' + text.text)
-                examples = translation.find('Examples')
-                try:
-                    for example in examples:
-                        print('        * ' + example.find('Text').text)
-                        try:
-                            print('          ' + example.find('Translation').text)
-                        except AttributeError:
-                            pass
-                except TypeError:
-                    pass
+                print('      - ' + translation['text'])
+                for example in translation['examples']:
+                    print('        * ' + example['text'])
+                    if example['translation']:
+                        print('          ' + example['translation'])
 
     def process_user_query(self, word):
         self.logger.info('Collecting article for {}'.format(word))
@@ -64,48 +92,45 @@ class Wiktionary:
             return True
         word = word.strip()
         word = word.lower()
-        try:
-            raw_article = self.api_connector.collect_raw_article(word)
-            self.logger.info('Found raw article using the API')
-        except LookupError:
-            self.logger.debug('Lookup error while getting article from api')
+        if self._prefetcher is not None:
+            self._prefetcher.cancel()
+        result = self.hot_cache.get(word, self.language)
+        if result is None:
+            from susaki.wiktionary.throttling import TransientError
             try:
-                req = self.html_connector.collect_raw_article(word)
-                if type(req) is list:
-                    self.logger.info('No article found but suggestions exist')
-                    print(
-                        '"{}" does not have its own article, however it does exist in the articles for the following words:'.format(word))
-                    for suggestion in req:
-                        print(''.join(['  ', suggestion]))
-                    return True
-                else:
-                    self.logger.info('No articles exists containing "{}"'.format(word))
-                    raise LookupError(
-                        'The word "{}" does not exist on Wiktionary'.format(word))
-
-            except LookupError as error:
-                if 'does not exist on Wiktionary' in str(error):
-                    self.logger.info('No article exist for {}'.format(word))
-                    print(str(error).replace("'", ""))
-                    return True
-                else:
-                    raise
-        try:
-            article = article_parsing.parse_article(
-                raw_article, word, self.language, parse_tables=False)
-            self.logger.info('Parsing of article succeeded')
-        except LookupError as err:
-            if 'No explanations exists for the language:' in str(err):
-                message = '"{}" does not exist as a word in the {} - English dictionary'.format(word, self.language)
-                self.logger.info(message)
-                print(message)
+                result = self.lookup.lookup(word, self.language)
+            except TransientError as error:
+                self.logger.info('Failed to collect the article for {}: {}'.format(word, error))
+                print('Wiktionary could not be reached at the moment, please try again later')
                 return True
-            else:
-                raise
-        self.print_information(article)
-
+            self.hot_cache.put(word, self.language, result)
+        else:
+            self.logger.info('Found the article in the snapshot')
+        self.print_result(result)
+        if self.prefetch:
+            self.prefetcher.prefetch(
+                result, skip=lambda word: (word, self.language) in self.hot_cache)
         return True
 
+    def print_result(self, result):
+        word = result['word']
+        if result['status'] == 'suggestions':
+            self.logger.info('No article found but suggestions exist')
+            print(
+                '"{}" does not have its own article, however it does exist in the articles for the following words:'.format(word))
+            for suggestion in result['suggestions']:
+                print(''.join(['  ', suggestion]))
+        elif result['status'] == 'missing':
+            message = '"{}" does not exist as a word in the {} - English dictionary'.format(word, self.language)
+            self.logger.info(message)
+            print(message)
+        else:
+            self.print_information(result['pos'])
+
+    def save_snapshot(self):
+        if self.snapshot_path and self.hot_cache.changed:
+            self.hot_cache.save(self.snapshot_path)
+
     def greet_user(self, command):
         stop_word = [
             word for word in self.command_dict if self.command_dict[word] == self._stop]
@@ -133,17 +158,31 @@ class Wiktionary:
     def run(self):
         self.greet_user('')
         status = True
-        while status:
-            command = input('>> ')
-            try:
-                status = self.command_dict[command](command)
-            except Exception:
-                self.logger.error(
-                    'Failed to process the following command: "{}"'.format(command),
-                    exc_info=True)
-                print('An error occured while processing the command "{}"'.format(command))
-            else:
-                print()
+        try:
+            while status:
+                command = input('>> ')
+                try:
+                    status = self.command_dict[command](command)
+                except Exception:
+                    self.logger.error(
+                        'Failed to process the following command: "{}"'.format(command),
+                        exc_info=True)
+                    print('An error occured while processing the command "{}"'.format(command))
+                else:
+                    print()
+        finally:
+            if self._prefetcher is not None:
+                self._prefetcher.close()
+            self.save_snapshot()
+
+    def run_once(self, words):
+        """Looks up the words and returns, for use from scripts"""
+        self.prefetch = False
+        try:
+            for word in words:
+                self.process_user_query(word)
+        finally:
+            self.save_snapshot()
 
 
 if __name__ == '__main__':
@@ -155,7 +194,23 @@ if __name__ == '__main__':
     parser.add_argument(
         "-d", "--debug", help="Set to True if you want debug output", default=False
     )
+    parser.add_argument(
+        "-s", "--snapshot", help="The snapshot of the hot cache", default=SNAPSHOT_PATH)
+    parser.add_argument(
+        "--no-snapshot", help="Don't load or save the snapshot", action='store_true')
+    parser.add_argument(
+        "--no-prefetch", help="Don't look up referenced words in the background",
+        action='store_true')
+    parser.add_argument(
+        "--slow-threshold", type=float,
+        help="Capture lookups whose parsing takes longer than this many seconds in logs/slow")
+    parser.add_argument(
+        "words", nargs='*', help="Look up these words and exit instead of starting the dictionary")
     args = parser.parse_args()
     language = args.language
-    wiktionary = Wiktionary(language, args.debug)
-    wiktionary.run()
+    wiktionary = Wiktionary(language, args.debug, None if args.no_snapshot else args.snapshot,
+                            not args.no_prefetch, args.slow_threshold)
+    if args.words:
+        wiktionary.run_once(args.words)
+    else:
+        wiktionary.run()
@@ -17,7 +17,7 @@ def setup_logging(debugging=False):
 
     os.makedirs(QUERY_DIR, exist_ok=True)
     querry_handler = TimedRotatingFileHandler(
-        filename=os.path.join(QUERY_DIR, 'queries'), when='midnight')
+        filename=os.path.join(QUERY_DIR, 'queries'), when='midnight', delay=True)
     querry_handler.setLevel(logging.INFO)
 
     querry_handler.addFilter(query_filter)
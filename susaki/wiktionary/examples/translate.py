@@ -1,81 +1,207 @@
 #!/home/simon/anaconda3/envs/SuSaKi/bin/python
-from susaki.wiktionary.connectors import APIConnector
-from susaki.wiktionary.wiki_parsing import article_parsing
 import time
 import argparse
 from examplelogging import setup_logging
 import logging
+from susaki.definitions import LIST_SNAPSHOT_PATH
+from susaki.wiktionary.snapshot import HotCache
 
 
 class ListTranslator():
+    """
+    The connector, parser and Lookup are created (and their modules imported)
+    on the first word which isn't in the snapshot of the hot cache.
+    The words are looked up as bulk requests, so the list only takes the rate
+    which the interactive lookups of this process leave over.
+    existence_filter: optional path of the existence filter (see existence.py)
+    """
 
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, wikitext=False, archive=None,
+                 snapshot_path=LIST_SNAPSHOT_PATH, dump=None, dump_index=None, sections=False,
+                 existence_filter=None):
         self.setup_logging(debug)
-        self.connector = APIConnector()
+        self.wikitext = wikitext
+        self.sections = sections
+        self.archive = archive
+        self.dump = dump
+        self.dump_index = dump_index
+        self.existence_filter = existence_filter
+        self._connector = None
+        self._lookup = None
+        self.snapshot_path = snapshot_path
+        self.hot_cache = (HotCache.load(snapshot_path, mode=self.mode) if snapshot_path
+                          else HotCache(mode=self.mode))
+
+    @property
+    def mode(self):
+        """Where the articles come from and how they are parsed, keys the snapshot"""
+        if self.archive:
+            return 'archive'
+        if self.dump:
+            return 'dump'
+        if self.sections:
+            return 'sections'
+        return 'wikitext' if self.wikitext else 'api'
+
+    def _create_connector(self):
+        if self.archive:
+            from susaki.wiktionary.archive import ArchiveConnector
+            self._connector = ArchiveConnector(self.archive)
+            self._parser = self._connector.parser
+        elif self.dump:
+            from susaki.wiktionary.dump import DumpConnector
+            self._connector = DumpConnector(self.dump, self.dump_index)
+            self._parser = self._connector.parser
+        elif self.sections:
+            from susaki.wiktionary.connectors import SectionConnector
+            from susaki.wiktionary.wiki_parsing import article_parsing
+            self._connector = SectionConnector('Finnish')
+            self._parser = article_parsing
+        elif self.wikitext:
+            from susaki.wiktionary.connectors import WikitextConnector
+            from susaki.wiktionary.wiki_parsing import wikitext_parsing
+            self._connector = WikitextConnector()
+            self._parser = wikitext_parsing
+        else:
+            from susaki.wiktionary.connectors import APIConnector
+            from susaki.wiktionary.wiki_parsing import article_parsing
+            self._connector = APIConnector()
+            self._parser = article_parsing
+
+    @property
+    def connector(self):
+        if self._connector is None:
+            self._create_connector()
+        return self._connector
+
+    @property
+    def parser(self):
+        if self._connector is None:
+            self._create_connector()
+        return self._parser
+
+    @property
+    def lookup(self):
+        if self._lookup is None:
+            from susaki.wiktionary.failures import FailureStore
+            from susaki.wiktionary.lookup import Lookup
+            existence_filter = None
+            if self.existence_filter:
+                from susaki.wiktionary.existence import load_filter
+                existence_filter = load_filter(self.existence_filter)
+            self._lookup = Lookup(self.connector, self.parser, existence_filter=existence_filter,
+                                  failure_store=FailureStore())
+        return self._lookup
 
     def setup_logging(self, debug):
-        self.logger = setup_logging(args.debug)
+        self.logger = setup_logging(debug)
         info_handler = logging.StreamHandler()
         info_handler.addFilter(logging.Filter('root'))
         self.logger.addHandler(info_handler)
 
-    def collect_raw_article(self, word):
-        word = word.lower()
+    def translate_word(self, word):
+        """
+        Returns the translations of the word, None if they are unknown.
+        A TransientError is raised if Wiktionary couldn't be reached.
+        """
+        result = self.hot_cache.get(word, 'Finnish')
+        if result is not None:
+            self.logger.debug('Found the article in the snapshot')
+            return [translation['text'] for pos in result['pos']
+                    for translation in pos['translations']] or None
+        from susaki.wiktionary.lookup import FOUND
+        from susaki.wiktionary.throttling import BULK, TransientError, priority
         try:
-            raw_article = self.connector.collect_raw_article(word)
-            return raw_article
-        except:
+            # The Lookup skips the inflection tables, only the translations are written
+            with priority(BULK):
+                result = self.lookup.lookup(word, 'Finnish')
+        except TransientError:
+            raise
+        except Exception as err:
+            # The Lookup kept the article in the failure store
+            self.logger.info("Error while parsing article. Ignoring")
+            self.logger.debug(str(err))
+            return None
+        self.hot_cache.put(word, 'Finnish', result)
+        if result['status'] != FOUND:
+            self.logger.info('No article exists')
             return None
+        self.logger.debug('Article exists')
+        return [translation['text'] for pos in result['pos']
+                for translation in pos['translations']]
 
-    def collect_translations(self, article_root):
-        translation_list = []
-        language_part = article_root.find('Languages').find('Finnish')
-        pos_parts = language_part.find('POS-parts')
-        self.logger.debug('Number of POS-parts: {}'.format(len(pos_parts)))
-        for pos in pos_parts:
-            # print('\n   {}'.format(pos.tag))
-            translations = pos.find('Translations')
-            self.logger.debug('Number of translations-parts: {}'.format(len(translations)))
-            for translation in translations:
-                text = translation.find('Text')
-                text = text.text
-                translation_list.append(text)
-        return translation_list
-
-    def translate(self, file_path):
+    def translate(self, file_path, workers=4):
+        """
+        Translates the words of the file, one per line. The words are looked
+        up by a pipeline of workers (see pipeline.py); the translations are
+        written in the order of the words, holding no more of them than the
+        pipeline has in flight.
+        """
+        from collections import deque
+        from susaki.wiktionary.pipeline import Pipeline, Stage
         start_time = time.time()
         self.logger.info('Starting translation of words in the file {}'.format(file_path))
         self.logger.debug('Opening source file {}'.format(file_path))
         with open(file_path) as source_file:
             self.logger.debug('Opening target file {}'.format(file_path))
             with open(file_path + '_translated', 'w') as target_file:
+                pipeline = Pipeline([Stage('translate', self.translate_word, workers)])
+                pending = deque()
                 for line in source_file:
                     line = line.replace('\n', '')
                     if line != '':
                         self.logger.info('Collecting article for {}'.format(line))
-                        raw_article = self.collect_raw_article(line)
-                        if raw_article:
-                            self.logger.debug('Article exists')
-                            try:
-                                xml_root = article_parsing.parse_article(
-                                    raw_article, line, 'Finnish')
-                                translations = self.collect_translations(xml_root)
-                            except Exception as err:
-                                self.logger.info("Error while parsing article. Ignoring")
-                                self.logger.debug(str(err))
-                                translations = None
-                        else:
-                            self.logger.info('No article exists')
-                            translations = None
-                        if translations:
-                            target_file.write(
-                                '{}\t{}\n'.format(line, ' | '.join(translations)))
-                        else:
-                            target_file.write('{}\t[UNKNOWN]\n'.format(line))
+                        pending.append((line, pipeline.submit(line)))
+                    while pending and (pending[0][1].done() or
+                                       len(pending) > pipeline.capacity()):
+                        self.write_translations(target_file, *pending.popleft())
+                pipeline.close()
+                while pending:
+                    self.write_translations(target_file, *pending.popleft())
 
+        if self.snapshot_path and self.hot_cache.changed:
+            self.hot_cache.save(self.snapshot_path)
         self.logger.info('Finished translating the words in the file. Took {:d} seconds.'.format(int(
             time.time() - start_time)))
 
+    def write_translations(self, target_file, word, future):
+        from susaki.wiktionary.throttling import TransientError
+        try:
+            translations = future.result()
+        except TransientError as err:
+            self.logger.warning('Failed to collect the article: {}'.format(err))
+            target_file.write('{}\t[FAILED]\n'.format(word))
+            return
+        if translations:
+            target_file.write('{}\t{}\n'.format(word, ' | '.join(translations)))
+        else:
+            target_file.write('{}\t[UNKNOWN]\n'.format(word))
+
+    def translate_text(self, file_path, output_format='glossary', workers=8):
+        """
+        Translates running text: every distinct lemma of the text is looked
+        up once, the inflected forms are mapped to it with the inflection tables.
+        output_format: 'glossary' (one line per lemma) or 'annotated' (the text
+        with the lemma and translation after every word)
+        """
+        from susaki.wiktionary.text_translation import TextTranslator
+        start_time = time.time()
+        self.logger.info('Starting translation of the text in the file {}'.format(file_path))
+        with open(file_path) as source_file:
+            text = source_file.read()
+        translator = TextTranslator(self.lookup, 'Finnish', workers, hot_cache=self.hot_cache)
+        translation = translator.translate(text)
+        with open('{}_{}'.format(file_path, output_format), 'w') as target_file:
+            if output_format == 'annotated':
+                target_file.write(translation.annotate(text))
+            else:
+                translation.write_glossary(target_file)
+        if self.snapshot_path and self.hot_cache.changed:
+            self.hot_cache.save(self.snapshot_path)
+        self.logger.info('Finished translating the text with {} lookups. Took {:d} seconds.'.format(
+            translator.fetched, int(time.time() - start_time)))
+
+
 if __name__ == '__main__':
     # Parse arguments
     argparser = argparse.ArgumentParser(
@@ -84,7 +210,40 @@ if __name__ == '__main__':
     argparser.add_argument(
         "-d", "--debug", help="Set to true if you want debug output", default=False
     )
+    argparser.add_argument(
+        "-w", "--wikitext", help="Collect and parse the raw wikitext instead of the rendered html",
+        action='store_true')
+    argparser.add_argument(
+        "-s", "--sections", help="Only fetch the Finnish section instead of the whole article",
+        action='store_true')
+    argparser.add_argument(
+        "-a", "--archive", help="Collect the articles from a local archive instead of Wiktionary")
+    argparser.add_argument(
+        "--dump", help="Collect the articles from a multistream dump instead of Wiktionary")
+    argparser.add_argument("--dump-index", help="The index of the multistream dump")
+    argparser.add_argument(
+        "-e", "--existence-filter",
+        help="Words which aren't in the filter (see existence.py) are missing without a request")
+    argparser.add_argument(
+        "--no-snapshot", help="Don't load or save the snapshot of the hot cache",
+        action='store_true')
+    argparser.add_argument(
+        "-t", "--text", help="The file contains running text instead of a list of words",
+        action='store_true')
+    argparser.add_argument(
+        "-f", "--format", choices=['glossary', 'annotated'], default='glossary',
+        help="Output of the text mode (default: %(default)s)")
+    argparser.add_argument(
+        "--workers", type=int, default=8, help="Number of concurrent lookups")
     args = argparser.parse_args()
+    if args.dump and not args.dump_index:
+        argparser.error('--dump needs --dump-index')
     file_path = args.file
-    translator = ListTranslator(debug=args.debug)
-    translator.translate(file_path)
+    translator = ListTranslator(debug=args.debug, wikitext=args.wikitext, archive=args.archive,
+                                snapshot_path=None if args.no_snapshot else LIST_SNAPSHOT_PATH,
+                                dump=args.dump, dump_index=args.dump_index,
+                                sections=args.sections, existence_filter=args.existence_filter)
+    if args.text:
+        translator.translate_text(file_path, args.format, args.workers)
+    else:
+        translator.translate(file_path, args.workers)
@@ -0,0 +1,144 @@
+"""
+Local filters telling which words can't have a Wiktionary page.
+
+Most words without a page cost an API request and a search page request
+before the lookup knows they are missing. A filter built from the list of
+titles answers that locally: a word which isn't in the filter definitely
+has no page, and only the other words reach the network.
+
+Two kinds of filters can be used, both with `word in filter`:
+    BloomFilter: a few bits per title, with a tunable false positive rate
+    dump.TitleMap: the exact sorted title set of a multistream index
+load_filter opens either from a file.
+"""
+import bz2
+import gzip
+import hashlib
+import math
+import mmap
+import re
+import struct
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SUSAKIB1'
+HEADER = struct.Struct('<8sQQB')
+INDEX_LINE = re.compile(r'^\d+:\d+:')
+
+
+def _hashes(title):
+    """Two independent 64 bit hashes of the title, combined into k hashes by double hashing"""
+    digest = hashlib.blake2b(title.encode('utf-8'), digest_size=16).digest()
+    return struct.unpack('<QQ', digest)
+
+
+class BloomFilter:
+    """
+    num_bits: size of the filter
+    num_hashes: bits set per title
+    Use BloomFilter.for_capacity to size the filter for a number of titles
+    and a false positive rate.
+    """
+
+    def __init__(self, num_bits, num_hashes, bits=None, count=0):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((num_bits + 7) // 8)
+        self.count = count
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return cls(num_bits, num_hashes)
+
+    @classmethod
+    def from_titles(cls, titles, error_rate=0.01):
+        titles = titles if isinstance(titles, (list, set)) else list(titles)
+        bloom_filter = cls.for_capacity(len(titles), error_rate)
+        for title in titles:
+            bloom_filter.add(title)
+        return bloom_filter
+
+    def _positions(self, title):
+        first, second = _hashes(title)
+        for i in range(self.num_hashes):
+            yield (first + i * second) % self.num_bits
+
+    def add(self, title):
+        for position in self._positions(title):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, title):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(title))
+
+    def __len__(self):
+        return self.count
+
+    def error_rate(self):
+        """The expected false positive rate for the titles added so far"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.num_bits, self.count, self.num_hashes))
+            f.write(self.bits)
+
+    @classmethod
+    def load(cls, path):
+        """Opens a saved filter with mmap, so worker processes share its pages"""
+        with open(path, 'rb') as f:
+            bits = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, num_bits, count, num_hashes = HEADER.unpack_from(bits)
+        if magic != MAGIC:
+            raise ValueError('{} is not a Bloom filter'.format(path))
+        return cls(num_bits, num_hashes, memoryview(bits)[HEADER.size:], count)
+
+
+def read_titles(path):
+    """
+    Yields the titles of a titles list (all-titles-in-ns0, with underscores
+    for spaces) or of a multistream index (offset:id:title lines). Both may
+    be gzip or bz2 compressed.
+    """
+    opener = {'.gz': gzip.open, '.bz2': bz2.open}.get(path[path.rfind('.'):], open)
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if INDEX_LINE.match(line):
+                yield line.split(':', 2)[2]
+            elif line and line != 'page_title':
+                yield line.replace('_', ' ')
+
+
+def load_filter(path):
+    """Opens a saved BloomFilter or a title map built by dump.py"""
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+    if magic == MAGIC:
+        return BloomFilter.load(path)
+    from susaki.wiktionary.dump import TitleMap
+    return TitleMap(path)
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(
+        description='Build a Bloom filter of the Wiktionary titles from a titles list '
+                    '(all-titles-in-ns0.gz) or a multistream index')
+    argparser.add_argument('titles', help='The titles list or the index')
+    argparser.add_argument('target', help='Path of the filter to write')
+    argparser.add_argument('-e', '--error-rate', type=float, default=0.01,
+                           help='False positive rate (default: %(default)s)')
+    args = argparser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    bloom_filter = BloomFilter.from_titles(set(read_titles(args.titles)), args.error_rate)
+    bloom_filter.save(args.target)
+    print('Wrote a filter of {} titles, {} bytes, {} hashes, to {}'.format(
+        len(bloom_filter), len(bloom_filter.bits), bloom_filter.num_hashes, args.target))
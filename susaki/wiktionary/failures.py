@@ -0,0 +1,106 @@
+"""
+Store of the articles the parser failed on.
+
+Every failure is saved as a directory in FAILURE_DIR holding the raw
+article and a failure.json with the word, the language, the parser, the
+version of the parser and the exception with its traceback. The same
+article failing again with the same parser version is only stored once.
+
+debugging/replay_failures.py parses the stored articles again, so parser
+fixes can be checked against the real pages without asking Wiktionary.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import traceback
+
+import logging
+
+from susaki.definitions import FAILURE_DIR
+from susaki.wiktionary.slow_queries import article_file_name
+
+logger = logging.getLogger(__name__)
+
+FAILURE_FILE = 'failure.json'
+PARSING_DIR = os.path.join(os.path.dirname(__file__), 'wiki_parsing')
+
+_parser_version = None
+
+
+def parser_version():
+    """A hash of the sources of the parsing modules, changing with every parser change"""
+    global _parser_version
+    if _parser_version is None:
+        digest = hashlib.sha1()
+        for file_name in sorted(os.listdir(PARSING_DIR)):
+            if file_name.endswith('.py'):
+                with open(os.path.join(PARSING_DIR, file_name), 'rb') as f:
+                    digest.update(file_name.encode('utf-8') + b'\0' + f.read())
+        _parser_version = digest.hexdigest()[:12]
+    return _parser_version
+
+
+class FailureStore:
+    """
+    directory: where the failures are stored
+    """
+
+    def __init__(self, directory=FAILURE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def save(self, word, language, raw_article, error, parser, parse_tables=False):
+        """
+        Stores the failure of parser.parse_article on the article.
+        error: the exception raised, with its traceback
+        Return: the directory of the failure, None if it couldn't be written
+        """
+        version = parser_version()
+        key = hashlib.sha1('\0'.join(
+            [parser.__name__, version, language, raw_article]).encode('utf-8')).hexdigest()[:16]
+        path = os.path.join(self.directory, key)
+        failure = {
+            'word': word,
+            'language': language,
+            'parser': parser.__name__,
+            'parser_version': version,
+            'parse_tables': parse_tables,
+            'exception': type(error).__name__,
+            'message': str(error),
+            'traceback': ''.join(traceback.format_exception(type(error), error,
+                                                            error.__traceback__)),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        try:
+            with self._lock:
+                if os.path.exists(os.path.join(path, FAILURE_FILE)):
+                    return path
+                os.makedirs(path, exist_ok=True)
+                with open(os.path.join(path, article_file_name(parser.__name__)), 'w',
+                          encoding='utf-8') as f:
+                    f.write(raw_article)
+                # Written last, so a failure with a failure.json is complete
+                with open(os.path.join(path, FAILURE_FILE), 'w', encoding='utf-8') as f:
+                    json.dump(failure, f, ensure_ascii=False, indent=2)
+        except OSError as err:
+            logger.warning('Failed to store the failure of "{}": {}'.format(word, err))
+            return None
+        logger.info('Stored the failure of "{}" in {}'.format(word, path))
+        return path
+
+    def failures(self):
+        """Yields (path, failure) for every stored failure"""
+        if not os.path.isdir(self.directory):
+            return
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            try:
+                with open(os.path.join(path, FAILURE_FILE), encoding='utf-8') as f:
+                    yield path, json.load(f)
+            except (OSError, ValueError) as err:
+                logger.debug('Skipping {}: {}'.format(path, err))
+
+    def __len__(self):
+        return sum(1 for _ in self.failures())
@@ -0,0 +1,442 @@
+"""
+Shared lookup layer used by long running front ends (e.g. service.py).
+
+A Lookup owns the connectors and two caches: one for the raw articles and
+one for the parsed results. Keeping a single Lookup alive for the lifetime
+of a process lets all requests share the connection pool and the warm
+caches. The results are plain dictionaries so they can be serialised to
+JSON directly.
+
+Concurrent lookups of the same word and language are coalesced: only the
+first one fetches and parses the article, the others wait for its result.
+This works for threads (lookup) as well as for coroutines (lookup_async).
+
+A Lookup is thread-safe: the connectors and parsers keep no state, and the
+caches are locked. LookupExecutor runs the lookups of one shared Lookup on
+a pool of threads.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+
+import requests
+
+from susaki.wiktionary.connectors import APIConnector, HTMLConnector
+from susaki.wiktionary.throttling import INTERACTIVE, current_priority, running_priority
+from susaki.wiktionary.wiki_parsing import article_parsing
+
+logger = logging.getLogger(__name__)
+
+FOUND = 'found'
+MISSING = 'missing'
+SUGGESTIONS = 'suggestions'
+MISSING_LANGUAGE = 'No explanations exists for the language:'
+
+
+def is_missing_language(err):
+    """True if the parser error means the article has no part for the language"""
+    return isinstance(err, LookupError) and MISSING_LANGUAGE in str(err)
+
+
+def normalize(word):
+    """The form of the word used for fetching and as cache key"""
+    return word.strip().lower()
+
+
+class LRUCache:
+    """A thread-safe least recently used cache with hit and miss counters"""
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._entries.pop(key, default)
+
+    def keys(self):
+        """Returns a snapshot of the keys"""
+        with self._lock:
+            return list(self._entries)
+
+    def peek(self, key, default=None):
+        """Returns the value without counting a hit or miss or refreshing the entry"""
+        with self._lock:
+            return self._entries.get(key, default)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'size': len(self), 'max_size': self.max_size,
+                'hits': self.hits, 'misses': self.misses}
+
+
+########################################
+# Request coalescing
+########################################
+class _Call:
+    __slots__ = ['done', 'result', 'error', 'priority']
+
+    def __init__(self, priority):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.priority = priority
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Threads asking for a key which
+    is already in flight wait for that call and share its result (or error).
+    A thread of a higher priority class (see throttling.py) joining the call
+    of a bulk one promotes it, so it doesn't wait at the bulk priority.
+    """
+
+    def __init__(self):
+        self.shared = 0
+        self.promoted = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call(running_priority())
+            else:
+                self.shared += 1
+                if call.priority is not None and call.priority.promote(current_priority()):
+                    self.promoted += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function(*args)
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    The asyncio version of SingleFlight. function must return an awaitable.
+    The call runs as its own task, so cancelling one of the waiting
+    coroutines doesn't cancel the call for the others.
+    A coroutine only joins a call of the same or a higher priority class; a
+    more urgent one starts its own call, which the later callers then join.
+    """
+
+    def __init__(self):
+        self.shared = 0
+        self._tasks = {}
+
+    async def do(self, key, function, *args, level=INTERACTIVE):
+        entry = self._tasks.get(key)
+        if entry is not None and entry[1] <= level:
+            task = entry[0]
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(function(*args))
+            self._tasks[key] = (task, level)
+            task.add_done_callback(lambda done: self._remove(key, done))
+        return await asyncio.shield(task)
+
+    def _remove(self, key, task):
+        if self._tasks.get(key, (None,))[0] is task:
+            del self._tasks[key]
+
+    def in_flight(self):
+        return len(self._tasks)
+
+
+########################################
+# Result conversion
+########################################
+def article_to_dict(article_root, language):
+    """
+    Converts the parsed article to a dictionary of the form
+    [{'pos': 'Noun', 'translations': [{'text': ..., 'examples': [...]}]}]
+    """
+    language_part = article_root.find('Languages').find(language)
+    pos_list = []
+    for pos in language_part.find('POS-parts'):
+        translations = []
+        for translation in pos.find('Translations'):
+            examples = []
+            for example in translation.iter('Example'):
+                examples.append({'text': example.findtext('Text'),
+                                 'translation': example.findtext('Translation')})
+            translations.append({'text': translation.findtext('Text'), 'examples': examples})
+        pos_list.append({'pos': pos.tag.replace('_', ' '), 'translations': translations})
+    return pos_list
+
+
+def create_result(word, language, status, pos=None, suggestions=None):
+    return {'word': word, 'language': language, 'status': status,
+            'pos': pos or [], 'suggestions': suggestions or []}
+
+
+########################################
+# Lookup
+########################################
+class Lookup:
+    """
+    connector: connector used to collect the raw articles (an APIConnector
+        sharing the session by default)
+    parser: the parsing module matching the connector (article_parsing or
+        wikitext_parsing)
+    suggestion_connector: optional connector asked for suggestions when
+        the word has no article of its own (an HTMLConnector)
+    existence_filter: optional filter of the titles on Wiktionary (see
+        existence.py). Words which aren't in it are missing without asking
+        any connector.
+    slow_recorder: optional slow_queries.SlowQueryRecorder, given the raw
+        article and the stage timings of every lookup which fetched one
+    failure_store: optional failures.FailureStore keeping the articles the
+        parser failed on
+    A connector of a single language (a SectionConnector) only collects the
+    articles of its language, the words of other languages are collected as
+    whole articles by its full_connector.
+    """
+
+    def __init__(self, connector=None, parser=article_parsing, suggestion_connector=None,
+                 cache_size=1024, session=None, existence_filter=None, slow_recorder=None,
+                 failure_store=None):
+        self.session = session or requests.Session()
+        self.connector = connector or APIConnector(session=self.session)
+        self.parser = parser
+        self.suggestion_connector = suggestion_connector
+        self.raw_articles = LRUCache(cache_size)
+        self.results = LRUCache(cache_size)
+        self.flights = SingleFlight()
+        self.async_flights = AsyncSingleFlight()
+        self.existence_filter = existence_filter
+        self.filtered = 0
+        self.slow_recorder = slow_recorder
+        self.failure_store = failure_store
+        self._full_connector = None
+
+    @classmethod
+    def with_suggestions(cls, language='Finnish', **kwargs):
+        """Creates a Lookup which falls back to the search page for suggestions"""
+        session = kwargs.pop('session', None) or requests.Session()
+        suggestion_connector = HTMLConnector(language, session=session)
+        return cls(suggestion_connector=suggestion_connector, session=session, **kwargs)
+
+    def lookup(self, word, language='Finnish'):
+        """
+        Returns the result dictionary for the word. The status is one of
+        'found', 'missing' and 'suggestions'.
+        Errors other than a missing article or language are raised.
+        """
+        word = normalize(word)
+        key = (word, language)
+        result = self.results.get(key)
+        if result is not None:
+            logger.debug('Result cache hit for "{}"'.format(word))
+            return result
+        return self.flights.do(key, self._lookup_and_cache, word, language)
+
+    async def lookup_async(self, word, language='Finnish', executor=None):
+        """
+        Same as lookup, but runs the blocking lookup in the executor (the
+        default executor of the loop if None).
+        """
+        word = normalize(word)
+        key = (word, language)
+        result = self.results.get(key)
+        if result is not None:
+            logger.debug('Result cache hit for "{}"'.format(word))
+            return result
+        loop = asyncio.get_running_loop()
+        return await self.async_flights.do(
+            key, loop.run_in_executor, executor, self.flights.do, key,
+            self._lookup_and_cache, word, language,
+            level=getattr(executor, 'priority', current_priority()))
+
+    def _lookup_and_cache(self, word, language):
+        key = (word, language)
+        # Another call may have finished between the cache check and the start of this one
+        result = self.results.peek(key)
+        if result is None:
+            result = self._lookup(word, language)
+            self.results.put(key, result)
+        return result
+
+    def _lookup(self, word, language):
+        start = time.perf_counter()
+        raw_article, result = self.fetch(word, language)
+        if raw_article is None:
+            return result
+        timings = [('fetch', time.perf_counter() - start)]
+        result = self.convert(word, language, raw_article, timings)
+        if self.slow_recorder is not None:
+            self.slow_recorder.check(word, language, raw_article, self.parser, timings)
+        return result
+
+    def fetch(self, word, language='Finnish'):
+        """
+        The first stage of a lookup (without the caches of the results and
+        the coalescing): collects the raw article of the normalized word.
+        Return: (raw article, None), or (None, the result) if the word has
+            no article
+        """
+        if self.existence_filter is not None and word not in self.existence_filter:
+            logger.debug('"{}" is not in the existence filter'.format(word))
+            self.filtered += 1
+            return None, create_result(word, language, MISSING)
+        try:
+            return self.collect_raw_article(word, language), None
+        except LookupError:
+            return None, self._missing_article(word, language)
+
+    def convert(self, word, language, raw_article, timings=None):
+        """
+        The second stage of a lookup: parses the raw article into the result.
+        Errors other than a missing language are raised, the articles the
+        parser failed on are kept in the failure store.
+        timings: optional list the parse and convert times are appended to
+        """
+        start = time.perf_counter()
+        try:
+            article_root = self.parser.parse_article(
+                raw_article, word, language, parse_tables=False)
+        except Exception as err:
+            if not (isinstance(err, LookupError) and is_missing_language(err)):
+                # Parser complaints like 'No POS-parts present' are failures too
+                if self.failure_store is not None:
+                    self.failure_store.save(word, language, raw_article, err, self.parser)
+                raise
+            logger.info('"{}" has no {} part'.format(word, language))
+            result = create_result(word, language, MISSING)
+            parsed = time.perf_counter()
+        else:
+            parsed = time.perf_counter()
+            result = create_result(word, language, FOUND, article_to_dict(article_root, language))
+        if timings is not None:
+            timings += [('parse', parsed - start), ('convert', time.perf_counter() - parsed)]
+        return result
+
+    def collect_raw_article(self, word, language=None):
+        """The raw article of the word holding the language, the connector's if None"""
+        connector, source = self._connector_for(language)
+        key = (word, source)
+        raw_article = self.raw_articles.get(key)
+        if raw_article is None:
+            raw_article = connector.collect_raw_article(word)
+            self.raw_articles.put(key, raw_article)
+        return raw_article
+
+    def _connector_for(self, language):
+        """
+        Returns (connector, the language of its articles, None for whole articles)
+        collecting the articles for the language
+        """
+        if not hasattr(self.connector, 'full_connector'):
+            return self.connector, None
+        if language is None or language == self.connector.language:
+            return self.connector, self.connector.language
+        if self._full_connector is None:
+            self._full_connector = self.connector.full_connector()
+        return self._full_connector, None
+
+    def _missing_article(self, word, language):
+        if self.suggestion_connector is None:
+            return create_result(word, language, MISSING)
+        try:
+            suggestions = self.suggestion_connector.collect_raw_article(word)
+        except LookupError:
+            return create_result(word, language, MISSING)
+        if type(suggestions) is list:
+            return create_result(word, language, SUGGESTIONS, suggestions=suggestions)
+        return create_result(word, language, MISSING)
+
+    def invalidate(self, word):
+        """Drops the cached article and results of the word, e.g. after it was edited"""
+        word = normalize(word)
+        for key in self.raw_articles.keys():
+            if key[0] == word:
+                self.raw_articles.pop(key)
+        for key in self.results.keys():
+            if key[0] == word:
+                self.results.pop(key)
+
+    def lookup_many(self, words, language='Finnish'):
+        return [self.lookup(word, language) for word in words]
+
+    def stats(self):
+        return {'raw_articles': self.raw_articles.stats(), 'results': self.results.stats(),
+                'coalesced': self.flights.shared + self.async_flights.shared,
+                'promoted': self.flights.promoted,
+                'filtered': self.filtered}
+
+
+class LookupExecutor:
+    """
+    Runs lookups on a pool of threads which all share the one Lookup, its
+    connection pool and its caches.
+    """
+
+    def __init__(self, lookup, max_workers=8):
+        self.lookup = lookup
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='lookup')
+
+    def submit(self, word, language='Finnish'):
+        """Returns a concurrent.futures.Future of the result"""
+        return self.executor.submit(self.lookup.lookup, word, language)
+
+    def map(self, words, language='Finnish'):
+        """Looks up the words concurrently and returns the results in order"""
+        futures = [self.submit(word, language) for word in words]
+        return [future.result() for future in futures]
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
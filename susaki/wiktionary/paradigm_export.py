@@ -0,0 +1,198 @@
+"""
+Export of inflection tables in a columnar layout.
+
+The tables created by table_parsing are gathered across many articles into
+fixed-shape string arrays with one row per lemma and one column per
+paradigm slot. The arrays are written as .npy files (or as an Arrow IPC file)
+which can be memory-mapped, so all forms of a single slot can be scanned
+without walking any xml trees.
+"""
+import os
+
+import logging
+
+from susaki.wiktionary.wiki_parsing import article_parsing
+from susaki.wiktionary.wiki_parsing.paradigm_slots import (
+    NOUN_SLOTS, VERB_SLOTS, PARADIGM_SLOTS, MISSING_FORM)
+
+logger = logging.getLogger(__name__)
+
+
+########################################
+# Paradigm collection
+########################################
+def flatten_inflection_table(inflection_root):
+    """
+    Flattens an inflection table created by table_parsing into a dictionary
+    mapping slot paths (e.g. 'inessive/plural') to word forms.
+    """
+    table_element = inflection_root.find('table')
+    if table_element is None:
+        return {}
+    forms = {}
+    for element in table_element.iter():
+        if len(element) > 0 or element is table_element:
+            continue
+        path = [element.tag]
+        for ancestor in element.iterancestors():
+            if ancestor is table_element:
+                break
+            path.append(ancestor.tag)
+        forms['/'.join(reversed(path))] = element.text
+    return forms
+
+
+def paradigm_family(forms):
+    """Returns the name of the slot family the flattened table belongs to"""
+    if 'nominal_forms/infinitives/first' in forms:
+        return 'verb'
+    if 'accusative/genitive' in forms:
+        return 'noun'
+    return None
+
+
+def extract_paradigms(article_root):
+    """
+    Yields (lemma, family, forms) for every inflection table in the
+    parsed article.
+    """
+    word = article_root.find('Word').text
+    for inflection_root in article_root.iter('Inflection_Table'):
+        forms = flatten_inflection_table(inflection_root)
+        family = paradigm_family(forms)
+        if family is None:
+            logger.debug('Skipping table of unknown shape for "{}"'.format(word))
+            continue
+        lemma = inflection_root.findtext('meta/word') or word
+        yield lemma, family, forms
+
+
+class ParadigmCollector:
+    """
+    Gathers the paradigms of many articles, one row per lemma and family.
+    A lemma seen a second time is ignored, so an article containing several
+    identical tables (e.g. kuu) only adds one row.
+    """
+
+    def __init__(self):
+        self.lemmas = {family: [] for family in PARADIGM_SLOTS}
+        self.rows = {family: [] for family in PARADIGM_SLOTS}
+        self._seen = set()
+
+    def add_article(self, article_root):
+        for lemma, family, forms in extract_paradigms(article_root):
+            if (lemma, family) in self._seen:
+                continue
+            self._seen.add((lemma, family))
+            slots = PARADIGM_SLOTS[family]
+            self.lemmas[family].append(lemma)
+            self.rows[family].append(
+                [forms.get(slot) or MISSING_FORM for slot in slots])
+
+    def add_raw_article(self, raw_article, word, language='Finnish'):
+        article_root = article_parsing.parse_article(raw_article, word, language)
+        self.add_article(article_root)
+
+    def to_arrays(self, family):
+        """
+        Returns (lemmas, slots, forms) as numpy arrays of fixed-width strings.
+        forms has the shape (number of lemmas, number of slots).
+        """
+        import numpy as np
+        slots = PARADIGM_SLOTS[family]
+        lemmas = np.array(self.lemmas[family], dtype=str)
+        if self.rows[family]:
+            forms = np.array(self.rows[family], dtype=str)
+        else:
+            forms = np.empty((0, len(slots)), dtype=str)
+        return lemmas, np.array(slots, dtype=str), forms
+
+
+########################################
+# Writers
+########################################
+def write_npy(collector, directory):
+    """
+    Writes <family>_lemmas.npy, <family>_slots.npy and <family>_forms.npy
+    for every family. Open the forms with numpy.load(path, mmap_mode='r').
+    """
+    import numpy as np
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    for family in PARADIGM_SLOTS:
+        arrays = zip(['lemmas', 'slots', 'forms'], collector.to_arrays(family))
+        for name, array in arrays:
+            path = os.path.join(directory, '{}_{}.npy'.format(family, name))
+            np.save(path, array)
+            written.append(path)
+        logger.info('Wrote {} {} paradigms to {}'.format(
+            len(collector.lemmas[family]), family, directory))
+    return written
+
+
+def write_arrow(collector, directory):
+    """
+    Writes one uncompressed Arrow IPC file per family with a 'lemma' column
+    and one column per slot. Open it with pyarrow.ipc.open_file on a
+    pyarrow.memory_map to avoid reading it into memory.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError('pyarrow is needed to write Arrow files')
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    for family, slots in PARADIGM_SLOTS.items():
+        columns = [pa.array(collector.lemmas[family], type=pa.string())]
+        for i in range(len(slots)):
+            column = [row[i] for row in collector.rows[family]]
+            columns.append(pa.array(column, type=pa.string()))
+        table = pa.Table.from_arrays(columns, names=['lemma'] + list(slots))
+        path = os.path.join(directory, '{}.arrow'.format(family))
+        with pa.OSFile(path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        written.append(path)
+    return written
+
+
+WRITERS = {
+    'npy': write_npy,
+    'arrow': write_arrow,
+}
+
+
+def export_paradigms(articles, directory, file_format='npy', language='Finnish'):
+    """
+    articles: iterable of (word, raw_article) pairs
+    Parses every article and writes the collected paradigms to directory.
+    Articles that can't be parsed are skipped.
+    """
+    collector = ParadigmCollector()
+    for word, raw_article in articles:
+        try:
+            collector.add_raw_article(raw_article, word, language)
+        except Exception as err:
+            logger.info('Skipping "{}": {}'.format(word, err))
+    return WRITERS[file_format](collector, directory)
+
+
+def _read_article_directory(directory):
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.endswith('.html'):
+            word = os.path.splitext(file_name)[0]
+            with open(os.path.join(directory, file_name)) as f:
+                yield word, f.read()
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(
+        description='Export the inflection tables of a directory of raw articles '
+                    '(one <word>.html file per article) as memory-mappable arrays')
+    argparser.add_argument('source', help='Directory containing the raw articles')
+    argparser.add_argument('target', help='Directory to write the arrays to')
+    argparser.add_argument('-f', '--format', choices=sorted(WRITERS), default='npy')
+    args = argparser.parse_args()
+    for path in export_paradigms(_read_article_directory(args.source), args.target, args.format):
+        print(path)
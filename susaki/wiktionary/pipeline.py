@@ -0,0 +1,268 @@
+"""
+Staged fetch, parse and write pipeline with bounded queues.
+
+Every stage has its own worker threads and a bounded input queue. A stage
+whose queue is full blocks the stage before it, down to the producer, so
+no more than the sum of the queue sizes and worker counts of all stages
+are in flight at any time, however many words are put in: a slow parser
+throttles the fetching instead of letting the raw articles pile up, and a
+slow writer throttles both. A pipeline created with shed=True refuses new
+items with an OverloadError instead of blocking the producer.
+
+lookup_pipeline builds the pipeline of the batch runs: the fetch stage
+collects the raw articles, the parse stage turns them into result
+dictionaries (so the raw html and the soups are freed there) and the
+write stage serialises the results. The first two are the stages of a
+Lookup (Lookup.fetch and Lookup.convert), so a batch run answers a word
+the way a single lookup does.
+"""
+import json
+import queue
+import threading
+from concurrent.futures import Future
+
+import logging
+
+from susaki.wiktionary.throttling import OverloadError
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class Stage:
+    """
+    name: name of the stage in the logs and stats
+    function: called with every item, returns the item for the next stage
+    workers: number of threads running the function
+    queue_size: number of items which may wait for the stage
+    """
+
+    def __init__(self, name, function, workers=1, queue_size=16):
+        if workers < 1 or queue_size < 1:
+            raise ValueError('A stage needs at least one worker and one queue slot')
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.queue = queue.Queue(queue_size)
+        self.processed = 0
+        self.failed = 0
+        self._running = workers
+        self._lock = threading.Lock()
+
+
+class Pipeline:
+    """
+    stages: the Stages, in order. The output of the last one is the result
+        of the item.
+    shed: refuse items with an OverloadError when the first queue is full,
+        instead of blocking
+    """
+
+    def __init__(self, stages, shed=False):
+        self.stages = stages
+        self.shed = shed
+        self.submitted = 0
+        self.rejected = 0
+        self._closed = False
+        self._threads = []
+        for index, stage in enumerate(stages):
+            for i in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(index,), daemon=True,
+                                          name='{}-{}'.format(stage.name, i))
+                thread.start()
+                self._threads.append(thread)
+
+    def capacity(self):
+        """The maximum number of items in flight"""
+        return sum(stage.queue.maxsize + stage.workers for stage in self.stages)
+
+    def submit(self, item, timeout=None):
+        """
+        Puts the item into the pipeline, waiting for room in the first queue.
+        With shed=True, or if timeout seconds pass, an OverloadError is raised
+        instead of waiting.
+        Return: a concurrent.futures.Future of the output of the last stage
+        """
+        if self._closed:
+            raise RuntimeError('The pipeline is closed')
+        future = Future()
+        try:
+            self.stages[0].queue.put((future, item), block=not self.shed, timeout=timeout)
+        except queue.Full:
+            self.rejected += 1
+            raise OverloadError('The pipeline is full ({} items in flight)'.format(
+                self.capacity()))
+        self.submitted += 1
+        return future
+
+    def run(self, items):
+        """
+        Feeds the items through the pipeline, waiting whenever it's full, and
+        closes it.
+        Return: the stats
+        """
+        for item in items:
+            future = self.submit(item)
+            future.add_done_callback(_log_failure)
+        self.close()
+        return self.stats()
+
+    def _work(self, index):
+        stage = self.stages[index]
+        next_queue = self.stages[index + 1].queue if index + 1 < len(self.stages) else None
+        while True:
+            entry = stage.queue.get()
+            if entry is _STOP:
+                break
+            future, item = entry
+            try:
+                output = stage.function(item)
+            except Exception as err:
+                with stage._lock:
+                    stage.failed += 1
+                future.set_exception(err)
+                continue
+            with stage._lock:
+                stage.processed += 1
+            if next_queue is None:
+                future.set_result(output)
+            else:
+                # Blocks while the next stage is behind: the backpressure
+                next_queue.put((future, output))
+        with stage._lock:
+            stage._running -= 1
+            last = stage._running == 0
+        if last and next_queue is not None:
+            # The next stage stops once everything before it has gone through
+            for _ in range(self.stages[index + 1].workers):
+                next_queue.put(_STOP)
+
+    def close(self, wait=True):
+        """Lets the queued items through and stops the workers"""
+        if not self._closed:
+            self._closed = True
+            for _ in range(self.stages[0].workers):
+                self.stages[0].queue.put(_STOP)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def stats(self):
+        return {'submitted': self.submitted, 'rejected': self.rejected,
+                'stages': {stage.name: {'queued': stage.queue.qsize(),
+                                        'processed': stage.processed,
+                                        'failed': stage.failed}
+                           for stage in self.stages}}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.info('Item failed: {}'.format(future.exception()))
+
+
+########################################
+# Fetch, parse and write
+########################################
+def lookup_pipeline(lookup, write, language='Finnish', fetch_workers=4,
+                    parse_workers=2, queue_size=16, shed=False):
+    """
+    Builds the pipeline turning words into results.
+    lookup: the Lookup fetching and parsing the articles. Its caches are
+        bypassed except for the raw articles, so give it cache_size=0 to keep
+        the memory bounded.
+    write: called with every result dictionary (see lookup.create_result) by
+        a single thread, e.g. to append it to a file
+    The output of an item is the status of its result. Items the parser
+    failed on fail like a single lookup would.
+    """
+    from susaki.wiktionary.lookup import normalize
+
+    def fetch(word):
+        word = normalize(word)
+        raw_article, result = lookup.fetch(word, language)
+        return word, raw_article, result
+
+    def parse(fetched):
+        word, raw_article, result = fetched
+        if raw_article is None:
+            return result
+        return lookup.convert(word, language, raw_article)
+
+    def write_result(result):
+        write(result)
+        return result['status']
+
+    return Pipeline([Stage('fetch', fetch, fetch_workers, queue_size),
+                     Stage('parse', parse, parse_workers, queue_size),
+                     Stage('write', write_result, 1, queue_size)], shed)
+
+
+def write_json_lines(f):
+    """Returns a write function for lookup_pipeline appending the results to f"""
+    def write(result):
+        f.write(json.dumps(result, ensure_ascii=False) + '\n')
+    return write
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    argparser = argparse.ArgumentParser(
+        description='Look up a list of words (one per line) and write the results as JSON lines, '
+                    'with bounded memory for any number of words')
+    argparser.add_argument('words', help='File with one word per line')
+    argparser.add_argument('target', help='The JSON lines file to write')
+    argparser.add_argument('-l', '--language', default='Finnish')
+    argparser.add_argument('-w', '--wikitext', action='store_true',
+                           help='Collect and parse the raw wikitext instead of the rendered html')
+    argparser.add_argument('-a', '--archive', help='Collect the articles from a local archive')
+    argparser.add_argument('-e', '--existence-filter',
+                           help='Words missing from this filter of the titles are missing '
+                                'without a request (see existence.py)')
+    argparser.add_argument('--store-failures', action='store_true',
+                           help='Keep the articles the parser fails on in logs/failures')
+    argparser.add_argument('--fetch-workers', type=int, default=4)
+    argparser.add_argument('--parse-workers', type=int, default=2)
+    argparser.add_argument('--queue-size', type=int, default=16,
+                           help='Number of items waiting between two stages')
+    args = argparser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.archive:
+        from susaki.wiktionary.archive import ArchiveConnector
+        connector = ArchiveConnector(args.archive)
+        parser = connector.parser
+    elif args.wikitext:
+        from susaki.wiktionary.connectors import WikitextConnector
+        from susaki.wiktionary.wiki_parsing import wikitext_parsing
+        connector, parser = WikitextConnector(), wikitext_parsing
+    else:
+        from susaki.wiktionary.connectors import APIConnector
+        from susaki.wiktionary.wiki_parsing import article_parsing
+        connector, parser = APIConnector(), article_parsing
+    from susaki.wiktionary.lookup import Lookup
+    existence_filter = None
+    if args.existence_filter:
+        from susaki.wiktionary.existence import load_filter
+        existence_filter = load_filter(args.existence_filter)
+    failure_store = None
+    if args.store_failures:
+        from susaki.wiktionary.failures import FailureStore
+        failure_store = FailureStore()
+    lookup = Lookup(connector, parser, cache_size=0, existence_filter=existence_filter,
+                    failure_store=failure_store)
+    start = time.time()
+    with open(args.words, encoding='utf-8') as source, \
+            open(args.target, 'w', encoding='utf-8') as target:
+        words = (line.strip() for line in source if line.strip())
+        pipeline = lookup_pipeline(lookup, write_json_lines(target), args.language,
+                                   args.fetch_workers, args.parse_workers, args.queue_size)
+        stats = pipeline.run(words)
+    print(json.dumps(stats, indent=2))
+    print('Took {:.1f} seconds'.format(time.time() - start))
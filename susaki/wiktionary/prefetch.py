@@ -0,0 +1,104 @@
+"""
+Speculative lookups of the words a user is likely to look up next.
+
+After a result is shown, the words it points to are looked up in a small
+worker pool while the user is reading:
+    - the entries of a suggestion list
+    - the lemmas of inflected forms ("Inessive singular form of kuu.")
+    - soft redirects ("Alternative form of ...", "See ..."); hard
+      redirects are already followed by the API
+The lookups go through the Lookup, so their results land in its caches and
+a user asking for a word which is still being prefetched waits for that
+lookup instead of starting another one. They are bulk requests for the rate
+limiter, so they never delay a word the user asked for; the user joining a
+prefetch promotes it to an interactive request (see throttling.Priority).
+"""
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+
+from susaki.wiktionary.throttling import BULK, priority
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_PATTERNS = [
+    re.compile(r'\b(?:form|spelling|plural|singular|participle|infinitive|comparative|'
+               r'superlative|synonym|abbreviation|contraction) of ([^\s.,;:()]+)', re.IGNORECASE),
+    re.compile(r'^see ([^\s.,;:()]+)', re.IGNORECASE),
+]
+
+
+def referenced_words(result, max_words=8):
+    """Returns the words the result points to, most likely first"""
+    words = list(result['suggestions'])
+    for pos in result['pos']:
+        for translation in pos['translations']:
+            for pattern in REFERENCE_PATTERNS:
+                words.extend(pattern.findall(translation['text']))
+    unique = []
+    for word in words:
+        word = word.strip().lower()
+        if word and word != result['word'] and word not in unique:
+            unique.append(word)
+    return unique[:max_words]
+
+
+class Prefetcher:
+    """
+    lookup: the Lookup filling the caches
+    max_workers: number of concurrent speculative lookups
+    Only the prefetches of the latest result are kept: prefetch and cancel
+    drop the ones which haven't started yet.
+    """
+
+    def __init__(self, lookup, max_workers=2, max_words=8):
+        self.lookup = lookup
+        self.max_words = max_words
+        self.submitted = 0
+        self.failed = 0
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='prefetch')
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def prefetch(self, result, skip=None):
+        """
+        Starts looking up the words referenced by the result.
+        skip: optional predicate for words which are known already
+        Return: the words which are prefetched
+        """
+        self.cancel()
+        language = result['language']
+        words = [word for word in referenced_words(result, self.max_words)
+                 if (word, language) not in self.lookup.results
+                 and not (skip and skip(word))]
+        with self._lock:
+            for word in words:
+                logger.debug('Prefetching "{}"'.format(word))
+                self._pending.append(self._executor.submit(self._lookup, word, language))
+            self.submitted += len(words)
+        return words
+
+    def _lookup(self, word, language):
+        try:
+            with priority(BULK):
+                self.lookup.lookup(word, language)
+        except Exception as err:
+            # Not worth reporting, the user may never ask for the word
+            self.failed += 1
+            logger.debug('Prefetching "{}" failed: {}'.format(word, err))
+
+    def cancel(self):
+        """Drops the prefetches which haven't started yet"""
+        with self._lock:
+            for future in self._pending:
+                future.cancel()
+            self._pending = [future for future in self._pending if not future.done()]
+
+    def close(self, wait=False):
+        self.cancel()
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        return {'submitted': self.submitted, 'failed': self.failed}
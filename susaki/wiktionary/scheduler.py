@@ -0,0 +1,212 @@
+"""
+Scheduling of interactive and bulk lookups on one shared worker pool.
+
+Interactive lookups (a user waiting for a single word) and bulk lookups
+(word lists, batches, prefetching) share the threads of a LookupScheduler
+and the rate budget of the connectors:
+    - an idle worker always takes the oldest interactive lookup first
+    - the bulk lookups are queued per job and the jobs take turns, so a job
+      of ten words isn't stuck behind one of ten thousand
+    - reserved_workers threads never run bulk lookups, so an interactive
+      lookup doesn't wait for a worker to finish a bulk one
+    - the lookups run with their priority class set (see throttling.py), so
+      the bulk ones only use the part of the rate no interactive request is
+      waiting for
+    - with max_queued set, lookups beyond that many queued ones are refused
+      with an OverloadError instead of piling up. The bulk lookups have a
+      queue limit of their own, so a large batch never gets an interactive
+      lookup refused
+"""
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import logging
+
+from susaki.wiktionary.lookup import normalize
+from susaki.wiktionary.throttling import BULK, INTERACTIVE, OverloadError, priority
+
+logger = logging.getLogger(__name__)
+
+
+class _Task:
+
+    __slots__ = ('future', 'function', 'args', 'priority', 'job')
+
+    def __init__(self, function, args, priority, job):
+        self.future = Future()
+        self.function = function
+        self.args = args
+        self.priority = priority
+        self.job = job
+
+
+class ScheduledExecutor:
+    """
+    Submits callables to the scheduler with a fixed priority and job, e.g. as
+    the executor of Lookup.lookup_async.
+    """
+
+    def __init__(self, scheduler, priority, job):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.job = job
+
+    def submit(self, function, *args):
+        return self.scheduler.run(self.priority, self.job, function, *args)
+
+
+class LookupScheduler:
+    """
+    lookup: the shared Lookup
+    max_workers: number of threads running the lookups
+    reserved_workers: number of threads kept free for the interactive lookups
+    max_queued: number of interactive lookups which may wait for a worker,
+        unlimited if None
+    max_queued_bulk: the same for the bulk lookups, max_queued if None
+    """
+
+    def __init__(self, lookup, max_workers=8, reserved_workers=1, max_queued=None,
+                 max_queued_bulk=None):
+        if not 0 <= reserved_workers < max_workers:
+            raise ValueError('reserved_workers must leave at least one worker for bulk lookups')
+        self.lookup = lookup
+        self.max_workers = max_workers
+        self.bulk_workers = max_workers - reserved_workers
+        self.max_queued = max_queued
+        self.max_queued_bulk = max_queued if max_queued_bulk is None else max_queued_bulk
+        self.rejected = 0
+        self._queued = {INTERACTIVE: 0, BULK: 0}
+        self.completed = {INTERACTIVE: 0, BULK: 0}
+        self._interactive = deque()
+        self._jobs = OrderedDict()
+        self._running_bulk = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._threads = [threading.Thread(target=self._work, name='scheduler-{}'.format(i),
+                                          daemon=True)
+                         for i in range(max_workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def run(self, priority, job, function, *args):
+        """
+        Schedules function(*args).
+        priority: INTERACTIVE or BULK
+        job: key of the bulk job the call belongs to, the jobs share the bulk
+            workers fairly
+        Return: a concurrent.futures.Future of the result
+        """
+        task = _Task(function, args, priority, job)
+        level = INTERACTIVE if priority == INTERACTIVE else BULK
+        max_queued = self.max_queued if level == INTERACTIVE else self.max_queued_bulk
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('The scheduler is shut down')
+            if max_queued is not None and self._queued[level] >= max_queued:
+                self.rejected += 1
+                raise OverloadError('{} {} lookups are queued already'.format(
+                    self._queued[level], 'interactive' if level == INTERACTIVE else 'bulk'))
+            self._queued[level] += 1
+            if priority == INTERACTIVE:
+                self._interactive.append(task)
+            else:
+                self._jobs.setdefault(job, deque()).append(task)
+            self._condition.notify()
+        return task.future
+
+    def submit(self, word, language='Finnish', priority=INTERACTIVE, job=None):
+        """Returns a Future of the result of the lookup, completed at once if it's cached"""
+        result = self.lookup.results.get((normalize(word), language))
+        if result is not None:
+            future = Future()
+            future.set_result(result)
+            return future
+        return self.run(priority, job, self.lookup.lookup, word, language)
+
+    def map(self, words, language='Finnish', priority=BULK, job=None):
+        """Looks up the words as one job and returns the results in order"""
+        job = job if job is not None else object()
+        futures = [self.submit(word, language, priority, job) for word in words]
+        return [future.result() for future in futures]
+
+    def executor(self, priority=INTERACTIVE, job=None):
+        return ScheduledExecutor(self, priority, job)
+
+    def cancel(self, job):
+        """Drops the queued lookups of the job, the running ones are finished"""
+        with self._condition:
+            tasks = self._jobs.pop(job, ())
+            self._queued[BULK] -= len(tasks)
+        for task in tasks:
+            task.future.cancel()
+        return len(tasks)
+
+    def _next_task(self):
+        """Waits for the next task to run, None once the scheduler is shut down"""
+        with self._condition:
+            while True:
+                if self._interactive:
+                    self._queued[INTERACTIVE] -= 1
+                    return self._interactive.popleft()
+                if self._jobs and self._running_bulk < self.bulk_workers:
+                    # Round robin: the job goes to the back of the line after each task
+                    job, tasks = self._jobs.popitem(last=False)
+                    task = tasks.popleft()
+                    if tasks:
+                        self._jobs[job] = tasks
+                    self._running_bulk += 1
+                    self._queued[BULK] -= 1
+                    return task
+                if self._closed:
+                    return None
+                self._condition.wait()
+
+    def _work(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            result = error = None
+            running = task.future.set_running_or_notify_cancel()
+            if running:
+                with priority(task.priority):
+                    try:
+                        result = task.function(*task.args)
+                    except BaseException as err:
+                        error = err
+            # The counters are updated before the caller gets the result
+            with self._condition:
+                self.completed[task.priority] += int(running)
+                if task.priority != INTERACTIVE:
+                    self._running_bulk -= 1
+                    self._condition.notify()
+            if error is not None:
+                task.future.set_exception(error)
+            elif running:
+                task.future.set_result(result)
+
+    def stats(self):
+        with self._condition:
+            return {'queued': {'interactive': len(self._interactive),
+                               'bulk': sum(len(tasks) for tasks in self._jobs.values())},
+                    'completed': {'interactive': self.completed[INTERACTIVE],
+                                  'bulk': self.completed[BULK]},
+                    'running_bulk': self._running_bulk,
+                    'rejected': self.rejected,
+                    'jobs': len(self._jobs)}
+
+    def shutdown(self, wait=True):
+        """Stops the workers once the queued lookups are done"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
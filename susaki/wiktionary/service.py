@@ -0,0 +1,347 @@
+"""
+HTTP lookup service exposing the dictionary as a JSON API.
+
+The server is built on asyncio streams from the standard library. All
+requests share one Lookup, so the connection pool and the caches stay warm
+for the lifetime of the process. The connectors are blocking, so the
+lookups run on the threads of a LookupScheduler: single lookups are
+interactive and always run next, the words of a batch are a bulk job.
+
+Endpoints:
+    GET  /lookup?word=koira&language=Finnish
+    POST /batch   with the body {"words": ["koira", "kuu"], "language": "Finnish"}
+    GET  /stats   latency, throughput and cache counters
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+
+import logging
+
+from susaki.wiktionary.lookup import Lookup
+from susaki.wiktionary.scheduler import LookupScheduler
+from susaki.wiktionary.throttling import BULK, INTERACTIVE, OverloadError, TransientError
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 500
+MAX_BODY_SIZE = 1024 * 1024
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+########################################
+# Counters
+########################################
+class ServiceStats:
+    """
+    Request and lookup counters. The latency percentiles are computed over
+    the last window_size requests.
+    """
+
+    def __init__(self, window_size=1000):
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.words = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.latencies = deque(maxlen=window_size)
+
+    def record(self, latency, words=0, error=False):
+        self.requests += 1
+        self.words += words
+        self.errors += int(error)
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.latencies.append(latency)
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def to_dict(self):
+        uptime = time.time() - self.started
+        return {
+            'uptime': uptime,
+            'requests': self.requests,
+            'errors': self.errors,
+            'words': self.words,
+            'requests_per_second': self.requests / uptime if uptime else 0.0,
+            'words_per_second': self.words / uptime if uptime else 0.0,
+            'latency': {
+                'mean': self.total_latency / self.requests if self.requests else 0.0,
+                'p50': self.percentile(0.5),
+                'p95': self.percentile(0.95),
+                'p99': self.percentile(0.99),
+                'max': self.max_latency,
+            },
+        }
+
+
+########################################
+# Service
+########################################
+class LookupService:
+    """
+    lookup: the shared Lookup, a new one with suggestions is created if None
+    workers: number of threads running the blocking lookups, one of them only
+        runs single (interactive) lookups
+    max_queued: number of lookups which may wait for a worker. Requests
+        beyond that are answered with 503 at once, so the memory and the
+        latency stay bounded under any load. Unlimited if None.
+    max_queued_bulk: the same for the lookups of the batches, max_queued if None
+    """
+
+    def __init__(self, lookup=None, language='Finnish', workers=8, max_queued=None,
+                 max_queued_bulk=None):
+        self.lookup = lookup or Lookup.with_suggestions(language)
+        self.language = language
+        self.lookups = LookupScheduler(self.lookup, workers, min(1, workers - 1), max_queued,
+                                       max_queued_bulk)
+        self.stats = ServiceStats()
+        self.routes = {
+            ('GET', '/lookup'): self.handle_lookup,
+            ('POST', '/batch'): self.handle_batch,
+            ('GET', '/stats'): self.handle_stats,
+        }
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8080):
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.info('Lookup service listening on {}'.format(
+            ', '.join(str(socket.getsockname()) for socket in self.server.sockets)))
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.lookups.shutdown(wait=False)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as err:
+                    await write_response(writer, err.status, {'error': str(err)}, False)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                status, payload = await self.dispatch(method, target, body)
+                await write_response(writer, status, payload, keep_alive)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            logger.debug('Connection closed by the client')
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target, body):
+        start = time.perf_counter()
+        url = urlsplit(target)
+        words = 0
+        try:
+            try:
+                handler = self.routes[(method, url.path)]
+            except KeyError:
+                if any(path == url.path for _, path in self.routes):
+                    raise HTTPError(405, 'Method {} not allowed for {}'.format(method, url.path))
+                raise HTTPError(404, 'Unknown path {}'.format(url.path))
+            payload, words = await handler(parse_qs(url.query), body)
+            status = 200
+        except HTTPError as err:
+            status, payload = err.status, {'error': str(err)}
+        except OverloadError as err:
+            logger.info('Refused the request "{} {}": {}'.format(method, target, err))
+            status, payload = 503, {'error': str(err)}
+        except TransientError as err:
+            logger.info('Wiktionary could not be reached: {}'.format(err))
+            status, payload = 503, {'error': str(err)}
+        except Exception as err:
+            logger.error('Failed to process the request "{} {}"'.format(method, target),
+                         exc_info=True)
+            status, payload = 500, {'error': str(err)}
+        self.stats.record(time.perf_counter() - start, words, status >= 500)
+        return status, payload
+
+    async def run_lookup(self, word, language, priority=INTERACTIVE, job=None):
+        return await self.lookup.lookup_async(
+            word, language, self.lookups.executor(priority, job))
+
+    async def handle_lookup(self, query, body):
+        try:
+            word = query['word'][0]
+        except KeyError:
+            raise HTTPError(400, 'The parameter "word" is missing')
+        language = query.get('language', [self.language])[0]
+        return await self.run_lookup(word, language), 1
+
+    async def handle_batch(self, query, body):
+        try:
+            request = json.loads(body.decode('utf-8'))
+            words = request['words']
+        except (ValueError, KeyError, TypeError):
+            raise HTTPError(400, 'The body must be a JSON object with a list of "words"')
+        if not isinstance(words, list) or not all(isinstance(word, str) for word in words):
+            raise HTTPError(400, '"words" must be a list of strings')
+        if len(words) > MAX_BATCH_SIZE:
+            raise HTTPError(413, 'At most {} words can be looked up at once'.format(MAX_BATCH_SIZE))
+        language = request.get('language', self.language)
+        job = object()
+        try:
+            results = await asyncio.gather(
+                *(self.run_lookup(word, language, BULK, job) for word in words))
+        except BaseException:
+            # Nobody waits for the rest of the batch any more
+            self.lookups.cancel(job)
+            raise
+        return {'results': results}, len(words)
+
+    async def handle_stats(self, query, body):
+        stats = self.stats.to_dict()
+        stats['caches'] = self.lookup.stats()
+        stats['scheduler'] = self.lookups.stats()
+        return stats, 0
+
+
+########################################
+# HTTP helpers
+########################################
+async def read_request(reader):
+    """
+    Reads a single HTTP/1.1 request.
+    Return: (method, target, headers, body), or None if the connection was closed
+    """
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, target, _ = request_line.decode('latin-1').split()
+    except ValueError:
+        raise HTTPError(400, 'Malformed request line')
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length', 0) or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HTTPError(400, 'Malformed Content-Length')
+    if length > MAX_BODY_SIZE:
+        raise HTTPError(413, 'The request body is too large')
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target, headers, body
+
+
+async def write_response(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = ('HTTP/1.1 {} {}\r\n'
+            'Content-Type: application/json; charset=utf-8\r\n'
+            'Content-Length: {}\r\n'
+            'Connection: {}\r\n\r\n').format(
+        status, REASONS.get(status, ''), len(body), 'keep-alive' if keep_alive else 'close')
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+
+
+async def serve(host, port, service):
+    server = await service.start(host, port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    import argparse
+    import requests
+    from susaki.wiktionary.connectors import (
+        APIConnector, HTMLConnector, SectionConnector, WikitextConnector)
+    from susaki.wiktionary.wiki_parsing import article_parsing, wikitext_parsing
+    from susaki.wiktionary.archive import ArchiveConnector
+    from susaki.wiktionary.dump import DumpConnector
+    from susaki.wiktionary.existence import load_filter
+    from susaki.wiktionary.slow_queries import SlowQueryRecorder
+    from susaki.wiktionary.failures import FailureStore
+    argparser = argparse.ArgumentParser(
+        description='Serve translations from Wiktionary as a JSON API over HTTP')
+    argparser.add_argument('--host', default='127.0.0.1')
+    argparser.add_argument('-p', '--port', type=int, default=8080)
+    argparser.add_argument('-l', '--language', default='Finnish',
+                           help='The default language of the lookups')
+    argparser.add_argument('--workers', type=int, default=8,
+                           help='Number of threads running the lookups')
+    argparser.add_argument('--max-queued', type=int, default=2000,
+                           help='Number of lookups which may wait before requests are refused')
+    argparser.add_argument('--max-queued-bulk', type=int, default=2000,
+                           help='The same for the lookups of the batches, which have their '
+                                'own queue')
+    argparser.add_argument('--cache-size', type=int, default=10000)
+    argparser.add_argument(
+        '-w', '--wikitext', help='Collect and parse the raw wikitext instead of the rendered html',
+        action='store_true')
+    argparser.add_argument(
+        '-s', '--sections', action='store_true',
+        help='Only fetch the section of the language instead of the whole article')
+    argparser.add_argument('-a', '--archive', help='Serve the articles of a local archive')
+    argparser.add_argument('--dump', help='Serve the articles of a multistream dump')
+    argparser.add_argument('--dump-index', help='The index of the multistream dump')
+    argparser.add_argument('-e', '--existence-filter',
+                           help='Answer words missing from this filter of the titles locally '
+                                '(a Bloom filter built by existence.py or a title map)')
+    argparser.add_argument('--slow-threshold', type=float,
+                           help='Capture the lookups whose parsing takes longer than this '
+                                'many seconds in logs/slow')
+    argparser.add_argument('--profile-slow', action='store_true',
+                           help='Save a profile of parsing the article with every capture')
+    argparser.add_argument('--store-failures', action='store_true',
+                           help='Keep the articles the parser fails on in logs/failures')
+    argparser.add_argument('-d', '--debug', action='store_true')
+    args = argparser.parse_args()
+    if args.dump and not args.dump_index:
+        argparser.error('--dump needs --dump-index')
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    session = requests.Session()
+    existence_filter = load_filter(args.existence_filter) if args.existence_filter else None
+    slow_recorder = (SlowQueryRecorder(threshold=args.slow_threshold, profile=args.profile_slow)
+                     if args.slow_threshold is not None else None)
+    failure_store = FailureStore() if args.store_failures else None
+    if args.archive or args.dump:
+        connector = (ArchiveConnector(args.archive) if args.archive
+                     else DumpConnector(args.dump, args.dump_index))
+        lookup = Lookup(connector, connector.parser, cache_size=args.cache_size,
+                        existence_filter=existence_filter, slow_recorder=slow_recorder,
+                        failure_store=failure_store)
+    else:
+        if args.wikitext:
+            connector, parser = WikitextConnector(session=session), wikitext_parsing
+        elif args.sections:
+            connector, parser = SectionConnector(args.language, session=session), article_parsing
+        else:
+            connector, parser = APIConnector(session=session), article_parsing
+        lookup = Lookup(connector, parser, HTMLConnector(args.language, session=session),
+                        args.cache_size, session, existence_filter, slow_recorder,
+                        failure_store)
+    service = LookupService(lookup, args.language, args.workers, args.max_queued,
+                            args.max_queued_bulk)
+    try:
+        asyncio.run(serve(args.host, args.port, service))
+    except KeyboardInterrupt:
+        pass
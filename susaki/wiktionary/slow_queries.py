@@ -0,0 +1,216 @@
+"""
+Capture and replay of slow lookups.
+
+A Lookup given a SlowQueryRecorder times the stages of every lookup
+(fetch, parse, convert). A lookup whose parsing and converting take longer
+than the threshold is saved as a capture (the fetch time mostly measures
+Wiktionary and the rate limiter, not this code): a directory in SLOW_DIR
+(next to the crash and query logs) holding the raw article, a capture.json
+with the word, the parser and the timings, and optionally a cProfile
+snapshot of parsing the article again. The captures are written, and the
+profiles taken, by a background thread, so the lookup (and the callers
+waiting for it) aren't held up.
+
+The captures can be replayed through the parser without any network:
+    python -m susaki.wiktionary.slow_queries [directory] [--profile]
+"""
+import cProfile
+import importlib
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import logging
+
+from susaki.definitions import SLOW_DIR
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_FILE = 'capture.json'
+PROFILE_FILE = 'profile.prof'
+# The stages of a lookup the threshold applies to
+TIMED_STAGES = ('parse', 'convert')
+
+
+def article_file_name(parser_name):
+    return 'article.wikitext' if parser_name.endswith('wikitext_parsing') else 'article.html'
+
+
+########################################
+# Capture
+########################################
+class SlowQueryRecorder:
+    """
+    directory: where the captures are written
+    threshold: lookups whose parse and convert stages take more seconds
+        than this are captured
+    profile: also save a profile of parsing the article again, in the
+        background thread
+    max_captures: number of captures written by this recorder at most, a
+        word is only captured once
+    """
+
+    def __init__(self, directory=SLOW_DIR, threshold=1.0, profile=False, max_captures=100):
+        self.directory = directory
+        self.threshold = threshold
+        self.profile = profile
+        self.max_captures = max_captures
+        self.captured = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='slow-capture')
+        self._pending = []
+
+    def check(self, word, language, raw_article, parser, timings):
+        """
+        Captures the lookup in the background if it was slow.
+        timings: list of (stage, seconds)
+        Return: the directory of the capture, None if it isn't captured
+        """
+        total = sum(seconds for stage, seconds in timings if stage in TIMED_STAGES)
+        if total <= self.threshold:
+            return None
+        with self._lock:
+            if len(self.captured) >= self.max_captures or \
+                    any(capture == (word, language) for capture, _ in self.captured):
+                return None
+            path = os.path.join(self.directory, '{}_{}_{}'.format(
+                time.strftime('%Y%m%d-%H%M%S'), quote(language, safe=''), quote(word, safe='')))
+            self.captured.append(((word, language), path))
+        logger.info('Slow lookup of "{}" ({:.2f} s), capturing it in {}'.format(
+            word, total, path))
+        future = self._executor.submit(self._record, path, word, language, raw_article, parser,
+                                       list(timings))
+        with self._lock:
+            self._pending = [pending for pending in self._pending if not pending.done()]
+            self._pending.append(future)
+        return path
+
+    def _record(self, path, word, language, raw_article, parser, timings):
+        try:
+            self.record(path, word, language, raw_article, parser, timings)
+        except OSError as err:
+            logger.warning('Failed to capture the slow lookup of "{}": {}'.format(word, err))
+
+    def flush(self):
+        """Waits until the captures checked so far are written"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown()
+
+    def record(self, path, word, language, raw_article, parser, timings):
+        os.makedirs(path, exist_ok=True)
+        parser_name = parser.__name__
+        with open(os.path.join(path, article_file_name(parser_name)), 'w', encoding='utf-8') as f:
+            f.write(raw_article)
+        capture = {
+            'word': word,
+            'language': language,
+            'parser': parser_name,
+            'parse_tables': False,
+            'article_size': len(raw_article),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'threshold': self.threshold,
+            'total': sum(seconds for _, seconds in timings),
+            'processing': sum(seconds for stage, seconds in timings if stage in TIMED_STAGES),
+            'timings': dict(timings),
+        }
+        if self.profile:
+            profiler = cProfile.Profile()
+            try:
+                profiler.runcall(parser.parse_article, raw_article, word, language,
+                                 parse_tables=False)
+            except Exception as err:
+                logger.debug('Profiled parse of "{}" failed: {}'.format(word, err))
+            profiler.dump_stats(os.path.join(path, PROFILE_FILE))
+            capture['profile'] = PROFILE_FILE
+        with open(os.path.join(path, CAPTURE_FILE), 'w', encoding='utf-8') as f:
+            json.dump(capture, f, ensure_ascii=False, indent=2)
+
+
+########################################
+# Replay
+########################################
+def load_captures(directory=SLOW_DIR):
+    """Yields (path, capture) for the captures in the directory, by time of capture"""
+    if os.path.exists(os.path.join(directory, CAPTURE_FILE)):
+        names = ['']
+    else:
+        names = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            with open(os.path.join(path, CAPTURE_FILE), encoding='utf-8') as f:
+                yield path, json.load(f)
+        except (OSError, ValueError) as err:
+            logger.debug('Skipping {}: {}'.format(path, err))
+
+
+def read_article(path, capture):
+    with open(os.path.join(path, article_file_name(capture['parser'])), encoding='utf-8') as f:
+        return f.read()
+
+
+def replay(captures, repeat=3, profiler=None):
+    """
+    Parses the articles of the captures again.
+    captures: iterable of (path, capture), see load_captures
+    profiler: optional cProfile.Profile enabled around the parsing
+    Return: [(word, recorded parse seconds, median replayed seconds, error)]
+    """
+    report = []
+    for path, capture in captures:
+        parser = importlib.import_module(capture['parser'])
+        raw_article = read_article(path, capture)
+        times = []
+        error = None
+        for _ in range(repeat):
+            if profiler is not None:
+                profiler.enable()
+            start = time.perf_counter()
+            try:
+                parser.parse_article(raw_article, capture['word'], capture['language'],
+                                     parse_tables=capture.get('parse_tables', False))
+            except Exception as err:
+                error = '{}: {}'.format(type(err).__name__, err)
+            finally:
+                times.append(time.perf_counter() - start)
+                if profiler is not None:
+                    profiler.disable()
+        report.append((capture['word'], capture['timings'].get('parse'),
+                       statistics.median(times), error))
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import pstats
+    argparser = argparse.ArgumentParser(
+        description='Parse the articles of the captured slow lookups again')
+    argparser.add_argument('directory', nargs='?', default=SLOW_DIR,
+                           help='A capture or a directory of captures (default: %(default)s)')
+    argparser.add_argument('-r', '--repeat', type=int, default=3)
+    argparser.add_argument('-p', '--profile', action='store_true',
+                           help='Profile the parsing and print the top functions')
+    argparser.add_argument('--sort', default='cumulative', help='Sort order of the profile')
+    argparser.add_argument('--limit', type=int, default=30, help='Number of functions printed')
+    args = argparser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    profiler = cProfile.Profile() if args.profile else None
+    report = replay(load_captures(args.directory), args.repeat, profiler)
+    if not report:
+        print('No captures in {}'.format(args.directory))
+    for word, recorded, replayed, error in sorted(report, key=lambda entry: -entry[2]):
+        print('{:<30} recorded {:>8} replayed {:7.3f} s{}'.format(
+            word, '{:.3f} s'.format(recorded) if recorded is not None else '-', replayed,
+            '  ({})'.format(error) if error else ''))
+    if profiler is not None and report:
+        pstats.Stats(profiler).sort_stats(args.sort).print_stats(args.limit)
@@ -0,0 +1,110 @@
+"""
+Snapshot of the hot part of the lookup cache.
+
+The snapshot is a small JSON file with the results (as created by
+lookup.Lookup) of the most used words. It only needs the standard library
+to load, so the command line tools can answer cached words without
+importing the network and parsing modules at all.
+
+The entries are keyed by the mode the results were created with (the
+connector and parser, e.g. 'api' or 'wikitext'), so a result is only served
+to the mode it came from, and they expire: missing words sooner than found
+ones, as they may get an article any time.
+"""
+import json
+import os
+import threading
+import time
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = 5000
+TTL = 7 * 24 * 3600
+MISSING_TTL = 24 * 3600
+
+
+def _key(word, language, mode):
+    return '{}|{}|{}'.format(mode, language, word.strip().lower())
+
+
+class HotCache:
+    """
+    Results by word and language, with a hit count used to decide which
+    entries are kept when the snapshot is saved.
+    mode: the connector and parser the results of this cache come from
+    ttl, missing_ttl: seconds the found and the missing results are served
+    The cache can be shared by threads, e.g. the workers of a pipeline.
+    """
+
+    def __init__(self, entries=None, max_entries=MAX_ENTRIES, mode='api', ttl=TTL,
+                 missing_ttl=MISSING_TTL, clock=time.time):
+        self.entries = entries or {}
+        self.max_entries = max_entries
+        self.mode = mode
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self._clock = clock
+        self.changed = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, max_entries=MAX_ENTRIES, **kwargs):
+        """Loads the snapshot, an empty cache is returned if it's missing or unreadable"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            entries = {}
+        except (OSError, ValueError) as err:
+            logger.info('Ignoring the unreadable snapshot {}: {}'.format(path, err))
+            entries = {}
+        return cls(entries, max_entries, **kwargs)
+
+    def expired(self, entry):
+        ttl = self.missing_ttl if entry['result']['status'] == 'missing' else self.ttl
+        return self._clock() - entry.get('time', 0) > ttl
+
+    def get(self, word, language):
+        key = _key(word, language, self.mode)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.changed = True
+            if self.expired(entry):
+                del self.entries[key]
+                return None
+            entry['hits'] += 1
+            return entry['result']
+
+    def put(self, word, language, result):
+        with self._lock:
+            self.entries[_key(word, language, self.mode)] = {
+                'hits': 1, 'time': self._clock(), 'result': result}
+            self.changed = True
+
+    def __contains__(self, key):
+        word, language = key
+        with self._lock:
+            entry = self.entries.get(_key(word, language, self.mode))
+            return entry is not None and not self.expired(entry)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def save(self, path):
+        """Writes the max_entries most used entries which haven't expired"""
+        with self._lock:
+            hottest = sorted(((key, entry) for key, entry in self.entries.items()
+                              if not self.expired(entry)),
+                             key=lambda item: item[1]['hits'], reverse=True)
+        entries = dict(hottest[:self.max_entries])
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temporary_path, path)
+        self.changed = False
+        logger.debug('Saved {} entries to {}'.format(len(entries), path))
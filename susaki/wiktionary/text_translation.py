@@ -0,0 +1,239 @@
+"""
+Translation of running text.
+
+The text is split into word tokens, and every distinct token is looked up
+once. The inflection tables of the articles fetched so far are kept in a
+form index, so inflected tokens (koiran, koirat, kuussa) are mapped to the
+lemma they belong to without any lookup of their own. The tokens are looked
+up most frequent first, in batches run on a thread pool: each batch only
+contains tokens which the forms of the previous batches didn't explain, so
+a long text needs about as many lookups as it has lemmas.
+
+The articles are fetched through a Lookup (Lookup.fetch), so the existence
+filter, the raw article cache and the failure store of the list translator
+apply, as bulk requests. Only the parsing differs: the tables are needed.
+"""
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+
+from susaki.wiktionary.lookup import article_to_dict, create_result, is_missing_language, FOUND, MISSING
+from susaki.wiktionary.paradigm_export import extract_paradigms
+from susaki.wiktionary.prefetch import referenced_words
+from susaki.wiktionary.throttling import BULK, TransientError, priority
+from susaki.wiktionary.wiki_parsing.paradigm_slots import MISSING_FORM
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"[^\W\d_]+(?:[-'][^\W\d_]+)*")
+
+
+def tokenize(text):
+    """Returns the word tokens of the text as match objects"""
+    return list(WORD_PATTERN.finditer(text))
+
+
+class FormIndex:
+    """Maps the inflected forms of the parsed tables to their lemmas"""
+
+    def __init__(self):
+        self._lemmas = {}
+
+    def add(self, lemma, forms):
+        """
+        forms: the flattened table (see paradigm_export.flatten_inflection_table).
+        Of the forms made of several words (en pääse, on päässyt) only the
+        last word belongs to the lemma.
+        """
+        for form in forms.values():
+            if not form or form == MISSING_FORM:
+                continue
+            # A form seen in several tables keeps the lemma of the most frequent token
+            self._lemmas.setdefault(form.split()[-1].lower(), lemma)
+
+    def lemma(self, form):
+        return self._lemmas.get(form)
+
+    def __len__(self):
+        return len(self._lemmas)
+
+
+class TextTranslation:
+    """
+    The result of TextTranslator.translate.
+    tokens: the word tokens of the text (match objects)
+    lemmas: the lemma of every distinct lower-case token, None if unknown
+    translations: the translations of every lemma
+    """
+
+    def __init__(self, tokens, lemmas, translations):
+        self.tokens = tokens
+        self.lemmas = lemmas
+        self.translations = translations
+
+    def glossary(self):
+        """
+        Returns [(lemma, number of tokens, forms seen, translations)], most
+        frequent first, followed by the unknown tokens with None as lemma.
+        """
+        counts = Counter(token.group().lower() for token in self.tokens)
+        entries = {}
+        for word, count in counts.items():
+            key = self.lemmas.get(word) or (None, word)
+            entry = entries.setdefault(key, [0, []])
+            entry[0] += count
+            entry[1].append(word)
+        glossary = [(lemma, count, forms, self.translations[lemma])
+                    for lemma, (count, forms) in entries.items() if type(lemma) is str]
+        glossary.sort(key=lambda entry: -entry[1])
+        unknown = [(None, count, forms, []) for lemma, (count, forms) in entries.items()
+                   if type(lemma) is tuple]
+        unknown.sort(key=lambda entry: -entry[1])
+        return glossary + unknown
+
+    def write_glossary(self, f):
+        for lemma, count, forms, translations in self.glossary():
+            f.write('{}\t{}\t{}\t{}\n'.format(
+                lemma or forms[0], count, ', '.join(forms),
+                ' | '.join(translations) if lemma else '[UNKNOWN]'))
+
+    def annotate(self, text):
+        """Returns the text with the lemma and first translation after every known token"""
+        parts = []
+        position = 0
+        for token in self.tokens:
+            lemma = self.lemmas.get(token.group().lower())
+            if lemma is None or not self.translations[lemma]:
+                continue
+            parts.append(text[position:token.end()])
+            parts.append('[{}: {}]'.format(lemma, self.translations[lemma][0]))
+            position = token.end()
+        parts.append(text[position:])
+        return ''.join(parts)
+
+
+class TextTranslator:
+    """
+    lookup: the Lookup collecting the raw articles, its parser parses them
+    workers: number of concurrent lookups
+    batch_size: number of tokens looked up before the form index is updated.
+        Smaller batches find more tokens in the index, larger ones keep all
+        workers busy.
+    hot_cache: optional snapshot.HotCache, words it knows to be missing
+        aren't fetched and the results are added to it
+    """
+
+    def __init__(self, lookup, language='Finnish', workers=8, batch_size=None, hot_cache=None):
+        self.lookup = lookup
+        self.language = language
+        self.hot_cache = hot_cache
+        self.workers = workers
+        self.batch_size = batch_size or workers * 4
+        self.forms = FormIndex()
+        self.fetched = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def _fetch(self, word):
+        """Returns the parsed article, None if the word has no article for the language"""
+        if self.hot_cache is not None:
+            result = self.hot_cache.get(word, self.language)
+            if result is not None and result['status'] != FOUND:
+                return None
+        try:
+            with priority(BULK):
+                raw_article, result = self.lookup.fetch(word, self.language)
+        except TransientError as err:
+            logger.warning('Failed to collect the article for "{}": {}'.format(word, err))
+            with self._lock:
+                self.failed += 1
+            return None
+        if raw_article is None:
+            self._remember(word, result)
+            return None
+        parser = self.lookup.parser
+        try:
+            return parser.parse_article(raw_article, word, self.language)
+        except Exception as err:
+            if isinstance(err, LookupError) and is_missing_language(err):
+                self._remember(word, create_result(word, self.language, MISSING))
+                return None
+            # Some tables can't be read, the translations are still useful
+            logger.debug('Parsing the tables of "{}" failed: {}'.format(word, err))
+        try:
+            return parser.parse_article(raw_article, word, self.language, parse_tables=False)
+        except Exception as err:
+            logger.warning('Failed to parse the article for "{}": {}'.format(word, err))
+            if self.lookup.failure_store is not None:
+                self.lookup.failure_store.save(word, self.language, raw_article, err, parser)
+            with self._lock:
+                self.failed += 1
+            return None
+
+    def _remember(self, word, result):
+        if self.hot_cache is not None:
+            self.hot_cache.put(word, self.language, result)
+
+    def translate(self, text):
+        """Returns the TextTranslation of the text"""
+        tokens = tokenize(text)
+        counts = Counter(token.group().lower() for token in tokens)
+        queue = [word for word, _ in counts.most_common()]
+        lemmas = {}
+        translations = {}
+        with ThreadPoolExecutor(self.workers) as executor:
+            while queue:
+                batch = []
+                rest = []
+                for word in queue:
+                    if word in lemmas or word in batch:
+                        continue
+                    lemma = self.forms.lemma(word)
+                    if lemma is not None and lemma in translations:
+                        lemmas[word] = lemma
+                    elif len(batch) < self.batch_size:
+                        batch.append(word)
+                    else:
+                        rest.append(word)
+                queue = rest
+                self.fetched += len(batch)
+                for word, article_root in zip(batch, executor.map(self._fetch, batch)):
+                    queue[:0] = self._add_article(word, article_root, lemmas, translations)
+        # Tokens without an article may be forms of a lemma fetched after them
+        for word, lemma in lemmas.items():
+            if lemma is None or lemma not in translations:
+                lemma = self.forms.lemma(word)
+                lemmas[word] = lemma if lemma in translations else (
+                    word if word in translations else None)
+        logger.info('Translated {} tokens ({} distinct) with {} lookups, {} failed'.format(
+            len(tokens), len(counts), self.fetched, self.failed))
+        return TextTranslation(tokens, lemmas, translations)
+
+    def _add_article(self, word, article_root, lemmas, translations):
+        """Records the article of the word, returns the lemmas which still have to be looked up"""
+        if article_root is None:
+            lemmas[word] = None
+            return []
+        paradigm_lemmas = set()
+        for lemma, _, forms in extract_paradigms(article_root):
+            self.forms.add(lemma, forms)
+            paradigm_lemmas.add(lemma)
+        result = create_result(word, self.language, FOUND,
+                               article_to_dict(article_root, self.language))
+        self._remember(word, result)
+        translations[word] = [translation['text'] for pos in result['pos']
+                              for translation in pos['translations']]
+        lemmas[word] = word
+        if word in paradigm_lemmas:
+            return []
+        # An inflected form has an article of its own ("Inessive singular form of kuu.")
+        referenced = referenced_words(result, max_words=1)
+        if referenced and referenced[0] not in translations:
+            lemmas[word] = referenced[0]
+            return referenced
+        if referenced:
+            lemmas[word] = referenced[0]
+        return []
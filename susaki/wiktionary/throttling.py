@@ -0,0 +1,266 @@
+"""
+Rate limiting and retrying of the requests sent to Wiktionary.
+
+All connectors share one adaptive token bucket. Its rate grows slowly
+while requests succeed and is halved every time the server throttles us
+(HTTP 429, or a maxlag error from the API), so it settles close to the
+highest rate that doesn't get throttled. Retry-After replies block the
+bucket until the given time. Failed requests are retried with jittered
+exponential backoff before a TransientError is raised.
+
+Requests have a priority class, set for the current thread or task with
+`with priority(BULK):`. Interactive requests (the default) reserve their
+token in order of arrival. Bulk requests never reserve one: they only take
+the tokens which no interactive request is waiting for, so they soak up the
+spare rate and an interactive request is always sent next. A bulk lookup
+which a user starts waiting for is promoted (Priority.promote) and goes on
+as an interactive one.
+"""
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import logging
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_STATUS_CODES = {429}
+MAXLAG_ERROR = 'maxlag'
+
+INTERACTIVE = 0
+BULK = 1
+
+_priority = contextvars.ContextVar('priority', default=None)
+
+
+class TransientError(Exception):
+    """
+    The article could not be collected because of a temporary failure
+    (throttling, server errors, timeouts). Unlike a LookupError it doesn't
+    say anything about the existence of the article, so try again later.
+    """
+
+
+class OverloadError(TransientError):
+    """The work was refused because too much of it is queued already"""
+
+
+########################################
+# Priorities
+########################################
+class Priority:
+    """
+    The priority class of a running piece of work. Other threads can raise
+    it while the work runs, e.g. when a user asks for a word which is being
+    looked up in bulk.
+    """
+
+    __slots__ = ['level']
+
+    def __init__(self, level):
+        self.level = level
+
+    def promote(self, level=INTERACTIVE):
+        """Raises the priority to level. Return: True if it was lower"""
+        if level < self.level:
+            self.level = level
+            return True
+        return False
+
+
+def current_priority():
+    current = _priority.get()
+    return INTERACTIVE if current is None else current.level
+
+
+def running_priority():
+    """The Priority of the current thread or task, None for the default interactive one"""
+    return _priority.get()
+
+
+@contextmanager
+def priority(level):
+    """
+    Sends the requests of the enclosed block with the priority class level
+    (or a Priority). Yields the Priority.
+    """
+    current = level if isinstance(level, Priority) else Priority(level)
+    token = _priority.set(current)
+    try:
+        yield current
+    finally:
+        _priority.reset(token)
+
+
+########################################
+# Rate limiting
+########################################
+class RateLimiter:
+    """
+    Token bucket with an adaptive rate (additive increase, multiplicative
+    decrease).
+    rate: initial number of requests per second
+    burst: number of requests which may be sent at once after an idle period
+    """
+
+    def __init__(self, rate=5.0, burst=5, min_rate=0.2, max_rate=50.0,
+                 increase=0.1, decrease=0.5, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.throttled = 0
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """
+        Takes a token, sleeping until one is available.
+        Return: the number of seconds slept
+        """
+        slept = 0.0
+        if current_priority() != INTERACTIVE:
+            taken, slept = self._acquire_spare()
+            if taken:
+                return slept
+            # Promoted while waiting, the token is reserved like any other
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            # The token is reserved at once, so concurrent callers queue up
+            # behind each other instead of all waking up at the same time
+            self._tokens -= 1
+            wait = max(self._blocked_until - now, -self._tokens / self.rate, 0.0)
+        if wait > 0:
+            logger.debug('Rate limited, waiting {:.2f} seconds'.format(wait))
+            self._sleep(wait)
+        return slept + wait
+
+    def _acquire_spare(self):
+        """
+        Waits until a whole token is left over after the reserved ones and
+        takes it, unless the caller is promoted to interactive meanwhile.
+        Return: (whether the token was taken, seconds slept)
+        """
+        slept = 0.0
+        while current_priority() != INTERACTIVE:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                # Some slack for the rounding of the refill
+                if self._tokens >= 1 - 1e-9 and now >= self._blocked_until:
+                    self._tokens -= 1
+                    return True, slept
+                wait = max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+            logger.debug('Rate limited bulk request, waiting {:.2f} seconds'.format(wait))
+            self._sleep(wait)
+            slept += wait
+        return False, slept
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after=None):
+        """Lowers the rate, and blocks all requests for retry_after seconds if given"""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+        logger.info('Throttled by the server, lowered the rate to {:.2f} requests/s'.format(
+            self.rate))
+
+
+_default_rate_limiter = None
+_default_lock = threading.Lock()
+
+
+def default_rate_limiter():
+    """The rate limiter shared by all connectors which aren't given their own"""
+    global _default_rate_limiter
+    with _default_lock:
+        if _default_rate_limiter is None:
+            _default_rate_limiter = RateLimiter()
+        return _default_rate_limiter
+
+
+########################################
+# Retrying
+########################################
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def parse_retry_after(value):
+    """Returns the number of seconds given by a Retry-After header, or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_time = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_time.timestamp() - time.time())
+
+
+def is_throttled(response):
+    return (response.status_code in THROTTLE_STATUS_CODES or
+            response.headers.get('MediaWiki-API-Error') == MAXLAG_ERROR)
+
+
+def get_with_retry(session, url, rate_limiter=None, max_retries=4, timeout=30,
+                   sleep=time.sleep):
+    """
+    Sends a GET request through the rate limiter, retrying on throttling,
+    server errors, timeouts and connection errors.
+    Return: the response (which may still have a 4xx status)
+    Raises a TransientError if all attempts failed.
+    """
+    rate_limiter = rate_limiter or default_rate_limiter()
+    for attempt in range(max_retries + 1):
+        rate_limiter.acquire()
+        delay = backoff_delay(attempt)
+        try:
+            response = session.get(url, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as err:
+            reason = '{}: {}'.format(type(err).__name__, err)
+        else:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if is_throttled(response):
+                rate_limiter.on_throttle(retry_after)
+                reason = 'throttled (HTTP {})'.format(response.status_code)
+            elif response.status_code >= 500:
+                reason = 'HTTP {}'.format(response.status_code)
+            else:
+                rate_limiter.on_success()
+                return response
+            delay = max(delay, retry_after or 0.0)
+        logger.info('Request for {} failed ({}), attempt {} of {}'.format(
+            url, reason, attempt + 1, max_retries + 1))
+        if attempt < max_retries:
+            sleep(delay)
+    raise TransientError('Giving up on {} after {} attempts: {}'.format(
+        url, max_retries + 1, reason))
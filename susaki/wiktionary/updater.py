@@ -0,0 +1,225 @@
+"""
+Incremental refresh of an article archive from the recent changes feed.
+
+Instead of fetching every word again, the updater reads the changes made
+since the last run (list=recentchanges of the MediaWiki API), keeps the
+newest revision of every changed title, and refetches only the archived
+words whose stored revision id is older. Refetched articles are parsed to
+check that they still explain the word in the target language, and the
+archive is replaced by a copy with the new articles (see
+ArchiveWriter.append). The lookup caches are invalidated for every updated
+word.
+"""
+import json
+import os
+from urllib.parse import quote
+
+import logging
+
+import requests
+
+from susaki.wiktionary import archive
+from susaki.wiktionary.lookup import is_missing_language
+from susaki.wiktionary.throttling import TransientError, get_with_retry
+from susaki.wiktionary.wiki_parsing import article_parsing, wikitext_parsing
+
+logger = logging.getLogger(__name__)
+
+RECENT_CHANGES_URL = ('https://en.wiktionary.org/w/api.php?format=json&action=query'
+                      '&list=recentchanges&rcnamespace=0&rctype=edit|new'
+                      '&rcprop=title|ids|timestamp&rclimit=500&rcdir=newer&maxlag=5')
+
+
+########################################
+# Change feed
+########################################
+class RecentChangesFeed:
+    """
+    Reads the recent changes of the main namespace, oldest first.
+    url: the url of the feed, without the rcstart and rccontinue parameters
+    """
+
+    def __init__(self, session=None, rate_limiter=None, url=RECENT_CHANGES_URL, max_retries=4):
+        self.session = session or requests.Session()
+        self.rate_limiter = rate_limiter
+        self.url = url
+        self.max_retries = max_retries
+
+    def changes(self, since=None):
+        """
+        Yields the changes made since the timestamp (e.g. '2016-05-12T00:00:00Z')
+        as dictionaries with at least the keys 'title', 'revid' and 'timestamp'.
+        """
+        parameters = {'rcstart': since} if since else {}
+        while True:
+            url = self.url + ''.join(
+                '&{}={}'.format(name, quote(value)) for name, value in parameters.items())
+            response = get_with_retry(self.session, url, self.rate_limiter, self.max_retries)
+            try:
+                data = response.json()
+            except ValueError:
+                raise TransientError('The recent changes feed returned invalid JSON')
+            if 'error' in data:
+                raise TransientError('The API returned the error "{}"'.format(
+                    data['error'].get('code')))
+            for change in data['query']['recentchanges']:
+                yield change
+            if 'continue' not in data:
+                break
+            parameters['rccontinue'] = data['continue']['rccontinue']
+
+
+def latest_revisions(changes):
+    """Returns {title: change} with the newest change of every title"""
+    latest = {}
+    for change in changes:
+        title = change['title']
+        if title not in latest or change['revid'] > latest[title]['revid']:
+            latest[title] = change
+    return latest
+
+
+########################################
+# Updating
+########################################
+class IncrementalUpdater:
+    """
+    feed: RecentChangesFeed
+    connector: APIConnector (or WikitextConnector for a wikitext archive)
+        used to refetch the changed articles
+    archive_path: the archive to update
+    lookup: optional Lookup whose caches are invalidated for updated words
+    state_path: optional JSON file remembering the timestamp of the last run
+    include_new: also check changed titles which aren't archived yet, and
+        add them if they explain the word in the target language
+    """
+
+    def __init__(self, feed, connector, archive_path, lookup=None, language='Finnish',
+                 state_path=None, include_new=False):
+        self.feed = feed
+        self.connector = connector
+        self.archive_path = archive_path
+        self.lookup = lookup
+        self.language = language
+        self.state_path = state_path
+        self.include_new = include_new
+
+    def load_state(self):
+        if self.state_path and os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                return json.load(f)
+        return {}
+
+    def save_state(self, state):
+        if self.state_path:
+            with open(self.state_path, 'w') as f:
+                json.dump(state, f)
+
+    def refresh(self, since=None):
+        """
+        Applies the changes made since the timestamp (the end of the last
+        run if None).
+        Return: a report of the refresh
+        """
+        state = self.load_state()
+        since = since or state.get('last_timestamp')
+        latest = latest_revisions(self.feed.changes(since))
+        report = {'since': since, 'changed_titles': len(latest), 'updated': [], 'added': [],
+                  'removed': [], 'unchanged': 0, 'failed': []}
+        with archive.ArchiveReader(self.archive_path) as reader:
+            parser = wikitext_parsing if reader.article_format == 'wikitext' else article_parsing
+            candidates = []
+            for title, change in latest.items():
+                if title in reader:
+                    stored = reader.revision(title)
+                    if stored is not None and stored >= change['revid']:
+                        report['unchanged'] += 1
+                        continue
+                elif not self.include_new:
+                    continue
+                candidates.append((title, change, title in reader))
+
+        updates = []
+        retry = []
+        for title, change, archived in candidates:
+            try:
+                raw_article, revision = self.connector.collect_revision(title)
+            except TransientError as err:
+                logger.warning('Failed to refresh "{}": {}'.format(title, err))
+                report['failed'].append(change)
+                retry.append(change)
+                continue
+            except LookupError:
+                # The article was deleted
+                if archived:
+                    updates.append((title, None, None))
+                    report['removed'].append(title)
+                continue
+            try:
+                parser.parse_article(raw_article, title, self.language, parse_tables=False)
+            except Exception as err:
+                if not is_missing_language(err):
+                    # A parser problem, not a deletion: the archived article is
+                    # kept, and the page is fetched again with its next edit
+                    logger.warning('Failed to parse the new revision of "{}": {}'.format(
+                        title, err))
+                    report['failed'].append(change)
+                    continue
+                # The part for the language was deleted
+                if archived:
+                    updates.append((title, None, None))
+                    report['removed'].append(title)
+                continue
+            updates.append((title, raw_article, revision))
+            report['updated' if archived else 'added'].append(title)
+
+        if updates:
+            with archive.ArchiveWriter.append(self.archive_path) as writer:
+                for title, raw_article, revision in updates:
+                    if raw_article is None:
+                        writer.remove(title)
+                    else:
+                        writer.add(title, raw_article, revision)
+            if self.lookup is not None:
+                for title, _, _ in updates:
+                    self.lookup.invalidate(title)
+                if hasattr(self.lookup.connector, 'reload'):
+                    self.lookup.connector.reload()
+
+        timestamps = [change['timestamp'] for change in latest.values()]
+        if retry:
+            # Start the next run at the first failed fetch so it is retried
+            state['last_timestamp'] = min(change['timestamp'] for change in retry)
+        elif timestamps:
+            state['last_timestamp'] = max(timestamps)
+        report['last_timestamp'] = state.get('last_timestamp')
+        self.save_state(state)
+        logger.info('Refreshed the archive: {} updated, {} added, {} removed, {} failed'.format(
+            len(report['updated']), len(report['added']), len(report['removed']),
+            len(report['failed'])))
+        return report
+
+
+if __name__ == '__main__':
+    import argparse
+    from susaki.wiktionary.connectors import APIConnector, WikitextConnector
+    argparser = argparse.ArgumentParser(
+        description='Refetch the articles of an archive which changed since the last run')
+    argparser.add_argument('archive', help='The archive to update')
+    argparser.add_argument('--state', help='JSON file storing the time of the last run')
+    argparser.add_argument('--since', help='Start at this timestamp instead of the last run')
+    argparser.add_argument('--include-new', action='store_true',
+                           help='Add new articles which explain the word in the language')
+    argparser.add_argument('-l', '--language', default='Finnish')
+    args = argparser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    session = requests.Session()
+    with archive.ArchiveReader(args.archive) as reader:
+        wikitext = reader.article_format == 'wikitext'
+    connector = WikitextConnector(session) if wikitext else APIConnector(session)
+    updater = IncrementalUpdater(RecentChangesFeed(session), connector, args.archive,
+                                 language=args.language, state_path=args.state,
+                                 include_new=args.include_new)
+    report = updater.refresh(args.since)
+    print(json.dumps({key: len(value) if isinstance(value, list) else value
+                      for key, value in report.items()}, indent=2))
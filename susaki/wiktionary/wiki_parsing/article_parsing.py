@@ -1,7 +1,15 @@
+"""
+Parsing of the html articles returned by the API.
+The functions keep no state and never modify the soups they are given, so
+they can be called from several threads at once. The soups they create
+themselves are decomposed as soon as the section is parsed (see
+util.SoupScope), so memory is freed without waiting for the garbage collector.
+"""
 from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 from lxml import etree
 import re
-from susaki.wiktionary.wiki_parsing import util, table_parsing
+from susaki.wiktionary.wiki_parsing import util, table_parsing, section_index
 
 import logging
 logger = logging.getLogger(__name__)
@@ -12,15 +20,36 @@ PARSER = 'html.parser'
 ########################################
 # Entry function
 ########################################
-def parse_article(raw_article, word, language='Finnish', parse_tables=True):
+def parse_article(raw_article, word, language='Finnish', parse_tables=True, streaming=True):
     """
     raw_article: html-document of the whole article for the word.
         Must have the same format as that returned by the Wiktionary API
     word: the word this article is about
     language: source language of the word.
         This language is used to do the translation into English
+    streaming: only build soups of the language parts (see
+        scan_language_parts) instead of a soup of the whole article
     Return: root object of the parsed xml tree
     """
+    return parse_article_languages(raw_article, word, [language], parse_tables, streaming)
+
+
+def parse_article_languages(raw_article, word, languages, parse_tables=True, streaming=True):
+    """
+    Parses the parts of the article for several source languages at once.
+    All language parts are found in a single pass over the article: with
+    streaming (the default) the raw html is scanned for the parts (see
+    scan_language_parts) and only each part is parsed into a soup of its
+    own; without it the whole article is parsed into one soup and the parts
+    are taken from its language headers.
+    raw_article: html-document of the whole article for the word.
+    word: the word this article is about
+    languages: list of source languages to extract.
+        Languages without a part in the article are left out of the result.
+        A LookupError is raised if none of them are present.
+    Return: root object of the parsed xml tree with one element per language
+        found, in the order the languages were given.
+    """
     logger.info('Starting article parsing for the word "{}"'.format(word))
     article_root = etree.Element('Article')
     word_element = etree.Element('Word')
@@ -29,23 +58,48 @@ def parse_article(raw_article, word, language='Finnish', parse_tables=True):
 
     languages_root = etree.Element('Languages')
     article_root.append(languages_root)
-    language_element = etree.Element(language)
-    languages_root.append(language_element)
-
-    raw_soup = BeautifulSoup(raw_article, PARSER)
-    language_part = extract_language_part(raw_soup, language)
 
-    pos_parts = extract_pos_parts(language_part)
-    pos_parts_root = etree.Element('POS-parts')
-    language_element.append(pos_parts_root)
-    for pos_part in pos_parts:
-        pos_part_element = parse_POS(pos_part, parse_tables)
-        pos_parts_root.append(pos_part_element)
+    with util.SoupScope() as scope:
+        if streaming:
+            language_parts = {language: BeautifulSoup(part, PARSER) for language, part
+                              in scan_language_parts(raw_article, languages).items()}
+        else:
+            raw_soup = scope.own(BeautifulSoup(raw_article, PARSER))
+            language_parts = extract_language_parts(raw_soup, languages)
+            scope.release(raw_soup)
+        for language_part in language_parts.values():
+            scope.own(language_part)
+        if not language_parts:
+            raise LookupError(
+                'No explanations exists for the language: {}'.format(', '.join(languages)))
+
+        for language in languages:
+            try:
+                language_part = language_parts[language]
+            except KeyError:
+                logger.debug('Skipping {}, not present in the article'.format(language))
+                continue
+            language_element = parse_language_part(language_part, language, parse_tables)
+            languages_root.append(language_element)
+            scope.release(language_part)
 
     logger.info('Finished article parsing for the word "{}"'.format(word))
     return article_root
 
 
+def parse_language_part(language_part, language, parse_tables=True):
+    language_element = etree.Element(language)
+    pos_parts_root = etree.Element('POS-parts')
+    language_element.append(pos_parts_root)
+    with util.SoupScope() as scope:
+        pos_parts = [scope.own(pos_part) for pos_part in extract_pos_parts(language_part)]
+        for pos_part in pos_parts:
+            pos_part_element = parse_POS(pos_part, parse_tables)
+            pos_parts_root.append(pos_part_element)
+            scope.release(pos_part)
+    return language_element
+
+
 ########################################
 # Language part extraction
 ########################################
@@ -55,74 +109,139 @@ def extract_language_part(raw_article, language):
     source language.
     """
     logger.debug('Starting language part extraction ({})'.format(language))
+    language_parts = extract_language_parts(raw_article, [language])
+    try:
+        language_part = language_parts[language]
+    except KeyError:
+        logger.debug('{} language part not found'.format(language))
+        raise LookupError(
+            'No explanations exists for the language: {}'.format(language))
+    logger.debug("Finished language part extraction ({})".format(language))
+    return language_part
+
+
+def extract_language_parts(raw_article, languages):
+    """
+    Extracts the parts of the article for all the given languages in a
+    single pass over the language headers.
+    Returns a dictionary mapping each language found to its part.
+    Languages that are not in the article are left out.
+    """
+    remaining = set(languages)
+    language_parts = {}
     language_header_tags = raw_article.find_all('h2')
-    start_tag = None
-    end_tag = None
     logger.debug('Number of language headers: {}'.format(
         len(language_header_tags)))
     for i, language_header in enumerate(language_header_tags):
+        if not remaining:
+            break
         logger.debug('Checking header {}'.format(i))
-        target_language_found = language_header.find(
-            'span', {'class': 'mw-headline', 'id': language})
-        if target_language_found:
-            logger.debug('{} language part found')
-            start_tag = language_header
-            logger.debug('Start tag found')
-            try:
-                end_tag = language_header_tags[i + 1]
-                logger.debug('End tag found')
-            except IndexError:
-                logger.debug('No end tag found')
-                pass
-            finally:
-                break
-    if not start_tag:
-        logger.debug('{} language part not found')
-        raise LookupError(
-            'No explanations exists for the language: {}'.format(language))
-    language_part = util.extract_soup_between(start_tag, end_tag, raw_article)
-    logger.debug("Finished language part extraction ({})".format(language))
-    return language_part
+        headlines = language_header.find_all('span', {'class': 'mw-headline'})
+        found = [headline.get('id') for headline in headlines
+                 if headline.get('id') in remaining]
+        if not found:
+            continue
+        language = found[0]
+        logger.debug('{} language part found'.format(language))
+        try:
+            end_tag = language_header_tags[i + 1]
+            logger.debug('End tag found')
+        except IndexError:
+            logger.debug('No end tag found')
+            end_tag = None
+        language_parts[language] = util.extract_soup_between(
+            language_header, end_tag, raw_article)
+        remaining.remove(language)
+    return language_parts
+
+
+class _ScanFinished(Exception):
+    pass
+
+
+class LanguagePartScanner(HTMLParser):
+    """
+    Finds where the language parts start and end in the raw html without
+    building a tree. A part starts at the h2 header whose headline has the
+    id of the language and ends at the next h2 header. Raises _ScanFinished
+    at the end of the last part it looks for.
+    """
+
+    def __init__(self, raw_article, languages):
+        super().__init__(convert_charrefs=False)
+        self.remaining = set(languages)
+        self.spans = {}
+        self._line_starts = [0] + [match.end() for match in re.finditer('\n', raw_article)]
+        self._header_start = None
+        self._open_language = None
+
+    def _position(self):
+        line, column = self.getpos()
+        return self._line_starts[line - 1] + column
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'h2':
+            position = self._position()
+            if self._open_language is not None:
+                self.spans[self._open_language][1] = position
+                self._open_language = None
+                if not self.remaining:
+                    raise _ScanFinished()
+            self._header_start = position
+        elif tag == 'span' and self._header_start is not None:
+            attributes = dict(attrs)
+            language = attributes.get('id')
+            if language in self.remaining and 'mw-headline' in (attributes.get('class') or '').split():
+                logger.debug('{} language part found'.format(language))
+                self.spans[language] = [self._header_start, None]
+                self.remaining.remove(language)
+                self._open_language = language
+
+    def handle_endtag(self, tag):
+        if tag == 'h2':
+            self._header_start = None
+
+
+def scan_language_parts(raw_article, languages, chunk_size=16384):
+    """
+    Streaming version of extract_language_parts: the raw article is fed to
+    an incremental tokenizer in chunks, nothing before the language headers
+    is kept and the scan stops at the h2 header ending the last part.
+    Returns a dictionary mapping each language found to the raw html of its
+    part. Languages that are not in the article are left out.
+    """
+    scanner = LanguagePartScanner(raw_article, languages)
+    try:
+        for start in range(0, len(raw_article), chunk_size):
+            scanner.feed(raw_article[start:start + chunk_size])
+        scanner.close()
+    except _ScanFinished:
+        pass
+    return {language: raw_article[start:end] for language, (start, end) in scanner.spans.items()}
 
 
 ########################################
 # POS extraction
 ########################################
-POSSIBLE_WORD_CLASSES = ('Verb|Noun|Adjective|Numeral|Pronoun|Adverb|'
-                         'Suffix|Conjunction|Determiner|Exclamation|'
-                         'Preposition|Postposition|Prefix|Abbreviation|Particle|'
-                         'Contraction|Interjection|Phrase|Proper noun')
+POSSIBLE_WORD_CLASSES = section_index.POSSIBLE_WORD_CLASSES
 
 
-def extract_pos_parts(language_part):
+def extract_pos_parts(language_part, index=None):
+    """
+    Extracts a soup for each POS-part in the language part.
+    index: a SectionIndex of the language part. It is built if not given.
+    """
     logger.debug('Starting extraction of POS-parts')
-    pos_tags = language_part.find_all(
-        text=re.compile(POSSIBLE_WORD_CLASSES),
-        attrs={'class': 'mw-headline'})
-    num_pos_tags = len(pos_tags)
+    if index is None:
+        index = section_index.SectionIndex(language_part)
+    pos_sections = index.sections_of_kind('pos')
+    num_pos_tags = len(pos_sections)
     if num_pos_tags == 0:
         logger.debug("No POS-parts present")
         raise LookupError('No POS-parts present')
     logger.debug('Number of POS-tags in language part: {}'.format(num_pos_tags))
-    pos_tag_headers = [tag.parent for tag in pos_tags]
-    pos_tag_header_level = get_pos_header_level(pos_tag_headers)
-    pos_parts = []
-    start_tag = pos_tag_headers[0]
-    for tag in start_tag.next_siblings:
-        if start_tag and tag_ends_pos_part(tag, pos_tag_header_level):
-            logger.debug('Tag {} ends current pos part'.format(tag.name))
-            pos_part = util.extract_soup_between(start_tag, tag, language_part)
-            pos_parts.append(pos_part)
-            start_tag = None
-        tag_starts_new_pos_part = tag in pos_tag_headers
-        if tag_starts_new_pos_part:
-            logger.debug('Tag {} starts a new pos part'.format(tag.name))
-            start_tag = tag
-    if start_tag:
-        logger.debug('No tag to end last pos part. '
-                     'Extract from last start tag to end of language part')
-        pos_part = util.extract_soup_between(start_tag, None, language_part)
-        pos_parts.append(pos_part)
+    get_pos_header_level([section.header for section in pos_sections])
+    pos_parts = [index.extract(section) for section in pos_sections]
     logger.debug('Found {} POS-tags in language part'.format(len(pos_parts)))
     logger.debug('Finished extraction of POS-parts')
     return pos_parts
@@ -137,15 +256,6 @@ def get_pos_header_level(pos_tag_headers):
     return pos_header_level
 
 
-def tag_ends_pos_part(tag, pos_tag_header_level):
-    if not re.match(r'^h\d$', str(tag.name)):
-        return False
-    elif tag.name[1] > pos_tag_header_level:
-        return False
-    else:
-        return True
-
-
 ########################################
 # POS parsing
 ########################################
@@ -212,7 +322,7 @@ def parse_translation(translation_soup):
     if example_part:
         example_part_root = parse_example(example_part)
         root.append(example_part_root)
-    text = translation_soup.text
+    text = util.text_without(translation_soup, example_part)
     text_clean = util.clean_text(text)
     text_element = etree.Element('Text')
     text_element.text = text_clean
@@ -263,9 +373,8 @@ def parse_example(example_soup):
         else:
             example_translation_text_clean = util.clean_text(
                 example_translation_text)
-            # Remove translation to avoid having it show up in the example text
-            example_translation.clear()
-            example_text = example.text
+            # Leave out the translation to avoid having it show up in the example text
+            example_text = util.text_without(example, example_translation)
             example_translation_element = etree.Element('Translation')
             example_translation_element.text = example_translation_text_clean
             example_root.append(example_translation_element)
@@ -275,6 +384,5 @@ def parse_example(example_soup):
         example_text_element.text = example_text_clean
         example_root.append(example_text_element)
 
-    example_soup.clear()
     logging.debug('Finished parsing examples')
     return example_part_root
@@ -0,0 +1,47 @@
+"""
+The inflection types of the Kotus dictionary (Nykysuomen sanalista) and
+the model words used to name them.
+Wiktionary names its declension and conjugation templates after the model
+words (e.g. fi-decl-koira, fi-conj-sanoa).
+"""
+
+KOTUS_MODEL_WORDS = {
+    '1': 'valo', '2': 'palvelu', '3': 'valtio', '4': 'laatikko',
+    '5': 'risti', '6': 'paperi', '7': 'ovi', '8': 'nalle', '9': 'kala',
+    '10': 'koira', '11': 'omena', '12': 'kulkija', '13': 'katiska',
+    '14': 'solakka', '15': 'korkea', '16': 'vanhempi', '17': 'vapaa',
+    '18': 'maa', '19': 'suo', '20': 'filee', '21': 'rosé', '22': 'parfait',
+    '23': 'tiili', '24': 'uni', '25': 'toimi', '26': 'pieni', '27': 'käsi',
+    '28': 'kynsi', '29': 'lapsi', '30': 'veitsi', '31': 'kaksi',
+    '32': 'sisar', '33': 'kytkin', '34': 'onneton', '35': 'lämmin',
+    '36': 'sisin', '37': 'vasen', '38': 'nainen', '39': 'vastaus',
+    '40': 'kalleus', '41': 'vieras', '42': 'mies', '43': 'ohut',
+    '44': 'kevät', '45': 'kahdeksas', '46': 'tuhat', '47': 'kuollut',
+    '48': 'hame', '49': 'askel',
+    '52': 'sanoa', '53': 'muistaa', '54': 'huutaa', '55': 'soutaa',
+    '56': 'kaivaa', '57': 'saartaa', '58': 'laskea', '59': 'tuntea',
+    '60': 'lähteä', '61': 'sallia', '62': 'voida', '63': 'saada',
+    '64': 'juoda', '65': 'käydä', '66': 'rohkaista', '67': 'tulla',
+    '68': 'tupakoida', '69': 'valita', '70': 'juosta', '71': 'nähdä',
+    '72': 'vanheta', '73': 'salata', '74': 'katketa', '75': 'selvitä',
+    '76': 'taitaa', '77': 'kumajaa', '78': 'kaikaa',
+}
+
+KOTUS_TYPES = {word: kotus_type for kotus_type, word in KOTUS_MODEL_WORDS.items()}
+
+FIRST_VERB_TYPE = 52
+
+
+def is_verb_type(kotus_type):
+    return int(kotus_type) >= FIRST_VERB_TYPE
+
+
+def kotus_type_of(model_word):
+    """
+    Returns the Kotus type named by the given model word.
+    Raises a LookupError if the model word is unknown.
+    """
+    try:
+        return KOTUS_TYPES[model_word]
+    except KeyError:
+        raise LookupError('Unknown Kotus model word: {}'.format(model_word))
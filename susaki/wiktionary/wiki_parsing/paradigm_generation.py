@@ -0,0 +1,857 @@
+"""
+Local generation of Finnish paradigms from the Kotus type and the consonant
+gradation of a word.
+
+Every type is described by the handful of stems the whole paradigm is built
+from (e.g. the weak singular stem koira- and the plural stem koiri- for
+koira). The generated tables have the same format as the tables created by
+table_parsing, so only the lemma and its type have to be stored, and
+missing or malformed tables can be filled in without fetching the article
+again.
+Only the first form Wiktionary lists for a slot is generated.
+"""
+import re
+
+import logging
+
+from lxml import etree
+
+from susaki.wiktionary.wiki_parsing import kotus, table_parsing
+from susaki.wiktionary.wiki_parsing.paradigm_slots import NOUN_SLOTS, VERB_SLOTS, MISSING_FORM
+
+logger = logging.getLogger(__name__)
+
+VOWELS = 'aeiouyäöé'
+BACK_VOWELS = 'aou'
+FRONT_VOWELS = 'äöy'
+DIPHTHONGS = {'ai', 'ei', 'oi', 'ui', 'yi', 'äi', 'öi', 'au', 'eu', 'iu', 'ou',
+              'äy', 'öy', 'ey', 'iy', 'ie', 'uo', 'yö'}
+TO_FRONT = str.maketrans('aou', 'äöy')
+
+
+########################################
+# Entry functions
+########################################
+def generate_inflection_table(word, kotus_type, gradation='no', table_type='noun'):
+    """
+    Generates the inflection table of the word.
+    word: the lemma
+    kotus_type: the Kotus type of the word, e.g. '10'
+    gradation: the consonant gradation given as strong-weak (e.g. 'kk-k'),
+        or 'no' if the word doesn't gradate
+    table_type: the lower case POS of the word (e.g. 'noun', 'adjective', 'verb')
+    Return: the root of the element tree, formatted as the tables
+        created by table_parsing.parse_inflection_table
+    Raises a ValueError if the type can't be generated.
+    """
+    logger.debug('Generating inflection table for {} (type {}, {} gradation)'.format(
+        word, kotus_type, gradation))
+    forms = generate_forms(word, kotus_type, gradation, table_type)
+    slots = VERB_SLOTS if kotus.is_verb_type(kotus_type) else NOUN_SLOTS
+    inflection_root = etree.Element('Inflection_Table')
+    kotus_word = kotus.KOTUS_MODEL_WORDS.get(str(kotus_type), '')
+    inflection_root.append(
+        table_parsing.create_meta_tree(word, str(kotus_type), kotus_word, gradation))
+    inflection_root.append(build_table_tree(forms, slots))
+    return inflection_root
+
+
+def generate_forms(word, kotus_type, gradation='no', table_type='noun'):
+    """Returns a dictionary mapping the paradigm slots to the generated forms"""
+    grades = parse_gradation(gradation)
+    kotus_type = str(int(kotus_type))
+    word = word.lower()
+    if kotus.is_verb_type(kotus_type):
+        try:
+            stem_function = VERB_TYPES[kotus_type]
+        except KeyError:
+            raise ValueError('Generation of verb type {} is not supported'.format(kotus_type))
+        stems = stem_function(Word(word, grades))
+        return build_verb_forms(word, stems, is_back(word))
+    try:
+        stem_function = NOUN_TYPES[kotus_type]
+    except KeyError:
+        raise ValueError('Generation of nominal type {} is not supported'.format(kotus_type))
+    stems = stem_function(Word(word, grades))
+    return build_noun_forms(word, stems, is_back(word), table_type)
+
+
+def build_table_tree(forms, slots):
+    """Builds the table element from the flat dictionary of forms"""
+    table_root = etree.Element('table')
+    for slot in slots:
+        parent = table_root
+        for tag in slot.split('/'):
+            element = parent.find(tag)
+            if element is None:
+                element = etree.SubElement(parent, tag)
+            parent = element
+        parent.text = forms[slot]
+    return table_root
+
+
+########################################
+# Vowel harmony and consonant gradation
+########################################
+def is_back(word):
+    """The last harmonic vowel decides the harmony, so compounds work too"""
+    for letter in reversed(word):
+        if letter in BACK_VOWELS:
+            return True
+        if letter in FRONT_VOWELS:
+            return False
+    return False
+
+
+def harmonize(ending, back):
+    """Endings are written with back vowels and converted for front words"""
+    return ending if back else ending.translate(TO_FRONT)
+
+
+def lengthen(stem):
+    """Lengthens the final vowel, unless the stem ends in a long vowel or a diphthong"""
+    if stem[-2:] in DIPHTHONGS or (stem[-1] == stem[-2] and stem[-1] in VOWELS):
+        return stem
+    return stem + stem[-1]
+
+
+def parse_gradation(gradation):
+    """
+    Returns (strong, weak) for a gradation given as e.g. 'kk-k' or 'k-'.
+    Returns None if the word doesn't gradate.
+    """
+    if not gradation or gradation.strip() in ('no', '-', ''):
+        return None
+    try:
+        strong, weak = gradation.strip().split('-')
+    except ValueError:
+        raise ValueError('Unknown gradation: {}'.format(gradation))
+    return strong, weak.strip("*∅'’")
+
+
+class Word:
+    """A lemma together with its gradation, used to create the stems"""
+
+    def __init__(self, lemma, grades):
+        self.lemma = lemma
+        self.grades = grades
+        self.back = is_back(lemma)
+
+    def h(self, ending):
+        return harmonize(ending, self.back)
+
+    def weaken(self, stem):
+        """Changes the strong grade in the last syllable of the vowel stem to the weak grade"""
+        if not self.grades:
+            return stem
+        strong, weak = self.grades
+        return _replace_grade(stem, strong, weak)
+
+    def strengthen(self, stem):
+        """Changes the weak grade in the last syllable of the stem to the strong grade"""
+        if not self.grades:
+            return stem
+        strong, weak = self.grades
+        if not weak:
+            raise ValueError('Strengthening of {} with a missing weak grade is not supported'.format(
+                self.lemma))
+        return _replace_grade(stem, weak, strong)
+
+
+def _replace_grade(stem, source, target):
+    pattern = r'^(.*{})(?:{})([{}]+[^{}]*)$'.format(
+        '' if source else '[^{}]'.format(VOWELS), re.escape(source), VOWELS, VOWELS)
+    match = re.match(pattern, stem)
+    if not match:
+        raise ValueError('Grade "{}" not found in "{}"'.format(source, stem))
+    return match.group(1) + target + match.group(2)
+
+
+########################################
+# Nominals
+########################################
+class NounStems:
+    """
+    strong, weak: the singular vowel stems in the strong and weak grade
+    partitive, illative: the singular partitive and illative
+    plural_strong, plural_weak: the plural stems
+    genitive_plural, partitive_plural, illative_plural: the plural forms
+    """
+    __slots__ = ['strong', 'weak', 'partitive', 'illative', 'plural_strong', 'plural_weak',
+                 'genitive_plural', 'partitive_plural', 'illative_plural']
+
+    def __init__(self, **stems):
+        for name in self.__slots__:
+            setattr(self, name, stems.get(name))
+        if self.weak is None:
+            self.weak = self.strong
+        if self.plural_weak is None:
+            self.plural_weak = self.plural_strong
+
+
+SINGULAR_LOCAL_CASES = [('inessive', 'ssa'), ('elative', 'sta'), ('adessive', 'lla'),
+                        ('ablative', 'lta'), ('allative', 'lle'), ('translative', 'ksi'),
+                        ('abessive', 'tta')]
+
+
+def build_noun_forms(word, stems, back, table_type='noun'):
+    def h(ending):
+        return harmonize(ending, back)
+
+    nominative_plural = stems.weak + 't'
+    genitive = stems.weak + 'n'
+    forms = {
+        'nominative/singular': word,
+        'nominative/plural': nominative_plural,
+        'accusative/nominative/singular': word,
+        'accusative/nominative/plural': nominative_plural,
+        'accusative/genitive': genitive,
+        'genitive/singular': genitive,
+        'genitive/plural': stems.genitive_plural,
+        'partitive/singular': stems.partitive,
+        'partitive/plural': stems.partitive_plural,
+        'illative/singular': stems.illative,
+        'illative/plural': stems.illative_plural,
+        'essive/singular': stems.strong + h('na'),
+        'essive/plural': stems.plural_strong + h('na'),
+        'instructive/singular': MISSING_FORM,
+        'instructive/plural': stems.plural_weak + 'n',
+        'comitative/singular': MISSING_FORM,
+        'comitative/plural': stems.plural_strong + ('ne' if table_type == 'adjective' else 'neen'),
+    }
+    for case, ending in SINGULAR_LOCAL_CASES:
+        forms['{}/singular'.format(case)] = stems.weak + h(ending)
+        forms['{}/plural'.format(case)] = stems.plural_weak + h(ending)
+    assert set(forms) == set(NOUN_SLOTS)
+    return forms
+
+
+def _valo(w):
+    strong = w.lemma
+    return NounStems(
+        strong=strong, weak=w.weaken(strong),
+        partitive=strong + w.h('a'), illative=strong + strong[-1] + 'n',
+        plural_strong=strong + 'i', plural_weak=w.weaken(strong + 'i'),
+        genitive_plural=strong + 'jen', partitive_plural=strong + w.h('ja'),
+        illative_plural=strong + 'ihin')
+
+
+def _valtio(w):
+    strong = w.lemma
+    plural = strong + 'i'
+    return NounStems(
+        strong=strong, partitive=strong + w.h('ta'), illative=strong + strong[-1] + 'n',
+        plural_strong=plural, genitive_plural=plural + 'den',
+        partitive_plural=plural + w.h('ta'), illative_plural=plural + 'hin')
+
+
+def _laatikko(w, plural_vowel=''):
+    strong = w.lemma
+    weak = w.weaken(strong)
+    plural = weak[:-1] + (plural_vowel or weak[-1]) + 'i'
+    return NounStems(
+        strong=strong, weak=weak, partitive=strong + w.h('a'),
+        illative=strong + strong[-1] + 'n',
+        plural_strong=plural, genitive_plural=plural + 'den',
+        partitive_plural=plural + w.h('ta'), illative_plural=plural + 'hin')
+
+
+def _solakka(w):
+    return _laatikko(w, plural_vowel=w.h('o'))
+
+
+def _risti(w):
+    strong = w.lemma if w.lemma[-1] in VOWELS else w.lemma + 'i'
+    weak = w.weaken(strong)
+    return NounStems(
+        strong=strong, weak=weak, partitive=strong + w.h('a'), illative=strong + 'in',
+        plural_strong=strong[:-1] + 'ei', plural_weak=weak[:-1] + 'ei',
+        genitive_plural=strong + 'en', partitive_plural=strong[:-1] + w.h('eja'),
+        illative_plural=strong[:-1] + 'eihin')
+
+
+def _paperi(w):
+    strong = w.lemma
+    plural = strong[:-1] + 'ei'
+    return NounStems(
+        strong=strong, partitive=strong + w.h('a'), illative=strong + 'in',
+        plural_strong=plural, genitive_plural=strong + 'en',
+        partitive_plural=plural + w.h('ta'), illative_plural=plural + 'hin')
+
+
+def _ovi(w):
+    strong = w.lemma[:-1] + 'e'
+    weak = w.weaken(strong)
+    return NounStems(
+        strong=strong, weak=weak, partitive=strong + w.h('a'), illative=strong + 'en',
+        plural_strong=strong[:-1] + 'i', plural_weak=weak[:-1] + 'i',
+        genitive_plural=strong[:-1] + 'ien', partitive_plural=strong[:-1] + w.h('ia'),
+        illative_plural=strong[:-1] + 'iin')
+
+
+def _nalle(w):
+    strong = w.lemma
+    weak = w.weaken(strong)
+    return NounStems(
+        strong=strong, weak=weak, partitive=strong + w.h('a'), illative=strong + 'en',
+        plural_strong=strong + 'i', plural_weak=weak + 'i',
+        genitive_plural=strong + 'jen', partitive_plural=strong + w.h('ja'),
+        illative_plural=strong + 'ihin')
+
+
+def _kala(w):
+    strong = w.lemma
+    weak = w.weaken(strong)
+    o = w.h('o')
+    return NounStems(
+        strong=strong, weak=weak, partitive=strong + strong[-1], illative=strong + strong[-1] + 'n',
+        plural_strong=strong[:-1] + o + 'i', plural_weak=weak[:-1] + o + 'i',
+        genitive_plural=strong[:-1] + o + 'jen', partitive_plural=strong[:-1] + o + w.h('ja'),
+        illative_plural=strong[:-1] + o + 'ihin')
+
+
+def _koira(w):
+    strong = w.lemma
+    weak = w.weaken(strong)
+    return NounStems(
+        strong=strong, weak=weak, partitive=strong + strong[-1], illative=strong + strong[-1] + 'n',
+        plural_strong=strong[:-1] + 'i', plural_weak=weak[:-1] + 'i',
+        genitive_plural=strong[:-1] + 'ien', partitive_plural=strong[:-1] + w.h('ia'),
+        illative_plural=strong[:-1] + 'iin')
+
+
+def _omena(w):
+    strong = w.lemma
+    weak = w.weaken(strong)
+    o = w.h('o')
+    plural = strong[:-1] + o + 'i'
+    return NounStems(
+        strong=strong, weak=weak, partitive=strong + strong[-1], illative=strong + strong[-1] + 'n',
+        plural_strong=plural, plural_weak=weak[:-1] + o + 'i', genitive_plural=plural + 'den',
+        partitive_plural=plural + w.h('ta'), illative_plural=plural + 'hin')
+
+
+def _korkea(w):
+    strong = w.lemma
+    plural = strong[:-1] + 'i'
+    return NounStems(
+        strong=strong, partitive=strong + strong[-1], illative=strong + strong[-1] + 'n',
+        plural_strong=plural, genitive_plural=plural + 'den',
+        partitive_plural=plural + w.h('ta'), illative_plural=plural + 'siin')
+
+
+def _vanhempi(w):
+    strong = w.lemma[:-1] + w.h('a')
+    weak = w.weaken(strong)
+    return NounStems(
+        strong=strong, weak=weak, partitive=strong + strong[-1], illative=strong + strong[-1] + 'n',
+        plural_strong=strong[:-1] + 'i', plural_weak=weak[:-1] + 'i',
+        genitive_plural=strong[:-1] + 'ien', partitive_plural=strong[:-1] + w.h('ia'),
+        illative_plural=strong[:-1] + 'iin')
+
+
+def _vapaa(w):
+    strong = w.lemma
+    plural = strong[:-1] + 'i'
+    return NounStems(
+        strong=strong, partitive=strong + w.h('ta'), illative=strong + 'seen',
+        plural_strong=plural, genitive_plural=plural + 'den',
+        partitive_plural=plural + w.h('ta'), illative_plural=plural + 'siin')
+
+
+def _maa(w, plural=None):
+    strong = w.lemma
+    plural = plural or strong[:-1] + 'i'
+    return NounStems(
+        strong=strong, partitive=strong + w.h('ta'), illative=strong + 'h' + strong[-1] + 'n',
+        plural_strong=plural, genitive_plural=plural + 'den',
+        partitive_plural=plural + w.h('ta'), illative_plural=plural + 'hin')
+
+
+def _suo(w):
+    return _maa(w, plural=w.lemma[:-2] + w.lemma[-1] + 'i')
+
+
+def _filee(w):
+    stems = _maa(w)
+    stems.illative_plural = stems.plural_strong + 'siin'
+    return stems
+
+
+def _rose(w):
+    return _maa(w, plural=w.lemma + 'i')
+
+
+def _tiili(w, partitive=None, genitive_plural=None):
+    strong = w.lemma[:-1] + 'e'
+    weak = w.weaken(strong)
+    plural = w.lemma
+    return NounStems(
+        strong=strong, weak=weak, partitive=partitive or w.lemma[:-1] + w.h('ta'),
+        illative=strong + 'en', plural_strong=plural, plural_weak=w.weaken(plural),
+        genitive_plural=genitive_plural or plural + 'en', partitive_plural=plural + w.h('a'),
+        illative_plural=plural + 'in')
+
+
+def _toimi(w):
+    return _tiili(w, partitive=w.lemma[:-2] + w.h('nta'))
+
+
+def _pieni(w):
+    return _tiili(w, genitive_plural=w.lemma[:-1] + 'ten')
+
+
+def _kasi(w, strong=None, partitive=None):
+    strong = strong or w.lemma[:-2] + 'te'
+    grades = w.grades or ('t', 'd')
+    plural = w.lemma
+    return NounStems(
+        strong=strong, weak=_replace_grade(strong, *grades),
+        partitive=partitive or w.lemma[:-2] + w.h('tta'),
+        illative=strong + 'en', plural_strong=plural, genitive_plural=plural + 'en',
+        partitive_plural=plural + w.h('a'), illative_plural=plural + 'in')
+
+
+def _lapsi(w):
+    stems = _tiili(w, genitive_plural=w.lemma[:-3] + 'sten')
+    stems.partitive = w.lemma[:-3] + w.h('sta')
+    return stems
+
+
+def _veitsi(w):
+    stems = _tiili(w)
+    stems.partitive = w.lemma[:-3] + w.h('sta')
+    return stems
+
+
+def _kaksi(w):
+    return _kasi(w, strong=w.lemma[:-3] + 'hte', partitive=w.lemma[:-3] + w.h('hta'))
+
+
+def _consonant_stem(w, strong, partitive=None, genitive_plural=None):
+    """The stems of types 32-49: the inflected stem always has the strong grade"""
+    plural = strong[:-1] + 'i'
+    return NounStems(
+        strong=strong, partitive=partitive or w.lemma + w.h('ta'),
+        illative=strong + strong[-1] + 'n', plural_strong=plural,
+        genitive_plural=genitive_plural or plural + 'en',
+        partitive_plural=plural + w.h('a'), illative_plural=plural + 'in')
+
+
+def _sisar(w):
+    return _consonant_stem(w, w.strengthen(w.lemma) + 'e')
+
+
+def _kytkin(w):
+    return _consonant_stem(w, w.strengthen(w.lemma)[:-1] + 'me')
+
+
+def _onneton(w):
+    return _consonant_stem(w, w.strengthen(w.lemma)[:-1] + w.h('ma'))
+
+
+def _sisin(w):
+    strong = w.lemma[:-1] + w.h('mpa')
+    weak = strong[:-3] + w.h('mma')
+    return NounStems(
+        strong=strong, weak=weak, partitive=w.lemma + w.h('ta'),
+        illative=strong + strong[-1] + 'n',
+        plural_strong=strong[:-1] + 'i', plural_weak=weak[:-1] + 'i',
+        genitive_plural=strong[:-1] + 'ien', partitive_plural=strong[:-1] + w.h('ia'),
+        illative_plural=strong[:-1] + 'iin')
+
+
+def _nainen(w):
+    return _consonant_stem(
+        w, w.lemma[:-3] + 'se', partitive=w.lemma[:-3] + w.h('sta'),
+        genitive_plural=w.lemma[:-3] + 'sten')
+
+
+def _vastaus(w):
+    return _consonant_stem(w, w.strengthen(w.lemma)[:-1] + 'kse',
+                           genitive_plural=w.lemma + 'ten')
+
+
+def _kalleus(w):
+    plural = w.lemma[:-1] + 'ksi'
+    return NounStems(
+        strong=w.lemma[:-1] + 'te', weak=w.lemma[:-1] + 'de',
+        partitive=w.lemma[:-1] + w.h('tta'), illative=w.lemma[:-1] + 'teen',
+        plural_strong=plural, genitive_plural=plural + 'en',
+        partitive_plural=plural + w.h('a'), illative_plural=plural + 'in')
+
+
+def _long_vowel_stem(w, strong):
+    """The stems of the types ending in a long vowel (vieras, kevät, hame)"""
+    plural = strong[:-1] + 'i'
+    return NounStems(
+        strong=strong, partitive=w.lemma + w.h('ta'), illative=strong + 'seen',
+        plural_strong=plural, genitive_plural=plural + 'den',
+        partitive_plural=plural + w.h('ta'), illative_plural=plural + 'siin')
+
+
+def _vieras(w):
+    strong = w.strengthen(w.lemma)
+    return _long_vowel_stem(w, strong[:-1] + strong[-2])
+
+
+def _mies(w):
+    return _consonant_stem(w, w.lemma[:-1] + 'he', genitive_plural=w.lemma + 'ten')
+
+
+def _ohut(w):
+    strong = w.strengthen(w.lemma)[:-1] + 'e'
+    stems = _long_vowel_stem(w, strong)
+    stems.illative = strong + 'en'
+    return stems
+
+
+def _kahdeksas(w):
+    plural = w.lemma[:-1] + 'nsi'
+    return NounStems(
+        strong=w.lemma[:-1] + 'nte', weak=w.lemma[:-1] + 'nne',
+        partitive=w.lemma[:-1] + w.h('tta'), illative=w.lemma[:-1] + 'nteen',
+        plural_strong=plural, genitive_plural=plural + 'en',
+        partitive_plural=plural + w.h('a'), illative_plural=plural + 'in')
+
+
+def _tuhat(w):
+    stems = _kahdeksas(w)
+    stems.partitive = w.lemma + w.h('ta')
+    return stems
+
+
+def _kuollut(w):
+    return _long_vowel_stem(w, w.lemma[:-2] + 'ee')
+
+
+def _hame(w):
+    strong = w.strengthen(w.lemma)
+    stems = _long_vowel_stem(w, strong + strong[-1])
+    stems.partitive = w.lemma + w.h('tta')
+    return stems
+
+
+def _askel(w):
+    return _consonant_stem(w, w.strengthen(w.lemma) + 'e')
+
+
+NOUN_TYPES = {
+    '1': _valo, '2': _valo, '3': _valtio, '4': _laatikko, '5': _risti,
+    '6': _paperi, '7': _ovi, '8': _nalle, '9': _kala, '10': _koira,
+    '11': _omena, '12': _omena, '13': _omena, '14': _solakka, '15': _korkea,
+    '16': _vanhempi, '17': _vapaa, '18': _maa, '19': _suo, '20': _filee,
+    '21': _rose, '23': _tiili, '24': _tiili, '25': _toimi, '26': _pieni,
+    '27': _kasi, '28': _kasi, '29': _lapsi, '30': _veitsi, '31': _kaksi,
+    '32': _sisar, '33': _kytkin, '34': _onneton, '35': _onneton,
+    '36': _sisin, '37': _sisin, '38': _nainen, '39': _vastaus,
+    '40': _kalleus, '41': _vieras, '42': _mies, '43': _ohut, '44': _vieras,
+    '45': _kahdeksas, '46': _tuhat, '47': _kuollut, '48': _hame, '49': _askel,
+}
+
+
+########################################
+# Verbs
+########################################
+class VerbStems:
+    """
+    present, present_weak: the present stems (sano-, lähettä-/lähetä-)
+    past, past_weak: the past stems (sanoi-, lähetti-/läheti-)
+    conditional: the conditional stem including -isi- (sanoisi-)
+    imperative: the stem the imperative endings are added to (sano-, pääs-)
+    past_participle: the active past participle (sanonut)
+    passive, passive_weak: the passive stems (sanott-/sanot-)
+    """
+    __slots__ = ['present', 'present_weak', 'past', 'past_weak', 'conditional',
+                 'imperative', 'past_participle', 'passive', 'passive_weak']
+
+    def __init__(self, **stems):
+        for name in self.__slots__:
+            setattr(self, name, stems.get(name))
+        if self.present_weak is None:
+            self.present_weak = self.present
+        if self.past_weak is None:
+            self.past_weak = self.past
+        if self.passive_weak is None:
+            self.passive_weak = self.passive
+
+
+PERSONS = ['singular/first', 'singular/second', 'singular/third',
+           'plural/first', 'plural/second', 'plural/third']
+NEGATIONS = ['en', 'et', 'ei', 'emme', 'ette', 'eivät']
+
+
+def _person_forms(forms, path, values):
+    for person, value in zip(PERSONS + ['passive'], values):
+        forms['{}/{}'.format(path, person)] = value
+
+
+def _compound_forms(forms, path, auxiliaries, participles, passive_participle, passive_auxiliary):
+    values = ['{} {}'.format(auxiliary, participle) if auxiliary else MISSING_FORM
+              for auxiliary, participle in zip(auxiliaries, participles)]
+    values.append('{} {}'.format(passive_auxiliary, passive_participle))
+    _person_forms(forms, path, values)
+
+
+def build_verb_forms(word, stems, back):
+    def h(ending):
+        return harmonize(ending, back)
+
+    forms = {}
+    participle = stems.past_participle
+    participle_plural = participle[:-2] + 'eet'
+    participles = [participle] * 3 + [participle_plural] * 3
+    passive_participle = stems.passive + h('u')
+    potential = participle[:-2] + 'e'
+
+    def simple_tense(mood, tense, stems_by_person, third_singular, passive, connegative,
+                     passive_connegative, negations=NEGATIONS):
+        first, plural = stems_by_person
+        positive = [first + 'n', first + 't', third_singular,
+                    first + 'mme', first + 'tte', plural + h('vat'), passive]
+        _person_forms(forms, '{}/{}/positive'.format(mood, tense), positive)
+        negative = ['{} {}'.format(negation, connegative) for negation in negations]
+        negative.append('ei {}'.format(passive_connegative))
+        _person_forms(forms, '{}/{}/negative'.format(mood, tense), negative)
+
+    def compound_tense(mood, tense, positive_auxiliaries, passive_auxiliary,
+                       negative_auxiliaries, passive_negative_auxiliary):
+        _compound_forms(forms, '{}/{}/positive'.format(mood, tense),
+                        positive_auxiliaries, participles, passive_participle, passive_auxiliary)
+        _compound_forms(forms, '{}/{}/negative'.format(mood, tense),
+                        negative_auxiliaries, participles, passive_participle,
+                        passive_negative_auxiliary)
+
+    # Indicative
+    simple_tense('indicative_mood', 'present', (stems.present_weak, stems.present),
+                 lengthen(stems.present), stems.passive_weak + h('aan'),
+                 stems.present_weak, stems.passive_weak + h('a'))
+    compound_tense('indicative_mood', 'perfect',
+                   ['olen', 'olet', 'on', 'olemme', 'olette', 'ovat'], 'on',
+                   ['en ole', 'et ole', 'ei ole', 'emme ole', 'ette ole', 'eivät ole'], 'ei ole')
+    simple_tense('indicative_mood', 'past', (stems.past_weak, stems.past),
+                 stems.past, stems.passive + 'iin', participle, passive_participle)
+    # The negative past uses the plural participle for the plural persons
+    for i, person in enumerate(PERSONS[3:]):
+        forms['indicative_mood/past/negative/{}'.format(person)] = '{} {}'.format(
+            NEGATIONS[i + 3], participle_plural)
+    compound_tense('indicative_mood', 'pluperfect',
+                   ['olin', 'olit', 'oli', 'olimme', 'olitte', 'olivat'], 'oli',
+                   ['en ollut', 'et ollut', 'ei ollut', 'emme olleet', 'ette olleet',
+                    'eivät olleet'], 'ei ollut')
+
+    # Conditional
+    conditional = stems.conditional
+    simple_tense('conditional_mood', 'present', (conditional, conditional), conditional,
+                 stems.passive + h('aisiin'), conditional, stems.passive + h('aisi'))
+    compound_tense('conditional_mood', 'perfect',
+                   ['olisin', 'olisit', 'olisi', 'olisimme', 'olisitte', 'olisivat'], 'olisi',
+                   ['en olisi', 'et olisi', 'ei olisi', 'emme olisi', 'ette olisi',
+                    'eivät olisi'], 'ei olisi')
+
+    # Imperative
+    imperative = stems.imperative
+    _person_forms(forms, 'imperative_mood/present/positive', [
+        MISSING_FORM, stems.present_weak, imperative + h('koon'), imperative + h('kaamme'),
+        imperative + h('kaa'), imperative + h('koot'), stems.passive + h('akoon')])
+    connegative = imperative + h('ko')
+    _person_forms(forms, 'imperative_mood/present/negative', [
+        MISSING_FORM, 'älä ' + stems.present_weak, 'älköön ' + connegative,
+        'älkäämme ' + connegative, 'älkää ' + connegative, 'älkööt ' + connegative,
+        'älköön ' + stems.passive + h('ako')])
+    compound_tense('imperative_mood', 'perfect',
+                   [None, 'ole', 'olkoon', 'olkaamme', 'olkaa', 'olkoot'], 'olkoon',
+                   [None, 'älä ole', 'älköön olko', 'älkäämme olko', 'älkää olko',
+                    'älkööt olko'], 'älköön olko')
+
+    # Potential
+    simple_tense('potential_mood', 'present', (potential, potential), potential + 'e',
+                 stems.passive + h('aneen'), potential, stems.passive + h('ane'))
+    compound_tense('potential_mood', 'perfect',
+                   ['lienen', 'lienet', 'lienee', 'lienemme', 'lienette', 'lienevät'], 'lienee',
+                   ['en liene', 'et liene', 'ei liene', 'emme liene', 'ette liene',
+                    'eivät liene'], 'ei liene')
+
+    # Nominal forms
+    present = stems.present
+    infinitive_stem = word[:-1]
+    if infinitive_stem.endswith('e'):
+        # laskea -> laskiessa, laskien
+        infinitive_stem = infinitive_stem[:-1] + 'i'
+    nominal_forms = {
+        'infinitives/first': word,
+        'infinitives/long_first': word + 'kseen',
+        'infinitives/second/inessive/active': infinitive_stem + 'e' + h('ssa'),
+        'infinitives/second/inessive/passive': stems.passive + h('aessa'),
+        'infinitives/second/instructive/active': infinitive_stem + 'en',
+        'infinitives/second/instructive/passive': MISSING_FORM,
+        'infinitives/third/instructive/active': present + h('man'),
+        'infinitives/third/instructive/passive': stems.passive + h('aman'),
+        'infinitives/fourth/nominative': present + 'minen',
+        'infinitives/fourth/partitive': present + h('mista'),
+        'infinitives/fifth': present + h('maisillaan'),
+        'participles/present/active': present + h('va'),
+        'participles/present/passive': stems.passive + h('ava'),
+        'participles/past/active': participle,
+        'participles/past/passive': passive_participle,
+        'participles/agent': present + h('ma'),
+        'participles/negative': present + h('maton'),
+    }
+    for case, ending in [('inessive', 'massa'), ('elative', 'masta'), ('illative', 'maan'),
+                         ('adessive', 'malla'), ('abessive', 'matta')]:
+        nominal_forms['infinitives/third/{}/active'.format(case)] = present + h(ending)
+        nominal_forms['infinitives/third/{}/passive'.format(case)] = MISSING_FORM
+    for slot, form in nominal_forms.items():
+        forms['nominal_forms/' + slot] = form
+    assert set(forms) == set(VERB_SLOTS)
+    return forms
+
+
+def _sanoa(w):
+    present = w.lemma[:-1]
+    weak = w.weaken(present)
+    return VerbStems(
+        present=present, present_weak=weak, past=present + 'i', past_weak=weak + 'i',
+        conditional=present + 'isi', imperative=present,
+        past_participle=present + w.h('nut'), passive=weak + 'tt', passive_weak=weak + 't')
+
+
+def _muistaa(w, past=None, past_weak=None):
+    present = w.lemma[:-1]
+    weak = w.weaken(present)
+    past = past or w.lemma[:-2] + 'i'
+    return VerbStems(
+        present=present, present_weak=weak, past=past, past_weak=past_weak or w.weaken(past),
+        conditional=present + 'isi', imperative=present,
+        past_participle=present + w.h('nut'), passive=weak[:-1] + 'ett',
+        passive_weak=weak[:-1] + 'et')
+
+
+def _huutaa(w):
+    past = w.lemma[:-3] + 'si'
+    return _muistaa(w, past=past, past_weak=past)
+
+
+def _kaivaa(w):
+    return _muistaa(w, past=w.lemma[:-2] + w.h('oi'))
+
+
+def _laskea(w, past=None, past_weak=None):
+    present = w.lemma[:-1]
+    weak = w.weaken(present)
+    past = past or w.lemma[:-2] + 'i'
+    return VerbStems(
+        present=present, present_weak=weak, past=past, past_weak=past_weak or w.weaken(past),
+        conditional=w.lemma[:-2] + 'isi', imperative=present,
+        past_participle=present + w.h('nut'), passive=weak + 'tt', passive_weak=weak + 't')
+
+
+def _tuntea(w):
+    past = w.lemma[:-3] + 'si'
+    return _laskea(w, past=past, past_weak=past)
+
+
+def _sallia(w):
+    present = w.lemma[:-1]
+    weak = w.weaken(present)
+    return VerbStems(
+        present=present, present_weak=weak, past=present, past_weak=weak,
+        conditional=present[:-1] + 'isi', imperative=present,
+        past_participle=present + w.h('nut'), passive=weak + 'tt', passive_weak=weak + 't')
+
+
+def _monosyllabic(w, past):
+    present = w.lemma[:-2]
+    return VerbStems(
+        present=present, past=past, conditional=past + 'si', imperative=present,
+        past_participle=present + w.h('nut'), passive=present + 't',
+        passive_weak=w.lemma[:-1])
+
+
+def _voida(w):
+    return _monosyllabic(w, w.lemma[:-2])
+
+
+def _saada(w):
+    return _monosyllabic(w, w.lemma[:-3] + 'i')
+
+
+def _juoda(w):
+    present = w.lemma[:-2]
+    return _monosyllabic(w, present[:-2] + present[-1] + 'i')
+
+
+def _kayda(w):
+    return _monosyllabic(w, w.lemma[:-3] + 'vi')
+
+
+def _rohkaista(w):
+    present = w.strengthen(w.lemma[:-2]) + 'e'
+    return VerbStems(
+        present=present, past=present[:-1] + 'i', conditional=present[:-1] + 'isi',
+        imperative=w.lemma[:-2], past_participle=w.lemma[:-2] + w.h('sut'),
+        passive=w.lemma[:-1])
+
+
+def _tulla(w):
+    present = w.strengthen(w.lemma[:-2]) + 'e'
+    return VerbStems(
+        present=present, past=present[:-1] + 'i', conditional=present[:-1] + 'isi',
+        imperative=w.lemma[:-2], past_participle=w.lemma[:-1] + w.h('ut'),
+        passive=w.lemma[:-2] + 't', passive_weak=w.lemma[:-1])
+
+
+def _valita(w, present_ending='tse'):
+    present = w.strengthen(w.lemma[:-2]) + present_ending
+    return VerbStems(
+        present=present, past=present[:-1] + 'i', conditional=present[:-1] + 'isi',
+        imperative=w.lemma[:-1], past_participle=w.lemma[:-2] + w.h('nnut'),
+        passive=w.lemma[:-1] + 't', passive_weak=w.lemma[:-1])
+
+
+def _juosta(w):
+    present = w.lemma[:-3] + 'kse'
+    return VerbStems(
+        present=present, past=present[:-1] + 'i', conditional=present[:-1] + 'isi',
+        imperative=w.lemma[:-2], past_participle=w.lemma[:-2] + w.h('sut'),
+        passive=w.lemma[:-1])
+
+
+def _nahda(w):
+    present = w.lemma[:-3] + 'ke'
+    weak = w.lemma[:-3] + 'e'
+    return VerbStems(
+        present=present, present_weak=weak, past=present[:-1] + 'i', past_weak=weak[:-1] + 'i',
+        conditional=present[:-1] + 'isi', imperative=w.lemma[:-2],
+        past_participle=w.lemma[:-2] + w.h('nut'), passive=w.lemma[:-2] + 't',
+        passive_weak=w.lemma[:-1])
+
+
+def _vanheta(w):
+    return _valita(w, present_ending='ne')
+
+
+def _salata(w):
+    strong = w.strengthen(w.lemma[:-2])
+    return VerbStems(
+        present=strong + strong[-1], past=strong + 'si', conditional=strong + 'isi',
+        imperative=w.lemma[:-1], past_participle=w.lemma[:-2] + w.h('nnut'),
+        passive=w.lemma[:-1] + 't', passive_weak=w.lemma[:-1])
+
+
+def _selvita(w):
+    strong = w.strengthen(w.lemma[:-2])
+    present = strong + w.h('a')
+    return VerbStems(
+        present=present, past=strong + 'si', conditional=present + 'isi',
+        imperative=w.lemma[:-1], past_participle=w.lemma[:-2] + w.h('nnut'),
+        passive=w.lemma[:-1] + 't', passive_weak=w.lemma[:-1])
+
+
+VERB_TYPES = {
+    '52': _sanoa, '53': _muistaa, '54': _huutaa, '55': _muistaa, '56': _kaivaa,
+    '57': _kaivaa, '58': _laskea, '59': _tuntea, '60': _laskea, '61': _sallia,
+    '62': _voida, '63': _saada, '64': _juoda, '65': _kayda, '66': _rohkaista,
+    '67': _tulla, '68': _voida, '69': _valita, '70': _juosta, '71': _nahda,
+    '72': _vanheta, '73': _salata, '74': _selvita, '75': _selvita, '76': _huutaa,
+}
@@ -0,0 +1,61 @@
+"""
+The slots of the noun and verb paradigms, given as the paths of the
+leaf elements in the tables created by table_parsing.
+The slots are listed in the order the elements appear in the tables.
+"""
+
+MISSING_FORM = '—'
+
+NOUN_CASES = ['nominative', 'genitive', 'partitive', 'inessive', 'elative',
+              'illative', 'adessive', 'ablative', 'allative', 'essive',
+              'translative', 'instructive', 'abessive', 'comitative']
+
+NOUN_SLOTS = tuple(
+    ['nominative/singular', 'nominative/plural',
+     'accusative/nominative/singular', 'accusative/nominative/plural',
+     'accusative/genitive'] +
+    ['{}/{}'.format(case, number)
+     for case in NOUN_CASES[1:] for number in ['singular', 'plural']])
+
+VERB_TENSES = [
+    ('indicative_mood', ['present', 'perfect', 'past', 'pluperfect']),
+    ('conditional_mood', ['present', 'perfect']),
+    ('imperative_mood', ['present', 'perfect']),
+    ('potential_mood', ['present', 'perfect'])]
+
+VERB_PERSONS = ['singular/first', 'singular/second', 'singular/third',
+                'plural/first', 'plural/second', 'plural/third', 'passive']
+
+VERB_NOMINAL_SLOTS = [
+    'infinitives/first',
+    'infinitives/long_first',
+    'infinitives/second/inessive/active',
+    'infinitives/second/inessive/passive',
+    'infinitives/second/instructive/active',
+    'infinitives/second/instructive/passive'] + [
+    'infinitives/third/{}/{}'.format(case, voice)
+    for case in ['inessive', 'elative', 'illative',
+                 'adessive', 'abessive', 'instructive']
+    for voice in ['active', 'passive']] + [
+    'infinitives/fourth/nominative',
+    'infinitives/fourth/partitive',
+    'infinitives/fifth',
+    'participles/present/active',
+    'participles/present/passive',
+    'participles/past/active',
+    'participles/past/passive',
+    'participles/agent',
+    'participles/negative']
+
+VERB_SLOTS = tuple(
+    ['{}/{}/{}/{}'.format(mood, tense, feeling, person)
+     for mood, tenses in VERB_TENSES
+     for tense in tenses
+     for feeling in ['positive', 'negative']
+     for person in VERB_PERSONS] +
+    ['nominal_forms/{}'.format(slot) for slot in VERB_NOMINAL_SLOTS])
+
+PARADIGM_SLOTS = {
+    'noun': NOUN_SLOTS,
+    'verb': VERB_SLOTS,
+}
@@ -0,0 +1,110 @@
+"""
+Index of the sections in a (part of an) article.
+
+All header tags are visited once, in document order, and each section is
+closed by the next header on the same or a higher level. Later parsing
+stages can use the index to jump straight to the sections they need
+instead of searching the whole soup again.
+"""
+import re
+
+import logging
+
+from susaki.wiktionary.wiki_parsing import util
+
+logger = logging.getLogger(__name__)
+
+HEADER_PATTERN = re.compile(r'^h\d$')
+
+POSSIBLE_WORD_CLASSES = ('Verb|Noun|Adjective|Numeral|Pronoun|Adverb|'
+                         'Suffix|Conjunction|Determiner|Exclamation|'
+                         'Preposition|Postposition|Prefix|Abbreviation|Particle|'
+                         'Contraction|Interjection|Phrase|Proper noun')
+POS_PATTERN = re.compile(POSSIBLE_WORD_CLASSES)
+
+SECTION_KINDS = [
+    ('pos', POS_PATTERN),
+    ('declension', re.compile('^Declension')),
+    ('conjugation', re.compile('^Conjugation')),
+]
+
+
+class Section:
+    """
+    A single section of the soup.
+    header: the header tag starting the section
+    end: the header tag ending the section, None if it runs to the end
+    """
+    __slots__ = ['header', 'level', 'title', 'kind', 'end', 'parent']
+
+    def __init__(self, header, level, title, kind, parent):
+        self.header = header
+        self.level = level
+        self.title = title
+        self.kind = kind
+        self.end = None
+        self.parent = parent
+
+    def __repr__(self):
+        return 'Section(h{}, {!r}, {})'.format(self.level, self.title, self.kind)
+
+
+def section_kind(title):
+    if title is None:
+        return None
+    for kind, pattern in SECTION_KINDS:
+        if pattern.search(title):
+            return kind
+    return None
+
+
+class SectionIndex:
+    """Index of all sections in a soup, built in a single pass"""
+
+    def __init__(self, soup):
+        self.soup = soup
+        self.sections = []
+        self._by_kind = {kind: [] for kind, _ in SECTION_KINDS}
+        self._subsection_ranges = {}
+        self._build()
+
+    def _build(self):
+        open_sections = []
+        for header in self.soup.find_all(HEADER_PATTERN):
+            level = int(header.name[1])
+            while open_sections and open_sections[-1].level >= level:
+                closed = open_sections.pop()
+                self._close(closed)
+                if closed.header.parent is header.parent:
+                    closed.end = header
+            headline = header.find('span', {'class': 'mw-headline'})
+            title = headline.string if headline else None
+            kind = section_kind(title) if headline else None
+            parent = open_sections[-1] if open_sections else None
+            section = Section(header, level, title, kind, parent)
+            self._subsection_ranges[section] = len(self.sections) + 1
+            self.sections.append(section)
+            if kind:
+                self._by_kind[kind].append(section)
+            open_sections.append(section)
+        for section in open_sections:
+            self._close(section)
+        logger.debug('Indexed {} sections'.format(len(self.sections)))
+
+    def _close(self, section):
+        # The nested sections are the ones indexed since the section was opened
+        start = self._subsection_ranges[section]
+        self._subsection_ranges[section] = (start, len(self.sections))
+
+    def sections_of_kind(self, kind):
+        """Returns all sections of the given kind in document order"""
+        return self._by_kind[kind]
+
+    def subsections(self, section):
+        """Returns all sections nested (at any depth) inside section"""
+        start, stop = self._subsection_ranges[section]
+        return self.sections[start:stop]
+
+    def extract(self, section):
+        """Returns a new soup containing the given section"""
+        return util.copy_soup_between(section.header, section.end)
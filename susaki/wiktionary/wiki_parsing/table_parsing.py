@@ -1,3 +1,7 @@
+"""
+Parsing of the html inflection tables into xml. Like article_parsing, the
+functions keep no state and only read the table soup, so they are thread-safe.
+"""
 import re
 
 import logging
@@ -1,4 +1,6 @@
-from bs4 import BeautifulSoup
+import copy
+
+from bs4 import BeautifulSoup, Tag
 import re
 import logging
 
@@ -32,6 +34,81 @@ def extract_soup_between(from_tag, to_tag, soup, parser='html.parser'):
     return new_soup
 
 
+def copy_soup_between(from_tag, to_tag):
+    """
+    Same as extract_soup_between, but the tags are copied into the new soup
+    instead of being serialized and parsed again.
+    """
+    new_soup = BeautifulSoup('', 'html.parser')
+    next_ = from_tag
+    while next_ is not None and next_ is not to_tag:
+        new_soup.append(copy.copy(next_))
+        next_ = next_.next_sibling
+    return new_soup
+
+
+def text_without(tag, excluded):
+    """
+    Returns the text of the tag, leaving out the text inside the excluded
+    descendant. The soup isn't modified, so it can be shared between threads.
+    """
+    if excluded is None:
+        return tag.text
+    parts = []
+    for string in tag.strings:
+        if not any(parent is excluded for parent in string.parents):
+            parts.append(string)
+    return ''.join(parts)
+
+
+def decompose(soup):
+    """
+    Destroys the soup and all its elements. Same as soup.decompose(), except
+    that it walks the contents instead of the next_element chain, which
+    doesn't reach the top level elements of a soup parsed by html.parser.
+    """
+    stack = [soup]
+    while stack:
+        element = stack.pop()
+        if isinstance(element, Tag):
+            stack.extend(element.contents)
+        element.__dict__.clear()
+        element._decomposed = True
+
+
+class SoupScope:
+    """
+    Owns the intermediate soups of a parsing step and decomposes them when
+    the step is done, even if it fails. A soup is a web of parent and
+    sibling references, so without this it is only freed by the cyclic
+    garbage collector, and the heap of a batch run keeps growing until it
+    runs.
+    """
+
+    def __init__(self):
+        self._soups = []
+
+    def own(self, soup):
+        """Registers the soup for teardown and returns it"""
+        self._soups.append(soup)
+        return soup
+
+    def release(self, soup):
+        """Decomposes the soup right away"""
+        decompose(soup)
+        self._soups.remove(soup)
+
+    def close(self):
+        while self._soups:
+            decompose(self._soups.pop())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
 def clean_text(text):
     """
     Removes line break characters and unneeded spaces from the text
@@ -0,0 +1,460 @@
+"""
+Parsing of articles given as raw wikitext instead of rendered html.
+
+The output has the same format as the one created by article_parsing, so
+the two can be used interchangeably. The structure is read directly from
+the headings, the definition lists and the arguments of the fi-decl and
+fi-conj templates, so the much larger rendered html never has to be
+downloaded.
+"""
+import re
+
+import logging
+
+from lxml import etree
+
+from susaki.wiktionary.wiki_parsing import util, table_parsing, kotus, paradigm_generation
+from susaki.wiktionary.wiki_parsing.section_index import POS_PATTERN
+
+logger = logging.getLogger(__name__)
+
+HEADING_PATTERN = re.compile(r'^(={2,6})\s*(.+?)\s*\1\s*$', re.MULTILINE)
+LINK_PATTERN = re.compile(r'\[\[(?:[^\[\]|]*\|)?([^\[\]|]*)\]\]')
+REF_PATTERN = re.compile(r'<ref[^>/]*/>|<ref[^>]*>.*?</ref>', re.DOTALL)
+COMMENT_PATTERN = re.compile(r'<!--.*?-->', re.DOTALL)
+HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
+QUOTES_PATTERN = re.compile(r"'{2,}")
+CONSONANTS_PATTERN = re.compile(r'^[bcdfghjklmnpqrstvwxz]+$')
+INFLECTION_TEMPLATE_PATTERN = re.compile(r'^fi-(decl|conj)-(.+)$')
+
+
+########################################
+# Entry functions
+########################################
+def parse_article(raw_article, word, language='Finnish', parse_tables=True):
+    """
+    raw_article: wikitext of the whole article for the word.
+    word: the word this article is about
+    language: source language of the word.
+    Return: root object of the parsed xml tree
+    """
+    return parse_article_languages(raw_article, word, [language], parse_tables)
+
+
+def parse_article_languages(raw_article, word, languages, parse_tables=True):
+    """
+    Same as article_parsing.parse_article_languages, but for raw wikitext.
+    """
+    logger.info('Starting wikitext parsing for the word "{}"'.format(word))
+    article_root = etree.Element('Article')
+    word_element = etree.SubElement(article_root, 'Word')
+    word_element.text = word
+    languages_root = etree.SubElement(article_root, 'Languages')
+
+    sections = extract_sections(raw_article)
+    language_parts = extract_language_parts(sections, languages)
+    if not language_parts:
+        raise LookupError(
+            'No explanations exists for the language: {}'.format(', '.join(languages)))
+
+    for language in languages:
+        try:
+            language_section = language_parts[language]
+        except KeyError:
+            logger.debug('Skipping {}, not present in the article'.format(language))
+            continue
+        language_element = etree.SubElement(languages_root, language)
+        pos_parts_root = etree.SubElement(language_element, 'POS-parts')
+        for pos_section in extract_pos_parts(sections, language_section):
+            pos_parts_root.append(parse_POS(pos_section, word, parse_tables))
+
+    logger.info('Finished wikitext parsing for the word "{}"'.format(word))
+    return article_root
+
+
+########################################
+# Section extraction
+########################################
+class WikiSection:
+    """
+    A section of the wikitext.
+    text: the whole section including its subsections
+    body: the text between the heading and the next heading
+    """
+    __slots__ = ['level', 'title', 'start', 'body_end', 'end', 'text', 'body']
+
+    def __init__(self, level, title, start, body_end):
+        self.level = level
+        self.title = title
+        self.start = start
+        self.body_end = body_end
+        self.end = None
+        self.text = None
+        self.body = None
+
+    def contains(self, other):
+        return self.start <= other.start and other.end <= self.end
+
+
+def extract_sections(wikitext):
+    """
+    Splits the wikitext into sections in a single pass over the headings.
+    Every section ends at the next heading on the same or a higher level.
+    """
+    headings = list(HEADING_PATTERN.finditer(wikitext))
+    sections = []
+    open_sections = []
+    for i, heading in enumerate(headings):
+        level = len(heading.group(1))
+        try:
+            body_end = headings[i + 1].start()
+        except IndexError:
+            body_end = len(wikitext)
+        while open_sections and open_sections[-1].level >= level:
+            open_sections.pop().end = heading.start()
+        section = WikiSection(level, heading.group(2), heading.end(), body_end)
+        sections.append(section)
+        open_sections.append(section)
+    for section in open_sections:
+        section.end = len(wikitext)
+    for section in sections:
+        section.text = wikitext[section.start:section.end]
+        section.body = wikitext[section.start:section.body_end]
+    logger.debug('Found {} sections'.format(len(sections)))
+    return sections
+
+
+def extract_language_parts(sections, languages):
+    """Returns a dictionary mapping each language found to its section"""
+    return {section.title: section for section in sections
+            if section.level == 2 and section.title in languages}
+
+
+def extract_pos_parts(sections, language_section):
+    pos_sections = [section for section in sections
+                    if language_section.contains(section) and
+                    section is not language_section and
+                    POS_PATTERN.search(section.title)]
+    if not pos_sections:
+        raise LookupError('No POS-parts present')
+    if len({section.level for section in pos_sections}) != 1:
+        raise ValueError('The POS-parts are placed at different header levels')
+    return pos_sections
+
+
+########################################
+# POS parsing
+########################################
+def parse_POS(pos_section, word, parse_table=True):
+    pos_root = etree.Element(pos_section.title.replace(' ', '_'))
+    translations_root = etree.SubElement(pos_root, 'Translations')
+    for translation in extract_translations(pos_section.body):
+        translations_root.append(create_translation_tree(*translation))
+    if parse_table:
+        table_type = pos_section.title.replace(' ', '_').lower()
+        table_element = parse_inflection_template(pos_section.text, word, table_type)
+        if table_element is not None:
+            pos_root.append(table_element)
+    return pos_root
+
+
+def extract_translations(pos_body):
+    """
+    Reads the definition list of a POS-section.
+    Returns a list of (text, examples) where examples is a list of
+    (text, translation) pairs. The translation is None for quotations.
+    """
+    translations = []
+    for line in pos_body.splitlines():
+        marker = re.match(r'^#[#:*]*', line)
+        if not marker:
+            continue
+        marker = marker.group(0)
+        content = line[len(marker):].strip()
+        if marker == '#':
+            translations.append([render_text(content), []])
+        elif not translations:
+            continue
+        elif marker == '##':
+            translations[-1][0] = ' '.join([translations[-1][0], render_text(content)])
+        elif marker in ('#:', '#*:'):
+            translations[-1][1].append(parse_example_line(content))
+        elif marker in ('#::', '#*::'):
+            examples = translations[-1][1]
+            if examples:
+                examples[-1] = (examples[-1][0], render_text(content))
+    if not translations:
+        raise LookupError('No translations present')
+    return [(text, examples) for text, examples in translations]
+
+
+def parse_example_line(content):
+    for start, end, inner in find_templates(content):
+        args = split_template_arguments(inner)
+        if args[0].strip() in ('ux', 'uxi', 'usex'):
+            positional, named = _split_named(args[1:])
+            text = render_text(positional[1]) if len(positional) > 1 else ''
+            translation = named.get('t', named.get('translation'))
+            if translation is None and len(positional) > 2:
+                translation = positional[2]
+            return text, render_text(translation) if translation else None
+    return render_text(content), None
+
+
+def create_translation_tree(text, examples):
+    root = etree.Element('Translation')
+    if examples:
+        examples_root = etree.SubElement(root, 'Examples')
+        for example_text, example_translation in examples:
+            example_root = etree.SubElement(examples_root, 'Example')
+            if example_translation is not None:
+                translation_element = etree.SubElement(example_root, 'Translation')
+                translation_element.text = example_translation
+            text_element = etree.SubElement(example_root, 'Text')
+            text_element.text = example_text
+    text_element = etree.SubElement(root, 'Text')
+    text_element.text = text
+    return root
+
+
+########################################
+# Inflection templates
+########################################
+def find_inflection_template(pos_text):
+    """
+    Returns (kind, model word, positional arguments, named arguments) of the
+    first fi-decl or fi-conj template in the text.
+    Raises a LookupError if no inflection template is present.
+    """
+    for start, end, inner in find_templates(pos_text):
+        args = split_template_arguments(inner)
+        match = INFLECTION_TEMPLATE_PATTERN.match(args[0].strip())
+        if match:
+            positional, named = _split_named(args[1:])
+            return match.group(1), match.group(2), positional, named
+    raise LookupError('No inflection table present')
+
+
+def template_gradation(positional):
+    """
+    The templates of gradating types give the strong and weak grade as the
+    second and third argument (e.g. {{fi-decl-valo|ta|kk|k|o|a}}).
+    """
+    if len(positional) < 3:
+        return 'no'
+    strong, weak = positional[1].strip(), positional[2].strip()
+    if (strong != weak and CONSONANTS_PATTERN.match(strong) and
+            CONSONANTS_PATTERN.match(weak)):
+        return '{}-{}'.format(strong, weak)
+    return 'no'
+
+
+def parse_inflection_template(pos_text, word, table_type='noun'):
+    """
+    Creates the inflection table from the arguments of the fi-decl or
+    fi-conj template. The forms are generated by paradigm_generation; if the
+    type can't be generated only the meta information is returned.
+    """
+    try:
+        kind, model_word, positional, named = find_inflection_template(pos_text)
+    except LookupError:
+        logger.debug("Didn't find an inflection template")
+        return None
+    try:
+        kotus_type = kotus.kotus_type_of(model_word)
+    except LookupError as err:
+        logger.debug(str(err))
+        return None
+    gradation = template_gradation(positional)
+    try:
+        return paradigm_generation.generate_inflection_table(
+            word, kotus_type, gradation, table_type)
+    except ValueError as err:
+        logger.debug('Could not generate the table of {}: {}'.format(word, err))
+    inflection_root = etree.Element('Inflection_Table')
+    inflection_root.append(
+        table_parsing.create_meta_tree(word, kotus_type, model_word, gradation))
+    return inflection_root
+
+
+########################################
+# Templates and text rendering
+########################################
+def find_templates(text):
+    """
+    Returns (start, end, inner text) of all top level templates in the text.
+    """
+    templates = []
+    depth = 0
+    start = None
+    i = 0
+    while i < len(text) - 1:
+        pair = text[i:i + 2]
+        if pair == '{{':
+            if depth == 0:
+                start = i
+            depth += 1
+            i += 2
+        elif pair == '}}' and depth > 0:
+            depth -= 1
+            i += 2
+            if depth == 0:
+                templates.append((start, i, text[start + 2:i - 2]))
+        else:
+            i += 1
+    return templates
+
+
+def split_template_arguments(inner):
+    """Splits the inner text of a template on the pipes not nested in templates or links"""
+    args = []
+    depth = 0
+    current = []
+    i = 0
+    while i < len(inner):
+        pair = inner[i:i + 2]
+        if pair in ('{{', '[['):
+            depth += 1
+            current.append(pair)
+            i += 2
+        elif pair in ('}}', ']]') and depth > 0:
+            depth -= 1
+            current.append(pair)
+            i += 2
+        elif inner[i] == '|' and depth == 0:
+            args.append(''.join(current))
+            current = []
+            i += 1
+        else:
+            current.append(inner[i])
+            i += 1
+    args.append(''.join(current))
+    return args
+
+
+def _split_named(args):
+    positional = []
+    named = {}
+    for arg in args:
+        name, sep, value = arg.partition('=')
+        if sep and re.match(r'^\s*[\w-]+\s*$', name):
+            named[name.strip()] = value
+        else:
+            positional.append(arg)
+    return positional, named
+
+
+INFLECTION_TAGS = {
+    'nom': 'nominative', 'gen': 'genitive', 'par': 'partitive',
+    'acc': 'accusative', 'ine': 'inessive', 'ela': 'elative',
+    'ill': 'illative', 'ade': 'adessive', 'abl': 'ablative',
+    'all': 'allative', 'ess': 'essive', 'tra': 'translative',
+    'ins': 'instructive', 'abe': 'abessive', 'com': 'comitative',
+    's': 'singular', 'p': 'plural', '1': 'first-person',
+    '2': 'second-person', '3': 'third-person', 'pres': 'present',
+    'past': 'past', 'ind': 'indicative', 'cond': 'conditional',
+    'impr': 'imperative', 'potn': 'potential', 'act': 'active',
+    'pass': 'passive', 'part': 'participle', 'inf': 'infinitive',
+}
+
+
+def _render_link(positional, named):
+    if len(positional) > 2 and positional[2].strip():
+        return positional[2]
+    return positional[1] if len(positional) > 1 else ''
+
+
+def _render_label(positional, named):
+    """Labels are joined by commas, unless separated by _, and or or"""
+    separators = {'_': ' ', 'and': ' and ', 'or': ' or '}
+    rendered = []
+    separator = None
+    for label in positional[1:]:
+        label = label.strip()
+        if label in separators:
+            separator = separators[label]
+        elif label:
+            if rendered:
+                rendered.append(separator or ', ')
+            rendered.append(label)
+            separator = None
+    return '({})'.format(''.join(rendered))
+
+
+def _render_qualifier(positional, named):
+    return '({})'.format(', '.join(positional))
+
+
+def _render_first(positional, named):
+    return positional[0] if positional else ''
+
+
+def _render_last(positional, named):
+    return positional[-1] if positional else ''
+
+
+def _render_inflection_of(positional, named):
+    lemma = positional[1] if len(positional) > 1 else ''
+    tags = [INFLECTION_TAGS.get(tag.strip(), tag.strip())
+            for tag in positional[3:] if tag.strip() not in ('', ';')]
+    return '{} form of {}.'.format(' '.join(tags).capitalize(), lemma)
+
+
+def _render_fi_form_of(positional, named):
+    tags = [named.get(key, '').strip() for key in ('case', 'pl')]
+    return '{} form of {}.'.format(' '.join(tag for tag in tags if tag).capitalize(),
+                                    positional[0] if positional else '')
+
+
+def _render_usage_example(positional, named):
+    return positional[1] if len(positional) > 1 else ''
+
+
+TEMPLATE_RENDERERS = {name: renderer for names, renderer in [
+    (['l', 'll', 'm', 'link', 'mention', 'l-self', 'term'], _render_link),
+    (['lb', 'lbl', 'label', 'tlb', 'term-label'], _render_label),
+    (['q', 'qual', 'qualifier', 'i', 'qf', 'gloss', 'gl', 'sense', 's'], _render_qualifier),
+    (['non-gloss definition', 'n-g', 'ngd', 'non-gloss'], _render_first),
+    (['w', 'taxlink'], _render_last),
+    (['inflection of', 'infl of'], _render_inflection_of),
+    (['fi-form of'], _render_fi_form_of),
+    (['ux', 'uxi', 'usex'], _render_usage_example),
+] for name in names}
+
+
+def render_template(inner):
+    args = split_template_arguments(inner)
+    name = args[0].strip()
+    try:
+        renderer = TEMPLATE_RENDERERS[name]
+    except KeyError:
+        # Templates that don't add to the meaning (e.g. headword lines and
+        # references) are dropped
+        return ''
+    positional, named = _split_named(args[1:])
+    positional = [_render_inline(arg) for arg in positional]
+    named = {key: _render_inline(value) for key, value in named.items()}
+    return renderer(positional, named)
+
+
+def _render_inline(text):
+    parts = []
+    position = 0
+    for start, end, inner in find_templates(text):
+        parts.append(text[position:start])
+        parts.append(render_template(inner))
+        position = end
+    parts.append(text[position:])
+    text = ''.join(parts)
+    text = LINK_PATTERN.sub(r'\1', text)
+    return text
+
+
+def render_text(wikitext):
+    """Renders a line of wikitext into plain text"""
+    text = COMMENT_PATTERN.sub('', wikitext)
+    text = REF_PATTERN.sub('', text)
+    text = _render_inline(text)
+    text = QUOTES_PATTERN.sub('', text)
+    text = HTML_TAG_PATTERN.sub('', text)
+    return util.clean_text(text)
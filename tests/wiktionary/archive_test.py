@@ -0,0 +1,110 @@
+'''
+Tests for the local article archive.
+'''
+import os
+
+import pytest
+
+from susaki.wiktionary import archive
+from susaki.wiktionary.lookup import Lookup
+from susaki.wiktionary.wiki_parsing import article_parsing, wikitext_parsing
+
+PARSING_TEST_DIR = os.path.join(os.path.dirname(__file__), 'parsing_test')
+RAW_PAGES_DIR = os.path.join(PARSING_TEST_DIR, 'raw_pages')
+WIKITEXT_DIR = os.path.join(PARSING_TEST_DIR, 'wikitext_parsing_data')
+
+
+@pytest.fixture
+def raw_pages():
+    return {word: raw for word, raw, _ in archive.read_article_directory(RAW_PAGES_DIR)}
+
+
+@pytest.fixture
+def archive_path(tmpdir, raw_pages):
+    path = str(tmpdir.join('articles.archive'))
+    archive.build_archive(path, raw_pages.items())
+    return path
+
+
+def test_articles_are_read_back(archive_path, raw_pages):
+    with archive.ArchiveReader(archive_path) as reader:
+        assert len(reader) == len(raw_pages)
+        assert reader.article_format == 'html'
+        for word, raw_article in raw_pages.items():
+            assert reader.get(word) == raw_article
+        assert 'qwerty' not in reader
+
+
+def test_dictionary_codec_archive(tmpdir, raw_pages):
+    path = str(tmpdir.join('dictionary.archive'))
+    archive.build_archive(path, raw_pages.items(), codec_name='zlib-dict', sample_size=5)
+    with archive.ArchiveReader(path) as reader:
+        assert reader.codec.name == 'zlib-dict'
+        assert len(reader.codec.dictionary) > 0
+        for word, raw_article in raw_pages.items():
+            assert reader.get(word) == raw_article
+
+
+def test_archive_is_smaller_than_the_pages(archive_path, raw_pages):
+    size = sum(len(raw.encode('utf-8')) for raw in raw_pages.values())
+    assert os.path.getsize(archive_path) < size / 3
+
+
+def test_connector(archive_path):
+    connector = archive.ArchiveConnector(archive_path)
+    assert connector.parser is article_parsing
+    with pytest.raises(LookupError):
+        connector.collect_raw_article('qwerty')
+    result = Lookup(connector, connector.parser).lookup('koira')
+    assert result['pos'][0]['translations'][0]['text'] == 'dog'
+
+
+def test_wikitext_archive(tmpdir):
+    path = str(tmpdir.join('wikitext.archive'))
+    with archive.ArchiveWriter(path, 'wikitext') as writer:
+        with open(os.path.join(WIKITEXT_DIR, 'input_koira.wikitext')) as f:
+            writer.add('koira', f.read())
+    connector = archive.ArchiveConnector(path)
+    assert connector.parser is wikitext_parsing
+    assert '{{fi-decl-koira' in connector.collect_raw_article('koira')
+
+
+def test_invalid_archives(tmpdir, archive_path):
+    not_archive = tmpdir.join('not.archive')
+    not_archive.write('<html></html>' * 10)
+    with pytest.raises(archive.ArchiveError):
+        archive.ArchiveReader(str(not_archive))
+    truncated = tmpdir.join('truncated.archive')
+    with open(archive_path, 'rb') as f:
+        truncated.write_binary(f.read()[:-10])
+    with pytest.raises(archive.ArchiveError):
+        archive.ArchiveReader(str(truncated))
+
+
+def test_append_replaces_the_archive(tmpdir, raw_pages):
+    path = str(tmpdir.join('dictionary.archive'))
+    archive.build_archive(path, raw_pages.items(), codec_name='zlib-dict', sample_size=5)
+    connector = archive.ArchiveConnector(path)
+    with archive.ArchiveWriter.append(path) as writer:
+        writer.add('koira', raw_pages['kuu'], 2)
+        writer.remove('ilma')
+    # The open map still reads the old file
+    assert connector.collect_raw_article('koira') == raw_pages['koira']
+    connector.reload()
+    assert connector.collect_raw_article('koira') == raw_pages['kuu']
+    assert connector.collect_raw_article('olla') == raw_pages['olla']
+    with pytest.raises(LookupError):
+        connector.collect_raw_article('ilma')
+    assert os.listdir(str(tmpdir)) == ['dictionary.archive']
+
+
+def test_failed_append_keeps_the_archive(archive_path, raw_pages):
+    with open(archive_path, 'rb') as f:
+        content = f.read()
+    with pytest.raises(RuntimeError):
+        with archive.ArchiveWriter.append(archive_path) as writer:
+            writer.add('koira', raw_pages['kuu'])
+            raise RuntimeError('Crashed while appending')
+    with open(archive_path, 'rb') as f:
+        assert f.read() == content
+    assert not os.path.exists(archive_path + '.tmp')
@@ -0,0 +1,67 @@
+'''
+Tests for the compression codecs of stored articles.
+'''
+import glob
+import os
+
+import pytest
+from lxml import etree
+
+from susaki.wiktionary import codec
+
+PARSING_TEST_DIR = os.path.join(os.path.dirname(__file__), 'parsing_test')
+
+
+def read_files(pattern):
+    paths = sorted(glob.glob(os.path.join(PARSING_TEST_DIR, pattern)))
+    return [open(path, 'rb').read() for path in paths]
+
+
+@pytest.fixture(scope='module')
+def raw_pages():
+    return read_files('raw_pages/*.html')
+
+
+@pytest.fixture(scope='module')
+def parsed_articles():
+    return [etree.tostring(etree.fromstring(xml))
+            for xml in read_files('article_parsing_data/output_*.xml')]
+
+
+def dictionary_codecs():
+    names = [codec.ZlibDictionaryCodec.name]
+    if codec.zstandard is not None:
+        names.append(codec.ZstdDictionaryCodec.name)
+    return names
+
+
+@pytest.mark.parametrize('codec_name', sorted(codec.CODECS))
+def test_round_trip(raw_pages, parsed_articles, codec_name):
+    if codec_name == codec.ZstdDictionaryCodec.name:
+        pytest.importorskip('zstandard')
+    dictionary = codec.train_dictionary(raw_pages + parsed_articles, codec_name)
+    article_codec = codec.create_codec(codec_name, dictionary)
+    for record in raw_pages + parsed_articles:
+        assert article_codec.decompress(article_codec.compress(record)) == record
+
+
+@pytest.mark.parametrize('codec_name', dictionary_codecs())
+def test_dictionary_beats_plain_zlib_on_unseen_records(raw_pages, parsed_articles, codec_name):
+    for records in [raw_pages, parsed_articles]:
+        training, unseen = records[:-2], records[-2:]
+        article_codec = codec.create_codec(codec_name, codec.train_dictionary(training, codec_name))
+        plain_size = sum(len(codec.ZlibCodec().compress(record)) for record in unseen)
+        dictionary_size = sum(len(article_codec.compress(record)) for record in unseen)
+        assert dictionary_size < plain_size
+
+
+def test_markup_dictionary_only_keeps_shared_segments():
+    samples = [b'<td class="shared">unique one</td>', b'<td class="shared">unique two</td>']
+    dictionary = codec.train_markup_dictionary(samples)
+    assert b'<td class="shared">' in dictionary
+    assert b'unique' not in dictionary
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        codec.create_codec('lzma')
@@ -8,11 +8,26 @@ import requests
 from requests_file import FileAdapter
 
 import os
+import re
+import threading
+import types
 from distutils import dir_util
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
 
-from susaki.wiktionary.connectors import HTMLConnector
+from lxml import etree
+
+from susaki.wiktionary.connectors import APIConnector, HTMLConnector, SectionConnector
+from susaki.wiktionary.throttling import RateLimiter
+from susaki.wiktionary.wiki_parsing import article_parsing
 from unittest.mock import patch
 
+RAW_PAGES_DIR = os.path.join(os.path.dirname(__file__), 'parsing_test', 'raw_pages')
+HEADER_PATTERN = re.compile(
+    r'<h(\d)><span class="mw-headline" id="[^"]*">(.*?)</span>'
+    r'<span class="mw-editsection">.*?section=(\d+)')
+
 
 @pytest.fixture
 def datadir(tmpdir, request):
@@ -67,3 +82,134 @@ class TestHTMLConnector:
             'file://' + page_path)
         result = connector.collect_raw_article('')
         assert type(result) is requests.models.Response
+
+
+class RecordingSession:
+    """Records the requested urls and answers them with an empty page"""
+
+    def __init__(self):
+        self.urls = []
+
+    def get(self, url, timeout=None):
+        self.urls.append(url)
+        return types.SimpleNamespace(status_code=200, headers={}, content=b'<api/>')
+
+
+def test_words_are_quoted_in_the_url():
+    session = RecordingSession()
+    rate_limiter = RateLimiter(rate=1000, burst=1000)
+    with pytest.raises(LookupError):
+        APIConnector(session, rate_limiter).collect_raw_article('R&B #1+')
+    HTMLConnector('Finnish', session=session, rate_limiter=rate_limiter)._collect_page('R&B #1+')
+    for url in session.urls:
+        query = parse_qs(urlsplit(url).query)
+        assert 'R&B #1+' in query.get('titles', []) + query.get('search', [])
+
+
+class FakeParseAPI:
+    """
+    Serves action=parse for the raw pages. shift renumbers the sections as if
+    a section had been added at the top of every page.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.shift = 0
+
+    def sections(self, title):
+        with open(os.path.join(RAW_PAGES_DIR, '{}.html'.format(title))) as f:
+            html = f.read()
+        headers = [(match.start(), int(match.group(1)), match.group(2), int(match.group(3)))
+                   for match in HEADER_PATTERN.finditer(html)]
+        return html, headers
+
+    def section_text(self, title, index):
+        html, headers = self.sections(title)
+        for i, (start, level, _, number) in enumerate(headers):
+            if number == index:
+                end = next((other[0] for other in headers[i + 1:] if other[1] <= level), len(html))
+                return html[start:end]
+
+    def handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                query = {name: values[0] for name, values in parse_qs(urlsplit(self.path).query).items()}
+                api.requests.append(query)
+                title = query['page']
+                if not os.path.exists(os.path.join(RAW_PAGES_DIR, '{}.html'.format(title))):
+                    body = '<api><error code="missingtitle" info="The page doesn\'t exist."/></api>'
+                elif query['prop'] == 'sections':
+                    _, headers = api.sections(title)
+                    body = '<api><parse title="{}"><sections>{}</sections></parse></api>'.format(
+                        title, ''.join('<s level="{}" line="{}" index="{}"/>'.format(
+                            level, escape(line), number + api.shift)
+                            for _, level, line, number in headers))
+                else:
+                    text = api.section_text(title, int(query['section']) - api.shift)
+                    body = '<api><parse title="{}" revid="7"><text xml:space="preserve">{}</text></parse></api>'.format(
+                        title, escape(text))
+                body = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/xml')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+        return Handler
+
+
+class TestSectionConnector:
+
+    @pytest.fixture
+    def api(self):
+        return FakeParseAPI()
+
+    @pytest.fixture
+    def connector(self, api):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), api.handler())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield SectionConnector('Finnish', rate_limiter=RateLimiter(rate=1000, burst=1000),
+                               api_url='http://127.0.0.1:{}/w/api.php'.format(server.server_address[1]))
+        server.shutdown()
+        server.server_close()
+
+    def parse(self, raw_article, word):
+        return etree.tostring(article_parsing.parse_article(raw_article, word))
+
+    def test_same_result_as_the_whole_article(self, connector):
+        sizes = {}
+        for word in ['kuu', 'koira', 'päästä']:
+            with open(os.path.join(RAW_PAGES_DIR, '{}.html'.format(word))) as f:
+                raw_article = f.read()
+            section, revision = connector.collect_revision(word)
+            assert revision == 7
+            assert self.parse(section, word) == self.parse(raw_article, word)
+            sizes[word] = len(section) / len(raw_article)
+        # kuu has eleven language sections
+        assert sizes['kuu'] < 0.7
+
+    def test_section_index_is_cached(self, connector, api):
+        connector.collect_raw_article('kuu')
+        connector.collect_raw_article('kuu')
+        assert [query['prop'] for query in api.requests] == ['sections', 'text|revid', 'text|revid']
+
+    def test_stale_section_index(self, connector, api):
+        connector.collect_raw_article('kuu')
+        api.shift = 1
+        api.requests.clear()
+        section = connector.collect_raw_article('kuu')
+        assert '>Finnish</span>' in section
+        assert [query['prop'] for query in api.requests] == ['text|revid', 'sections', 'text|revid']
+
+    def test_missing_page_and_language(self, connector):
+        with pytest.raises(LookupError):
+            connector.collect_raw_article('qwerty')
+        with pytest.raises(LookupError) as error:
+            article_parsing.parse_article(connector.collect_raw_article('hello'), 'hello')
+        assert 'No explanations exists for the language' in str(error.value)
@@ -0,0 +1,102 @@
+'''
+Tests for the random access to a multistream dump.
+'''
+import bz2
+import os
+from xml.sax.saxutils import escape, quoteattr
+
+import pytest
+
+from susaki.wiktionary import dump
+from susaki.wiktionary.lookup import Lookup
+from susaki.wiktionary.wiki_parsing import wikitext_parsing
+
+WIKITEXT_DIR = os.path.join(os.path.dirname(__file__), 'parsing_test', 'wikitext_parsing_data')
+
+
+def page_xml(title, text, revision_id, redirect=None):
+    redirect = '<redirect title={} />'.format(quoteattr(redirect)) if redirect else ''
+    return ('<page><title>{}</title><ns>0</ns><id>{}</id>{}<revision><id>{}</id>'
+            '<text bytes="{}" xml:space="preserve">{}</text></revision></page>\n').format(
+                escape(title), revision_id, redirect, revision_id, len(text), escape(text))
+
+
+def write_multistream(dump_path, index_path, pages, pages_per_stream=2):
+    """Writes a dump and its index in the layout of the Wikimedia dumps"""
+    index_lines = []
+    with open(dump_path, 'wb') as f:
+        f.write(bz2.compress(b'<mediawiki xml:lang="en"><siteinfo></siteinfo>\n'))
+        for start in range(0, len(pages), pages_per_stream):
+            offset = f.tell()
+            stream = pages[start:start + pages_per_stream]
+            data = ''.join(page_xml(*page) for page in stream)
+            if start + pages_per_stream >= len(pages):
+                data += '</mediawiki>\n'
+            f.write(bz2.compress(data.encode('utf-8')))
+            for page in stream:
+                index_lines.append('{}:{}:{}\n'.format(offset, page[2], page[0]))
+    with bz2.open(index_path, 'wt', encoding='utf-8') as f:
+        f.writelines(index_lines)
+
+
+@pytest.fixture
+def dump_files(tmpdir):
+    pages = []
+    for revision_id, word in enumerate(['koira', 'ilma', 'kuussa'], 1):
+        with open(os.path.join(WIKITEXT_DIR, 'input_{}.wikitext'.format(word))) as f:
+            pages.append((word, f.read(), revision_id))
+    pages += [('Koira', '', 4, 'koira'), ('Category:Finnish nouns', 'Nouns', 5),
+              ('a:b', '==English==\nR & D <b>', 6), ('loop', '', 7, 'loop')]
+    dump_path = str(tmpdir.join('wiktionary-multistream.xml.bz2'))
+    index_path = str(tmpdir.join('wiktionary-multistream-index.txt.bz2'))
+    write_multistream(dump_path, index_path, pages)
+    return dump_path, index_path, pages
+
+
+def test_title_map(tmpdir):
+    path = str(tmpdir.join('titles'))
+    entries = [('kuu', 10), ('Kuu', 20), ('ääni', 30), ('a', 40), ('kuussa', 50)]
+    assert dump.build_title_map(entries, path) == 5
+    titles = dump.TitleMap(path)
+    for title, offset in entries:
+        assert titles.get(title) == offset
+    assert titles.get('kuus') is None and titles.get('ö') is None and titles.get('') is None
+    assert list(titles.titles()) == ['Kuu', 'a', 'kuu', 'kuussa', 'ääni']
+
+
+def test_connector(dump_files):
+    dump_path, index_path, pages = dump_files
+    connector = dump.DumpConnector(dump_path, index_path)
+    assert connector.parser is wikitext_parsing
+    assert len(connector.titles) == len(pages)
+    for title, text, revision_id, *redirect in pages:
+        if not redirect:
+            assert connector.collect_revision(title) == (text, revision_id)
+    assert connector.collect_revision('Koira') == (pages[0][1], 1)
+    with pytest.raises(LookupError):
+        connector.collect_raw_article('qwerty')
+    with pytest.raises(LookupError):
+        connector.collect_raw_article('loop')
+    result = Lookup(connector, connector.parser).lookup('koira')
+    assert result['pos'][0]['translations'][0]['text'] == 'dog'
+
+
+def test_title_map_is_rebuilt_when_the_index_changes(dump_files):
+    dump_path, index_path, pages = dump_files
+    dump.DumpConnector(dump_path, index_path)
+    map_path = index_path + '.titles'
+    built = os.path.getmtime(map_path)
+    write_multistream(dump_path, index_path, pages[:1])
+    os.utime(index_path, (built + 10, built + 10))
+    assert len(dump.DumpConnector(dump_path, index_path).titles) == 1
+
+
+def test_truncated_dump(dump_files, tmpdir):
+    dump_path, index_path, _ = dump_files
+    with open(dump_path, 'rb') as f:
+        data = f.read()
+    truncated = tmpdir.join('truncated.xml.bz2')
+    truncated.write_binary(data[:-20])
+    connector = dump.DumpConnector(str(truncated), index_path)
+    with pytest.raises(dump.DumpError):
+        connector.collect_raw_article('loop')
@@ -0,0 +1,73 @@
+'''
+Tests for the local page-existence filters.
+'''
+import bz2
+import gzip
+
+import pytest
+
+from susaki.wiktionary import dump, existence, lookup
+from tests.wiktionary.lookup_test import RawPagesConnector
+
+
+@pytest.mark.parametrize('error_rate', [0.1, 0.01, 0.001])
+def test_false_positive_rate(error_rate):
+    titles = ['sana{}'.format(i) for i in range(5000)]
+    bloom_filter = existence.BloomFilter.from_titles(titles, error_rate)
+    assert all(title in bloom_filter for title in titles)
+    misses = ['puuttuva{}'.format(i) for i in range(20000)]
+    false_positives = sum(word in bloom_filter for word in misses)
+    assert false_positives / len(misses) < error_rate * 1.5
+    assert bloom_filter.error_rate() == pytest.approx(error_rate, rel=0.2)
+
+
+def test_save_and_load(tmpdir):
+    path = str(tmpdir.join('titles.bloom'))
+    existence.BloomFilter.from_titles(['koira', 'kuu', 'ääni']).save(path)
+    bloom_filter = existence.load_filter(path)
+    assert isinstance(bloom_filter, existence.BloomFilter)
+    assert len(bloom_filter) == 3
+    assert 'ääni' in bloom_filter and 'koira' in bloom_filter
+    assert 'qwerty' not in bloom_filter
+
+
+def test_title_map_as_exact_filter(tmpdir):
+    path = str(tmpdir.join('titles'))
+    dump.build_title_map([('koira', 0), ('kuu', 0)], path)
+    title_set = existence.load_filter(path)
+    assert 'koira' in title_set and 'kuus' not in title_set
+
+
+def test_read_titles(tmpdir):
+    titles_path = str(tmpdir.join('all-titles-in-ns0.gz'))
+    with gzip.open(titles_path, 'wt', encoding='utf-8') as f:
+        f.write('page_title\nkoira\nolla_olemassa\n')
+    index_path = str(tmpdir.join('multistream-index.txt.bz2'))
+    with bz2.open(index_path, 'wt', encoding='utf-8') as f:
+        f.write('600:12:kuu\n600:13:Category:Finnish nouns\n')
+    assert list(existence.read_titles(titles_path)) == ['koira', 'olla olemassa']
+    assert list(existence.read_titles(index_path)) == ['kuu', 'Category:Finnish nouns']
+
+
+class SuggestionConnector:
+
+    def __init__(self):
+        self.requests = []
+
+    def collect_raw_article(self, word):
+        self.requests.append(word)
+        return ['kuu']
+
+
+def test_lookup_skips_the_connectors_for_missing_words():
+    connector = RawPagesConnector()
+    suggestion_connector = SuggestionConnector()
+    bloom_filter = existence.BloomFilter.from_titles(['koira', 'kuuta'], 0.001)
+    word_lookup = lookup.Lookup(connector, suggestion_connector=suggestion_connector,
+                                existence_filter=bloom_filter)
+    assert word_lookup.lookup('qwerty')['status'] == lookup.MISSING
+    assert word_lookup.lookup('koira')['status'] == lookup.FOUND
+    assert word_lookup.lookup('kuuta')['status'] == lookup.SUGGESTIONS
+    assert connector.requests == ['koira', 'kuuta']
+    assert suggestion_connector.requests == ['kuuta']
+    assert word_lookup.stats()['filtered'] == 1
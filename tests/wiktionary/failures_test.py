@@ -0,0 +1,116 @@
+'''
+Tests for the failure store and the replay of stored articles.
+'''
+import json
+import os
+import shutil
+import sys
+import types
+
+import pytest
+
+from susaki.wiktionary import failures, lookup
+from susaki.wiktionary.debugging import replay_failures
+from susaki.wiktionary.wiki_parsing import article_parsing
+from tests.wiktionary.lookup_test import RAW_PAGES_DIR, RawPagesConnector
+
+
+def read_page(word):
+    with open(os.path.join(RAW_PAGES_DIR, '{}.html'.format(word))) as f:
+        return f.read()
+
+
+def parse_error(raw_article, word, parse_tables=True):
+    try:
+        article_parsing.parse_article(raw_article, word, parse_tables=parse_tables)
+    except Exception as err:
+        return err
+    raise AssertionError('"{}" parsed without errors'.format(word))
+
+
+def test_save(tmpdir):
+    store = failures.FailureStore(str(tmpdir))
+    raw_article = read_page('olla')
+    error = parse_error(raw_article, 'olla')
+    path = store.save('olla', 'Finnish', raw_article, error, article_parsing, parse_tables=True)
+    assert store.save('olla', 'Finnish', raw_article, error, article_parsing, True) == path
+    assert len(store) == 1
+    (stored_path, failure), = store.failures()
+    assert stored_path == path
+    assert failure['parser'] == 'susaki.wiktionary.wiki_parsing.article_parsing'
+    assert failure['parser_version'] == failures.parser_version()
+    assert failure['exception'] == type(error).__name__
+    assert 'Traceback' in failure['traceback'] and 'table_parsing' in failure['traceback']
+    with open(os.path.join(path, 'article.html')) as f:
+        assert f.read() == raw_article
+
+
+def test_lookup_stores_parser_failures(tmpdir):
+    store = failures.FailureStore(str(tmpdir))
+
+    def parse_article(raw_article, word, language, parse_tables=True):
+        raise ValueError('Broken parser')
+    parser = types.SimpleNamespace(__name__=article_parsing.__name__,
+                                   parse_article=parse_article)
+    word_lookup = lookup.Lookup(RawPagesConnector(), parser, failure_store=store)
+    with pytest.raises(ValueError):
+        word_lookup.lookup('koira')
+    (_, failure), = store.failures()
+    assert (failure['word'], failure['message']) == ('koira', 'Broken parser')
+
+
+def test_replay(tmpdir):
+    store = failures.FailureStore(str(tmpdir.join('failures')))
+    olla = read_page('olla')
+    store.save('olla', 'Finnish', olla, parse_error(olla, 'olla'), article_parsing, True)
+    # A failure which the parser doesn't make any more
+    store.save('kuu', 'Finnish', read_page('kuu'), ValueError('Old bug'), article_parsing)
+    corpus = tmpdir.mkdir('corpus')
+    for word in ['koira', 'hello', 'ilma']:
+        shutil.copy(os.path.join(RAW_PAGES_DIR, word + '.html'), str(corpus))
+    cases = list(replay_failures.collect_cases(
+        failure_dir=store.directory, directory=str(corpus), parse_tables=True))
+    report = replay_failures.run(cases, workers=2)
+    outcomes = {key.split(':')[0] + ':' + (recorded or key.split(':')[1]): result
+                for key, result, _, _, recorded, _ in report}
+    assert sorted(outcomes.items()) == [
+        ('failure:AttributeError: ' + str(parse_error(olla, 'olla')), 'failed'),
+        ('failure:ValueError: Old bug', 'passed'),
+        ('file:hello.html', 'passed'), ('file:ilma.html', 'passed'),
+        ('file:koira.html', 'passed')]
+    baseline = replay_failures.to_baseline(report)
+    assert baseline['file:hello.html'].startswith('missing: ')
+    baseline['file:koira.html'] = 'an older output'
+    report = replay_failures.run(cases, workers=2, baseline=json.loads(json.dumps(baseline)))
+    assert {key: result for key, result, _, _, _, _ in report if key.startswith('file:')} == {
+        'file:hello.html': 'passed', 'file:ilma.html': 'passed', 'file:koira.html': 'changed'}
+
+
+def test_unreadable_cases_fail_on_their_own():
+    cases = [('file:gone.html', ('file', '/nonexistent/gone.html'), 'gone', 'Finnish',
+              'susaki.wiktionary.wiki_parsing.article_parsing', False, None),
+             ('file:koira.html', ('file', os.path.join(RAW_PAGES_DIR, 'koira.html')), 'koira',
+              'Finnish', 'susaki.wiktionary.wiki_parsing.no_such_parser', False, None)]
+    report = [replay_failures.replay_case(case) for case in cases]
+    assert [(key, digest) for key, digest, _, _ in report] == [
+        ('file:gone.html', None), ('file:koira.html', None)]
+    assert report[0][2].startswith('FileNotFoundError') and \
+        report[1][2].startswith('ModuleNotFoundError')
+    assert [replay_failures.outcome(digest, error, None) for _, digest, error, _ in report] == [
+        'failed', 'failed']
+
+
+def test_parser_complaints_fail(monkeypatch):
+    parser = types.ModuleType('complaining_parser')
+
+    def parse_article(raw_article, word, language, parse_tables=True):
+        if word == 'hello':
+            raise LookupError('No explanations exists for the language: Finnish')
+        raise LookupError('No POS-parts present')
+    parser.parse_article = parse_article
+    monkeypatch.setitem(sys.modules, 'complaining_parser', parser)
+    cases = [('file:{}.html'.format(word), ('file', os.path.join(RAW_PAGES_DIR, word + '.html')),
+              word, 'Finnish', 'complaining_parser', False, None) for word in ['koira', 'hello']]
+    (_, digest, error, _), (_, missing, no_error, _) = map(replay_failures.replay_case, cases)
+    assert digest is None and error == 'LookupError: No POS-parts present'
+    assert missing.startswith('missing: ') and no_error is None
@@ -0,0 +1,326 @@
+'''
+Tests for the shared lookup layer and the HTTP lookup service.
+'''
+import asyncio
+import json
+import os
+import threading
+import time
+
+import pytest
+from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from lxml import etree
+
+from susaki.wiktionary import lookup, service, throttling
+from susaki.wiktionary.scheduler import LookupScheduler
+from susaki.wiktionary.wiki_parsing import article_parsing
+
+RAW_PAGES_DIR = os.path.join(os.path.dirname(__file__), 'parsing_test', 'raw_pages')
+
+
+class RawPagesConnector:
+    """Serves the raw pages of the parsing tests and counts the requests"""
+
+    def __init__(self):
+        self.requests = []
+
+    def collect_raw_article(self, word):
+        self.requests.append(word)
+        path = os.path.join(RAW_PAGES_DIR, '{}.html'.format(word))
+        if not os.path.exists(path):
+            raise LookupError("Article can't be accessed by API")
+        with open(path) as f:
+            return f.read()
+
+
+class BlockingConnector(RawPagesConnector):
+    """Blocks every request until released"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def collect_raw_article(self, word):
+        self.release.wait(5)
+        return super().collect_raw_article(word)
+
+
+class PriorityConnector(RawPagesConnector):
+    """Blocks the requests for the blocked words and records their priority once released"""
+
+    def __init__(self, blocked=()):
+        super().__init__()
+        self.blocked = set(blocked)
+        self.release = threading.Event()
+        self.priorities = {}
+
+    def collect_raw_article(self, word):
+        if word in self.blocked:
+            self.release.wait(5)
+        self.priorities[word] = throttling.current_priority()
+        return super().collect_raw_article(word)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'Timed out'
+        time.sleep(0.001)
+
+
+class SuggestionConnector:
+
+    def collect_raw_article(self, word):
+        return ['kuu']
+
+
+@pytest.fixture
+def connector():
+    return RawPagesConnector()
+
+
+@pytest.fixture
+def word_lookup(connector):
+    return lookup.Lookup(connector)
+
+
+class TestLookup:
+
+    def test_found(self, word_lookup):
+        result = word_lookup.lookup(' Koira ')
+        assert result['word'] == 'koira'
+        assert result['status'] == lookup.FOUND
+        assert result['pos'][0]['pos'] == 'Noun'
+        assert result['pos'][0]['translations'][0]['text'] == 'dog'
+
+    def test_missing_article_and_language(self, word_lookup):
+        assert word_lookup.lookup('qwerty')['status'] == lookup.MISSING
+        assert word_lookup.lookup('hello')['status'] == lookup.MISSING
+
+    def test_suggestions(self, connector):
+        word_lookup = lookup.Lookup(connector, suggestion_connector=SuggestionConnector())
+        result = word_lookup.lookup('qwerty')
+        assert result['status'] == lookup.SUGGESTIONS
+        assert result['suggestions'] == ['kuu']
+
+    def test_results_are_cached(self, word_lookup, connector):
+        first = word_lookup.lookup('koira')
+        assert word_lookup.lookup('KOIRA') is first
+        assert connector.requests == ['koira']
+        assert word_lookup.stats()['results']['hits'] == 1
+
+    def test_raw_article_shared_between_languages(self, word_lookup, connector):
+        word_lookup.lookup('koira', 'Finnish')
+        word_lookup.lookup('koira', 'Ingrian')
+        assert connector.requests == ['koira']
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = lookup.LRUCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        assert 'a' in cache and 'c' in cache and 'b' not in cache
+
+
+class TestCoalescing:
+
+    def test_concurrent_threads_share_one_fetch(self):
+        connector = BlockingConnector()
+        word_lookup = lookup.Lookup(connector)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(word_lookup.lookup('koira')))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        wait_until(lambda: word_lookup.flights.shared == 7)
+        connector.release.set()
+        for thread in threads:
+            thread.join()
+        assert connector.requests == ['koira']
+        assert len(results) == 8
+        assert all(result is results[0] for result in results)
+
+    def test_concurrent_coroutines_share_one_fetch(self):
+        connector = BlockingConnector()
+        word_lookup = lookup.Lookup(connector)
+
+        async def run():
+            lookups = asyncio.gather(*(word_lookup.lookup_async(word) for word in
+                                       ['koira', 'Koira', ' koira', 'kuu', 'kuu']))
+            loop = asyncio.get_running_loop()
+            loop.call_later(0.05, connector.release.set)
+            return await lookups
+        results = asyncio.run(run())
+        assert sorted(connector.requests) == ['koira', 'kuu']
+        assert results[0] is results[1] is results[2]
+        assert results[3] is results[4]
+        assert word_lookup.stats()['coalesced'] == 3
+
+    def test_interactive_caller_promotes_a_bulk_call(self):
+        connector = PriorityConnector(blocked=['koira'])
+        word_lookup = lookup.Lookup(connector)
+
+        def prefetch():
+            with throttling.priority(throttling.BULK):
+                word_lookup.lookup('koira')
+        bulk = threading.Thread(target=prefetch)
+        bulk.start()
+        wait_until(lambda: word_lookup.flights.in_flight() == 1)
+        user = threading.Thread(target=word_lookup.lookup, args=('koira',))
+        user.start()
+        wait_until(lambda: word_lookup.flights.shared == 1)
+        connector.release.set()
+        bulk.join()
+        user.join()
+        assert connector.priorities == {'koira': throttling.INTERACTIVE}
+        assert word_lookup.stats()['promoted'] == 1
+
+    def test_interactive_coroutine_doesnt_wait_for_a_queued_bulk_call(self):
+        connector = PriorityConnector(blocked=['kuu'])
+        word_lookup = lookup.Lookup(connector)
+
+        async def run(scheduler):
+            bulk = scheduler.executor(throttling.BULK, 'job')
+            # The only bulk worker is busy, so the bulk lookup of koira stays queued
+            blocker = asyncio.ensure_future(word_lookup.lookup_async('kuu', executor=bulk))
+            queued = asyncio.ensure_future(word_lookup.lookup_async('koira', executor=bulk))
+            await asyncio.sleep(0.05)
+            result = await asyncio.wait_for(word_lookup.lookup_async(
+                'koira', executor=scheduler.executor(throttling.INTERACTIVE)), 5)
+            assert not queued.done()
+            connector.release.set()
+            await asyncio.gather(blocker, queued)
+            return result, queued.result()
+        with LookupScheduler(word_lookup, max_workers=2, reserved_workers=1) as scheduler:
+            result, queued = asyncio.run(run(scheduler))
+        assert result['status'] == queued['status'] == lookup.FOUND
+        assert connector.priorities['koira'] == throttling.INTERACTIVE
+        assert connector.requests.count('koira') == 1
+
+    def test_errors_are_shared(self):
+        flights = lookup.SingleFlight()
+        release = threading.Event()
+        errors = []
+
+        def fail():
+            release.wait(5)
+            raise RuntimeError('Failed')
+
+        def call():
+            try:
+                flights.do('key', fail)
+            except RuntimeError as err:
+                errors.append(err)
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        wait_until(lambda: flights.shared == 2)
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert len(errors) == 3
+        assert flights.in_flight() == 0
+
+
+class TestThreadSafety:
+    WORDS = ['koira', 'kuu', 'ilma', 'ilman', 'kuussa', 'päästä', 'olla', 'hello', 'qwerty']
+
+    def test_executor_stress(self, connector):
+        expected = lookup.Lookup(RawPagesConnector()).lookup_many(self.WORDS)
+        # A tiny cache makes the threads fetch and parse the same articles over and over
+        shared_lookup = lookup.Lookup(connector, cache_size=1)
+        with lookup.LookupExecutor(shared_lookup, max_workers=8) as executor:
+            results = executor.map(self.WORDS * 5)
+        assert results == expected * 5
+
+    def test_shared_soup(self):
+        with open(os.path.join(RAW_PAGES_DIR, 'päästä.html')) as f:
+            raw_soup = BeautifulSoup(f.read(), article_parsing.PARSER)
+        language_part = article_parsing.extract_language_part(raw_soup, 'Finnish')
+        pos_parts = article_parsing.extract_pos_parts(language_part)
+        html = [str(pos_part) for pos_part in pos_parts]
+
+        def parse(_):
+            return [etree.tostring(article_parsing.parse_POS(pos_part)) for pos_part in pos_parts]
+        expected = parse(None)
+        with ThreadPoolExecutor(8) as executor:
+            outputs = list(executor.map(parse, range(16)))
+        assert outputs == [expected] * 16
+        assert [str(pos_part) for pos_part in pos_parts] == html
+
+
+class TestLookupService:
+
+    def request(self, word_lookup, raw_requests):
+        """Sends the raw requests over one connection and returns the responses"""
+        async def run():
+            lookup_service = service.LookupService(word_lookup, workers=2)
+            server = await lookup_service.start('127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            responses = []
+            for raw_request in raw_requests:
+                writer.write(raw_request.encode('utf-8'))
+                await writer.drain()
+                status_line = await reader.readline()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line == b'\r\n':
+                        break
+                    name, _, value = line.decode().partition(':')
+                    headers[name.lower()] = value.strip()
+                body = await reader.readexactly(int(headers['content-length']))
+                responses.append((int(status_line.split()[1]), json.loads(body.decode('utf-8'))))
+            writer.close()
+            await lookup_service.close()
+            return responses
+        return asyncio.run(run())
+
+    def test_lookup_and_batch(self, word_lookup):
+        body = json.dumps({'words': ['koira', 'kuu', 'qwerty']})
+        responses = self.request(word_lookup, [
+            'GET /lookup?word=koira HTTP/1.1\r\nHost: localhost\r\n\r\n',
+            'POST /batch HTTP/1.1\r\nContent-Length: {}\r\n\r\n{}'.format(len(body), body),
+            'GET /stats HTTP/1.1\r\n\r\n'])
+        (lookup_status, result), (batch_status, batch), (stats_status, stats) = responses
+        assert lookup_status == batch_status == stats_status == 200
+        assert result['pos'][0]['translations'][0]['text'] == 'dog'
+        assert [result['status'] for result in batch['results']] == ['found', 'found', 'missing']
+        assert stats['requests'] == 2
+        assert stats['words'] == 4
+        assert stats['caches']['results']['hits'] == 1
+        assert stats['scheduler']['completed'] == {'interactive': 1, 'bulk': 2}
+
+    def test_refused_batch_is_cancelled(self):
+        connector = RawPagesConnector()
+        lookup_service = service.LookupService(lookup.Lookup(connector), workers=2,
+                                               max_queued_bulk=2)
+        release = threading.Event()
+        # Keeps the only bulk worker busy
+        blocker = lookup_service.lookups.run(throttling.BULK, 'other', release.wait, 5)
+        wait_until(lambda: lookup_service.lookups.stats()['running_bulk'] == 1)
+        body = json.dumps({'words': ['koira', 'kuu', 'ilma']}).encode('utf-8')
+        with pytest.raises(throttling.OverloadError):
+            asyncio.run(lookup_service.handle_batch({}, body))
+        assert lookup_service.lookups.stats()['queued']['bulk'] == 0
+        release.set()
+        assert blocker.result(5) is True
+        lookup_service.lookups.shutdown()
+        assert connector.requests == []
+
+    def test_errors(self, word_lookup):
+        responses = self.request(word_lookup, [
+            'GET /lookup HTTP/1.1\r\n\r\n',
+            'GET /unknown HTTP/1.1\r\n\r\n',
+            'GET /batch HTTP/1.1\r\n\r\n',
+            'POST /batch HTTP/1.1\r\nContent-Length: 2\r\n\r\n[]'])
+        assert [status for status, _ in responses] == [400, 404, 405, 400]
+
+    @pytest.mark.parametrize('length', ['abc', '-5'])
+    def test_malformed_content_length(self, word_lookup, length):
+        responses = self.request(word_lookup, [
+            'POST /batch HTTP/1.1\r\nContent-Length: {}\r\n\r\n'.format(length)])
+        assert responses == [(400, {'error': 'Malformed Content-Length'})]
@@ -0,0 +1,130 @@
+'''
+Tests for the mock of Wiktionary and the load generator driving the lookups against it.
+'''
+import logging
+import sys
+import threading
+
+import pytest
+
+from susaki.wiktionary.connectors import HTMLConnector
+from susaki.wiktionary.debugging import load_test
+from susaki.wiktionary.debugging.mock_wiktionary import MockWiktionary
+from susaki.wiktionary.lookup import Lookup
+from susaki.wiktionary.throttling import BULK, RateLimiter, TransientError
+from susaki.wiktionary.wiki_parsing import article_parsing
+from tests.wiktionary.lookup_test import PriorityConnector
+
+
+def rate_limiter():
+    return RateLimiter(rate=1000.0, burst=100, max_rate=1000.0)
+
+
+@pytest.fixture
+def mock():
+    with MockWiktionary(seed=0) as mock:
+        yield mock
+
+
+@pytest.mark.parametrize('kind', load_test.KINDS)
+def test_connectors(mock, kind):
+    connector, parser = load_test.create_connector(mock, kind, rate_limiter())
+    article_root = parser.parse_article(connector.collect_raw_article('koira'), 'koira', 'Finnish')
+    assert article_root.find('Languages').find('Finnish') is not None
+    if kind != 'sections':
+        with pytest.raises(LookupError):
+            connector.collect_raw_article('xyzzy')
+
+
+def test_other_languages_than_the_sections(mock):
+    connector, parser = load_test.create_connector(mock, 'sections', rate_limiter())
+    word_lookup = Lookup(connector, parser)
+    assert word_lookup.lookup('kuu')['pos'][0]['translations'][0]['text'].startswith('moon')
+    assert (mock.counts['parse'], mock.counts['query']) == (2, 0)
+    # The Finnish section has no Estonian part, the whole article is fetched for it
+    estonian = word_lookup.lookup('kuu', 'Estonian')
+    assert estonian['status'] == 'found' and estonian['pos']
+    assert word_lookup.lookup('koira', 'Estonian')['status'] == 'missing'
+    assert (mock.counts['parse'], mock.counts['query']) == (2, 2)
+    assert set(word_lookup.raw_articles.keys()) == {
+        ('kuu', 'Finnish'), ('kuu', None), ('koira', None)}
+
+
+def test_search_page(mock):
+    connector = HTMLConnector('Finnish', rate_limiter=rate_limiter(),
+                              **mock.connector_kwargs('html'))
+    assert connector.collect_raw_article('koira').status_code == 200
+    assert connector.collect_raw_article('koiralle')
+    with pytest.raises(LookupError):
+        connector.collect_raw_article('xyzzy')
+    assert mock.counts['search'] == 3
+
+
+def test_fault_injection():
+    with MockWiktionary(error_rate=1.0) as mock:
+        connector, _ = load_test.create_connector(mock, 'api', rate_limiter())
+        connector.max_retries = 0
+        with pytest.raises(TransientError):
+            connector.collect_raw_article('koira')
+        assert mock.counts['errors'] == 1
+    with MockWiktionary(max_rate=1.0, retry_after=0) as mock:
+        limiter = rate_limiter()
+        connector, _ = load_test.create_connector(mock, 'api', limiter)
+        connector.max_retries = 0
+        connector.collect_raw_article('koira')
+        with pytest.raises(TransientError):
+            connector.collect_raw_article('kuu')
+        assert mock.counts['throttled'] == 1 and limiter.throttled == 1
+
+
+def test_run_load():
+    def look_up(word):
+        if word == 'xyzzy':
+            raise LookupError(word)
+    report = load_test.run_load(look_up, ['koira', 'kuu', 'xyzzy'], concurrency=4, requests=30)
+    assert (report['requests'], report['errors']) == (30, 10)
+    assert report['p50'] <= report['p99'] <= report['max']
+    assert report['throughput'] > 0
+
+
+@pytest.fixture
+def quiet_translator(monkeypatch):
+    if load_test.EXAMPLES_DIR not in sys.path:
+        sys.path.insert(0, load_test.EXAMPLES_DIR)
+    import translate
+    monkeypatch.setattr(translate, 'setup_logging', lambda debugging: logging.getLogger())
+
+
+@pytest.mark.parametrize('name', load_test.TARGETS)
+def test_targets(mock, quiet_translator, name):
+    with load_test.target(name, mock, 'api') as function:
+        report = load_test.run_load(function, load_test.DEFAULT_WORDS, concurrency=4,
+                                    requests=2 * len(load_test.DEFAULT_WORDS))
+    assert report['errors'] == 0
+    # Nothing is cached between the calls, every word was fetched again
+    assert mock.counts['query'] > len(load_test.DEFAULT_WORDS)
+
+
+def test_translator_sends_bulk_requests(mock, quiet_translator):
+    translator = load_test._create_translator(mock, 'api', rate_limiter())
+    connector = translator._connector = PriorityConnector()
+    translator._parser = article_parsing
+    assert translator.translate_word('koira')[0].startswith('dog')
+    assert translator.translate_word('xyzzy') is None
+    assert connector.priorities == {'koira': BULK, 'xyzzy': BULK}
+    assert translator.hot_cache.get('xyzzy', 'Finnish')['status'] == 'missing'
+
+
+def test_translator_writes_the_list_in_order(mock, quiet_translator, tmp_path):
+    translator = load_test._create_translator(mock, 'api', rate_limiter())
+    translator._connector = PriorityConnector(blocked=['koira'])
+    translator._parser = article_parsing
+    # The first word is answered last
+    threading.Timer(0.2, translator._connector.release.set).start()
+    words = ['koira', 'xyzzy', 'kuu', 'koira']
+    (tmp_path / 'words').write_text('\n'.join(words) + '\n\n')
+    translator.translate(str(tmp_path / 'words'), workers=3)
+    lines = (tmp_path / 'words_translated').read_text().splitlines()
+    assert [line.split('\t')[0] for line in lines] == words
+    assert lines[1] == 'xyzzy\t[UNKNOWN]'
+    assert lines[0] == lines[3] and lines[0].startswith('koira\tdog')
@@ -0,0 +1,47 @@
+'''
+Tests for the columnar export of inflection tables.
+'''
+import os
+
+import pytest
+from lxml import etree
+
+from susaki.wiktionary import paradigm_export
+
+np = pytest.importorskip('numpy')
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'parsing_test', 'article_parsing_data')
+
+
+def load_article_root(word):
+    return etree.parse(os.path.join(DATA_DIR, 'output_{}.xml'.format(word))).getroot()
+
+
+@pytest.fixture
+def collector():
+    collector = paradigm_export.ParadigmCollector()
+    for word in ['koira', 'kuu', 'päästä', 'ilman']:
+        collector.add_article(load_article_root(word))
+    return collector
+
+
+def test_flattened_tables_cover_all_slots():
+    article_root = load_article_root('päästä')
+    table = next(article_root.iter('Inflection_Table'))
+    forms = paradigm_export.flatten_inflection_table(table)
+    assert set(forms) == set(paradigm_export.VERB_SLOTS)
+    assert forms['indicative_mood/past/positive/singular/first'] == 'pääsin'
+
+
+def test_one_row_per_lemma(collector):
+    # kuu has three identical tables, ilman has none
+    assert collector.lemmas['noun'] == ['koira', 'kuu']
+    assert collector.lemmas['verb'] == ['päästä']
+
+
+def test_written_arrays_can_be_memory_mapped(collector, tmpdir):
+    paradigm_export.write_npy(collector, str(tmpdir))
+    forms = np.load(str(tmpdir.join('noun_forms.npy')), mmap_mode='r')
+    slots = list(np.load(str(tmpdir.join('noun_slots.npy'))))
+    assert forms.shape == (2, len(paradigm_export.NOUN_SLOTS))
+    assert list(forms[:, slots.index('inessive/singular')]) == ['koirassa', 'kuussa']
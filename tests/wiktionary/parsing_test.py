@@ -3,13 +3,19 @@ Created on May 16, 2016
 
 @author: simon
 '''
+import gc
 import pytest
 import os
 from distutils import dir_util
 from susaki.wiktionary.wiki_parsing import article_parsing
 from susaki.wiktionary.wiki_parsing import table_parsing
+from susaki.wiktionary.wiki_parsing import section_index
+from susaki.wiktionary.wiki_parsing import wikitext_parsing
+from susaki.wiktionary.wiki_parsing import util
+from susaki.wiktionary.wiki_parsing import paradigm_generation
+from susaki.wiktionary.paradigm_export import flatten_inflection_table
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, PageElement
 from lxml import etree
 
 
@@ -118,6 +124,14 @@ def article_parsing_data(datadir):
     return combined_dicts
 
 
+@pytest.fixture(scope='module')
+def wikitext_parsing_data(datadir):
+    wikitext_dict = load_text_files(datadir, 'wikitext_parsing_data', extension='wikitext')
+    xml_dict = load_text_files(datadir, 'wikitext_parsing_data', extension='xml', remove_whitespace=True)
+    combined_dicts = {**wikitext_dict, **xml_dict}
+    return combined_dicts
+
+
 class TestLanguageExtraction:
 
     def extract_language_part(self, article):
@@ -162,6 +176,55 @@ class TestLanguageExtraction:
         assert 'No explanations exists for the language:' in str(exinfo)
 
 
+class TestMultipleLanguageExtraction:
+
+    def test_extract_all_requested_languages_present(self, raw_articles, expected_language_parts):
+        soup = BeautifulSoup(raw_articles['kuu'], 'html.parser')
+        language_parts = article_parsing.extract_language_parts(
+            soup, ['Finnish', 'Estonian', 'Swedish'])
+        assert sorted(language_parts) == ['Estonian', 'Finnish']
+        assert language_parts['Finnish'] == expected_language_parts['kuu']
+
+    def test_parse_languages_in_requested_order(self, raw_articles):
+        article_root = article_parsing.parse_article_languages(
+            raw_articles['kuu'], 'kuu', ['Finnish', 'Swedish', 'Estonian'])
+        languages = [element.tag for element in article_root.find('Languages')]
+        assert languages == ['Finnish', 'Estonian']
+
+    def test_throw_exception_when_no_language_present(self, raw_articles):
+        with pytest.raises(LookupError) as exinfo:
+            article_parsing.parse_article_languages(
+                raw_articles['hello'], 'hello', ['Finnish', 'Estonian'])
+        assert 'No explanations exists for the language:' in str(exinfo)
+
+
+class TestStreamingParse:
+
+    @pytest.mark.parametrize('word', ['kuu', 'koira', 'päästä', 'ilma', 'sää', 'lämmin'])
+    def test_same_result_as_the_whole_soup(self, raw_articles, word):
+        def parse(streaming):
+            return etree.tostring(article_parsing.parse_article_languages(
+                raw_articles[word], word, ['Finnish', 'Estonian'], streaming=streaming))
+        assert parse(True) == parse(False)
+
+    def test_scan_keeps_only_the_language_parts(self, raw_articles, expected_language_parts):
+        parts = article_parsing.scan_language_parts(raw_articles['kuu'], ['Finnish', 'Swedish'])
+        assert list(parts) == ['Finnish']
+        assert parts['Finnish'].startswith('<h2><span class="mw-headline" id="Finnish">')
+        assert BeautifulSoup(parts['Finnish'], 'html.parser') == expected_language_parts['kuu']
+
+    def test_scan_stops_after_the_last_part(self, raw_articles, monkeypatch):
+        fed = []
+        feed = article_parsing.LanguagePartScanner.feed
+        monkeypatch.setattr(article_parsing.LanguagePartScanner, 'feed',
+                            lambda scanner, data: fed.append(data) or feed(scanner, data))
+        raw_article = raw_articles['kuu']
+        article_parsing.scan_language_parts(raw_article, ['Finnish'], chunk_size=1000)
+        # Nothing after the header of the next language (Ingrian) but the rest of its chunk
+        next_header = raw_article.index('<h2><span class="mw-headline" id="Ingrian">')
+        assert sum(len(data) for data in fed) <= next_header + 1000 < len(raw_article)
+
+
 class TestPOSExtraction:
 
     def output_is_as_expected(self, word, expected_pos_parts, expected_language_parts):
@@ -239,6 +302,35 @@ class TestPOSExtraction:
         assert str(error.value) == 'No POS-parts present'
 
 
+class TestSectionIndex:
+
+    @pytest.fixture
+    def index(self, expected_language_parts):
+        return section_index.SectionIndex(expected_language_parts['kuu'])
+
+    def test_index_sections_by_kind(self, index):
+        assert len(index.sections_of_kind('pos')) == 3
+        assert len(index.sections_of_kind('declension')) == 3
+        assert index.sections_of_kind('conjugation') == []
+
+    def test_section_ends_at_next_header_on_same_or_higher_level(self, index):
+        second_noun = index.sections_of_kind('pos')[1]
+        assert second_noun.end.find('span')['id'] == 'Derived_terms_3'
+        last_noun = index.sections_of_kind('pos')[2]
+        assert last_noun.end is None
+
+    def test_subsections_are_nested_sections(self, index):
+        first_noun = index.sections_of_kind('pos')[0]
+        titles = [section.title for section in index.subsections(first_noun)]
+        assert titles == ['Declension', 'Synonyms', 'Derived terms', 'Compounds']
+
+    def test_copy_stops_at_the_end_tag_itself(self):
+        soup = BeautifulSoup('<p>a</p><h3>x</h3><p>b</p><h3>x</h3><p>c</p>', 'html.parser')
+        headers = soup.find_all('h3')
+        copied = util.copy_soup_between(soup.p, headers[1])
+        assert [p.text for p in copied.find_all('p')] == ['a', 'b']
+
+
 class TestTranslationExtraction:
     # TODO: Make testing of translation better. The need for splitting lines
     # is not good
@@ -344,6 +436,13 @@ class TestTranslationParsing(HTML_To_XML_Parsing):
         expected_output_text = translation_parsing_data['output_multiple_examples']
         assert self.output_is_as_expected(article_parsing.parse_translation, input_text, expected_output_text)
 
+    def test_soup_is_not_modified(self, translation_parsing_data):
+        input_soup = BeautifulSoup(translation_parsing_data['input_multiple_examples'], 'html.parser')
+        input_html = str(input_soup)
+        first = etree.tostring(article_parsing.parse_translation(input_soup))
+        assert str(input_soup) == input_html
+        assert etree.tostring(article_parsing.parse_translation(input_soup)) == first
+
 
 class TestExampleParsing(HTML_To_XML_Parsing):
 
@@ -430,3 +529,145 @@ def test_output_correct_xml(article_parsing_data, article_name):
     print('Observed\n{}'.format(observed_output_string))
     print('Expected\n{}'.format(expected_output_string))
     assert observed_output_string == expected_output_string
+
+
+class TestWikitextParsing:
+
+    def xml_string(self, root):
+        return etree.tostring(root, encoding='unicode', pretty_print=True)
+
+    def parse(self, wikitext_parsing_data, article_name, parse_tables=True):
+        input_text = wikitext_parsing_data['input_{}'.format(article_name)]
+        return wikitext_parsing.parse_article(input_text, article_name, parse_tables=parse_tables)
+
+    @pytest.mark.parametrize('article_name', ['koira', 'kuussa'])
+    def test_same_translations_as_html_parsing(self, wikitext_parsing_data, article_parsing_data, article_name):
+        expected_output = etree.fromstring(article_parsing_data['output_{}'.format(article_name)])
+        for table in expected_output.iter('Inflection_Table'):
+            table.getparent().remove(table)
+        observed_output = self.parse(wikitext_parsing_data, article_name, parse_tables=False)
+        assert self.xml_string(observed_output) == self.xml_string(expected_output)
+
+    def test_parse_examples_and_quotations(self, wikitext_parsing_data):
+        expected_output = etree.fromstring(wikitext_parsing_data['output_ilma'])
+        observed_output = self.parse(wikitext_parsing_data, 'ilma')
+        assert self.xml_string(observed_output) == self.xml_string(expected_output)
+
+    def test_meta_information_from_inflection_template(self, wikitext_parsing_data, article_parsing_data):
+        expected_output = etree.fromstring(article_parsing_data['output_koira'])
+        observed_output = self.parse(wikitext_parsing_data, 'koira')
+        expected_meta = next(expected_output.iter('meta'))
+        observed_meta = next(observed_output.iter('meta'))
+        assert self.xml_string(observed_meta) == self.xml_string(expected_meta)
+
+    def test_generated_inflection_table(self, wikitext_parsing_data, article_parsing_data):
+        expected_output = etree.fromstring(article_parsing_data['output_koira'])
+        observed_output = self.parse(wikitext_parsing_data, 'koira')
+        assert self.xml_string(observed_output) == self.xml_string(expected_output)
+
+    def test_usage_example_template(self):
+        translations = wikitext_parsing.extract_translations(
+            "# [[dog]]\n#: {{ux|fi|'''[[koira|Koira]]''' haukkuu.|The dog barks.}}")
+        assert translations == [('dog', [('Koira haukkuu.', 'The dog barks.')])]
+
+    @pytest.mark.parametrize('template,gradation', [
+        ('{{fi-decl-valo|ta|kk|k|o|a}}', 'kk-k'),
+        ('{{fi-decl-koira|koir|||a|a}}', 'no')])
+    def test_gradation_from_template_arguments(self, template, gradation):
+        _, _, positional, _ = wikitext_parsing.find_inflection_template(template)
+        assert wikitext_parsing.template_gradation(positional) == gradation
+
+
+class TestParadigmGeneration:
+
+    @pytest.mark.parametrize('article_name', [
+        'ilma', 'koira', 'kuu', 'sää', 'lämmin', 'päästä', 'haluta', 'lähettää'])
+    def test_same_forms_as_parsed_table(self, raw_articles, article_name):
+        article_root = article_parsing.parse_article(raw_articles[article_name], article_name)
+        for parsed_table in article_root.iter('Inflection_Table'):
+            word = parsed_table.findtext('meta/word')
+            kotus_type = parsed_table.findtext('meta/kotus/type')
+            gradation = parsed_table.findtext('meta/gradation')
+            table_type = parsed_table.getparent().tag.lower()
+            generated_table = paradigm_generation.generate_inflection_table(
+                word, kotus_type, gradation, table_type)
+            assert flatten_inflection_table(generated_table) == flatten_inflection_table(parsed_table)
+            assert etree.tostring(generated_table.find('meta')) == etree.tostring(
+                create_meta_from(parsed_table))
+
+    @pytest.mark.parametrize('word,kotus_type,gradation,slot,form', [
+        ('lapsi', '29', 'no', 'genitive/plural', 'lasten'),
+        ('joki', '7', 'k-', 'inessive/plural', 'joissa'),
+        ('lumme', '48', 'mp-mm', 'genitive/singular', 'lumpeen'),
+        ('laskea', '58', 'no', 'nominal_forms/infinitives/second/inessive/active', 'laskiessa'),
+        ('hypätä', '73', 'pp-p', 'indicative_mood/past/positive/singular/third', 'hyppäsi')])
+    def test_generated_form(self, word, kotus_type, gradation, slot, form):
+        assert paradigm_generation.generate_forms(word, kotus_type, gradation)[slot] == form
+
+    @pytest.mark.parametrize('word,kotus_type,gradation', [
+        ('parfait', '22', 'no'), ('kumajaa', '77', 'no'), ('pelätä', '73', 'k-')])
+    def test_unsupported_type(self, word, kotus_type, gradation):
+        with pytest.raises(ValueError):
+            paradigm_generation.generate_forms(word, kotus_type, gradation)
+
+
+
+class TestMemory:
+    RAW_PAGES_DIR = os.path.join(os.path.dirname(__file__), 'parsing_test', 'raw_pages')
+
+    def read_raw_pages(self, words):
+        pages = []
+        for word in words:
+            with open(os.path.join(self.RAW_PAGES_DIR, '{}.html'.format(word))) as f:
+                pages.append((word, f.read()))
+        return pages
+
+    def parse_all(self, pages):
+        for word, raw_article in pages:
+            try:
+                article_parsing.parse_article(raw_article, word)
+            except (LookupError, AttributeError):
+                # No Finnish part (hello) or an unreadable table (olla), the
+                # soups must be torn down on these paths too
+                pass
+
+    def test_no_soup_is_left_for_the_garbage_collector(self):
+        pages = self.read_raw_pages(
+            os.path.splitext(name)[0] for name in sorted(os.listdir(self.RAW_PAGES_DIR)))
+        gc.collect()
+        gc.disable()
+        gc.set_debug(gc.DEBUG_SAVEALL)
+        try:
+            self.parse_all(pages)
+            gc.collect()
+            leaked = [obj for obj in gc.garbage if isinstance(obj, PageElement)]
+        finally:
+            gc.set_debug(0)
+            gc.garbage.clear()
+            gc.enable()
+        assert leaked == []
+
+    @pytest.mark.skipif(not os.path.exists('/proc/self/statm'), reason='Needs /proc to measure RSS')
+    def test_rss_is_flat_without_the_garbage_collector(self):
+        def rss():
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        pages = self.read_raw_pages(['kuussa', 'luen', 'ilman'])
+        gc.collect()
+        gc.disable()
+        try:
+            self.parse_all(pages * 10)
+            start = rss()
+            self.parse_all(pages * 700)
+            growth = rss() - start
+        finally:
+            gc.enable()
+        # Without the teardown every parse of these small articles leaves about 0.3 MB
+        assert growth < 5 * 1024 * 1024
+
+
+def create_meta_from(parsed_table):
+    """Recreates the meta element without the whitespace of the parsed article"""
+    return table_parsing.create_meta_tree(
+        parsed_table.findtext('meta/word'), parsed_table.findtext('meta/kotus/type'),
+        parsed_table.findtext('meta/kotus/word'), parsed_table.findtext('meta/gradation'))
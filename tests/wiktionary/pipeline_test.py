@@ -0,0 +1,121 @@
+'''
+Tests for the staged pipeline with bounded queues.
+'''
+import io
+import json
+import threading
+
+import pytest
+
+from susaki.wiktionary.lookup import Lookup
+from susaki.wiktionary.pipeline import Pipeline, Stage, lookup_pipeline, write_json_lines
+from susaki.wiktionary.throttling import OverloadError
+from susaki.wiktionary.wiki_parsing import article_parsing
+from tests.wiktionary.lookup_test import RawPagesConnector, wait_until
+
+
+class Gate:
+    """A stage function which waits until the gate is opened"""
+
+    def __init__(self):
+        self.opened = threading.Event()
+
+    def __call__(self, item):
+        self.opened.wait(5)
+        return item * 2
+
+
+def test_slow_stage_blocks_the_producer():
+    gate = Gate()
+    fetched = []
+    pipeline = Pipeline([Stage('fetch', lambda item: fetched.append(item) or item, 2, 3),
+                         Stage('parse', gate, 1, 2)])
+    assert pipeline.capacity() == 8
+    futures = []
+    producer = threading.Thread(target=lambda: futures.extend(
+        pipeline.submit(item) for item in range(100)))
+    producer.start()
+    # parse: 1 running and 2 queued, fetch: 2 blocked on the parse queue and 3 queued
+    wait_until(lambda: pipeline.submitted == 8 and len(fetched) == 5)
+    producer.join(0.1)
+    assert producer.is_alive()
+    assert pipeline.submitted == 8 and len(fetched) == 5
+    gate.opened.set()
+    producer.join(5)
+    assert [future.result(5) for future in futures] == [item * 2 for item in range(100)]
+    pipeline.close()
+    assert pipeline.stats()['stages']['parse'] == {'queued': 0, 'processed': 100, 'failed': 0}
+
+
+def test_load_is_shed_when_full():
+    gate = Gate()
+    pipeline = Pipeline([Stage('parse', gate, 1, 2)], shed=True)
+    futures = [pipeline.submit(1)]
+    wait_until(lambda: pipeline.stages[0].queue.qsize() == 0)
+    futures += [pipeline.submit(2), pipeline.submit(3)]
+    with pytest.raises(OverloadError):
+        pipeline.submit(4)
+    assert pipeline.stats()['rejected'] == 1
+    gate.opened.set()
+    pipeline.close()
+    assert [future.result() for future in futures] == [2, 4, 6]
+
+
+def test_failed_items_dont_stop_the_pipeline():
+    pipeline = Pipeline([Stage('invert', lambda item: 1 / item, 2), Stage('negate', abs)])
+    futures = [pipeline.submit(item) for item in [1, 0, -2]]
+    pipeline.close()
+    assert futures[0].result() == 1 and futures[2].result() == 0.5
+    with pytest.raises(ZeroDivisionError):
+        futures[1].result()
+    assert pipeline.stats()['stages']['invert']['failed'] == 1
+    with pytest.raises(RuntimeError):
+        pipeline.submit(1)
+
+
+def test_lookup_pipeline():
+    output = io.StringIO()
+    pipeline = lookup_pipeline(Lookup(RawPagesConnector(), cache_size=0),
+                               write_json_lines(output), queue_size=1)
+    stats = pipeline.run(['koira', 'qwerty', 'hello', 'kuu'])
+    results = {result['word']: result for result in map(json.loads, output.getvalue().splitlines())}
+    assert {word: result['status'] for word, result in results.items()} == {
+        'koira': 'found', 'qwerty': 'missing', 'hello': 'missing', 'kuu': 'found'}
+    assert results['koira']['pos'][0]['translations'][0]['text'] == 'dog'
+    assert stats['submitted'] == 4 and stats['stages']['write']['processed'] == 4
+
+
+def test_lookup_pipeline_fails_like_the_lookup():
+    class Parser:
+        def parse_article(self, raw_article, word, language, parse_tables=True):
+            if word == 'kuu':
+                raise ValueError('Unreadable table')
+            if word == 'koira':
+                raise LookupError('No POS-parts present')
+            return article_parsing.parse_article(raw_article, word, language, parse_tables)
+
+    class Store:
+        def __init__(self):
+            self.words = []
+
+        def save(self, word, language, raw_article, err, parser):
+            self.words.append(word)
+
+    connector = RawPagesConnector()
+    store = Store()
+    word_lookup = Lookup(connector, Parser(), cache_size=0, failure_store=store,
+                         existence_filter={'koira', 'kuu', 'hello', 'ilma'})
+    output = io.StringIO()
+    pipeline = lookup_pipeline(word_lookup, write_json_lines(output))
+    futures = [pipeline.submit(word) for word in ['Koira', 'kuu', 'hello', 'ilma', 'qwerty']]
+    pipeline.close()
+    with pytest.raises(LookupError):
+        futures[0].result()
+    with pytest.raises(ValueError):
+        futures[1].result()
+    assert [future.result() for future in futures[2:]] == ['missing', 'found', 'missing']
+    # The parser complaint is kept like any other failure
+    assert sorted(store.words) == ['koira', 'kuu']
+    # qwerty isn't in the existence filter
+    assert sorted(connector.requests) == ['hello', 'ilma', 'koira', 'kuu']
+    assert pipeline.stats()['stages']['parse']['failed'] == 2
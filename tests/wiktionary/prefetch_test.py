@@ -0,0 +1,60 @@
+'''
+Tests for the speculative lookups of referenced words.
+'''
+import threading
+
+from susaki.wiktionary import lookup, prefetch
+from tests.wiktionary.lookup_test import BlockingConnector, RawPagesConnector, wait_until
+
+
+def test_referenced_words():
+    result = lookup.create_result('kuussa', 'Finnish', lookup.FOUND, [
+        {'pos': 'Noun', 'translations': [
+            {'text': 'Inessive singular form of kuu.', 'examples': []},
+            {'text': 'Alternative spelling of Kuu', 'examples': []},
+            {'text': 'See kuuhun.', 'examples': []},
+            {'text': 'moon', 'examples': []}]}])
+    assert prefetch.referenced_words(result) == ['kuu', 'kuuhun']
+    suggestions = lookup.create_result('kuuta', 'Finnish', lookup.SUGGESTIONS,
+                                       suggestions=['kuu', 'kuuta', 'kuusi'])
+    assert prefetch.referenced_words(suggestions, max_words=1) == ['kuu']
+
+
+def test_lemma_is_prefetched():
+    connector = RawPagesConnector()
+    word_lookup = lookup.Lookup(connector)
+    prefetcher = prefetch.Prefetcher(word_lookup)
+    result = word_lookup.lookup('kuussa')
+    assert prefetcher.prefetch(result) == ['kuu']
+    wait_until(lambda: ('kuu', 'Finnish') in word_lookup.results)
+    assert word_lookup.lookup('kuu')['pos'][0]['translations'][0]['text'].startswith('moon')
+    assert connector.requests == ['kuussa', 'kuu']
+    # Known words aren't prefetched again
+    assert prefetcher.prefetch(result) == []
+    assert prefetcher.prefetch(result, skip=lambda word: True) == []
+    prefetcher.close(wait=True)
+    assert prefetcher.stats() == {'submitted': 1, 'failed': 0}
+
+
+def test_user_lookup_waits_for_the_prefetch():
+    connector = BlockingConnector()
+    word_lookup = lookup.Lookup(connector)
+    prefetcher = prefetch.Prefetcher(word_lookup, max_workers=1)
+    result = lookup.create_result('kuuta', 'Finnish', lookup.SUGGESTIONS,
+                                  suggestions=['kuu', 'koira', 'ilma'])
+    prefetcher.prefetch(result)
+    wait_until(lambda: word_lookup.flights.in_flight() == 1)
+    # The user asks for the word being fetched, the queued ones are dropped
+    prefetcher.cancel()
+    results = []
+    user = threading.Thread(target=lambda: results.append(word_lookup.lookup('kuu')))
+    user.start()
+    wait_until(lambda: word_lookup.flights.shared == 1)
+    connector.release.set()
+    user.join()
+    prefetcher.close(wait=True)
+    assert results[0]['status'] == lookup.FOUND
+    assert connector.requests == ['kuu']
+    assert word_lookup.stats()['coalesced'] == 1
+    # The prefetch went on at the priority of the user
+    assert word_lookup.stats()['promoted'] == 1
@@ -0,0 +1,94 @@
+'''
+Tests for the scheduling of interactive and bulk lookups.
+'''
+import threading
+
+import pytest
+
+from susaki.wiktionary import lookup, throttling
+from susaki.wiktionary.scheduler import LookupScheduler
+from susaki.wiktionary.throttling import BULK, INTERACTIVE
+from tests.wiktionary.lookup_test import RawPagesConnector, wait_until
+
+
+@pytest.fixture
+def word_lookup():
+    return lookup.Lookup(RawPagesConnector())
+
+
+def test_interactive_first_then_jobs_in_turn(word_lookup):
+    release = threading.Event()
+    order = []
+    with LookupScheduler(word_lookup, max_workers=1, reserved_workers=0) as scheduler:
+        scheduler.run(BULK, 'blocker', release.wait, 5)
+        wait_until(lambda: scheduler.stats()['running_bulk'] == 1)
+        futures = [scheduler.run(BULK, 'long', order.append, 'long1'),
+                   scheduler.run(BULK, 'long', order.append, 'long2'),
+                   scheduler.run(BULK, 'long', order.append, 'long3'),
+                   scheduler.run(BULK, 'short', order.append, 'short1'),
+                   scheduler.run(INTERACTIVE, None, order.append, 'interactive')]
+        release.set()
+        for future in futures:
+            future.result(5)
+    assert order == ['interactive', 'long1', 'short1', 'long2', 'long3']
+
+
+def test_reserved_worker_serves_interactive_lookups(word_lookup):
+    release = threading.Event()
+    with LookupScheduler(word_lookup, max_workers=2, reserved_workers=1) as scheduler:
+        blocked = [scheduler.run(BULK, 'job', release.wait, 5) for _ in range(2)]
+        wait_until(lambda: scheduler.stats()['running_bulk'] == 1)
+        # The second bulk call waits although a worker is idle
+        assert scheduler.stats()['queued']['bulk'] == 1
+        assert scheduler.run(INTERACTIVE, None, throttling.current_priority).result(5) == \
+            INTERACTIVE
+        assert not any(future.done() for future in blocked)
+        release.set()
+        assert [future.result(5) for future in blocked] == [True, True]
+
+
+def test_lookups(word_lookup):
+    with LookupScheduler(word_lookup, max_workers=2) as scheduler:
+        results = scheduler.map(['koira', 'kuu', 'qwerty'])
+        assert [result['status'] for result in results] == ['found', 'found', 'missing']
+        cached = scheduler.submit('Koira')
+        assert cached.done() and cached.result() is results[0]
+        assert scheduler.run(BULK, 'job', throttling.current_priority).result(5) == BULK
+        stats = scheduler.stats()
+    assert stats['completed'] == {'interactive': 0, 'bulk': 4}
+    assert sorted(word_lookup.connector.requests) == ['koira', 'kuu', 'qwerty']
+
+
+def test_cancel_job(word_lookup):
+    release = threading.Event()
+    with LookupScheduler(word_lookup, max_workers=1, reserved_workers=0) as scheduler:
+        running = scheduler.run(BULK, 'job', release.wait, 5)
+        wait_until(lambda: scheduler.stats()['running_bulk'] == 1)
+        queued = [scheduler.run(BULK, 'job', str, i) for i in range(3)]
+        assert scheduler.cancel('job') == 3
+        release.set()
+        assert running.result(5) is True
+    assert all(future.cancelled() for future in queued)
+    with pytest.raises(ValueError):
+        LookupScheduler(word_lookup, max_workers=1, reserved_workers=1)
+
+
+def test_lookups_beyond_max_queued_are_refused(word_lookup):
+    release = threading.Event()
+    with LookupScheduler(word_lookup, max_workers=1, reserved_workers=0,
+                         max_queued=2) as scheduler:
+        running = scheduler.run(BULK, 'job', release.wait, 5)
+        wait_until(lambda: scheduler.stats()['running_bulk'] == 1)
+        queued = [scheduler.run(BULK, 'job', str, 1), scheduler.run(BULK, 'job', str, 2)]
+        with pytest.raises(throttling.OverloadError):
+            scheduler.run(BULK, 'other', str, 3)
+        # A full bulk queue doesn't refuse the interactive lookups
+        queued += [scheduler.run(INTERACTIVE, None, str, 4), scheduler.run(INTERACTIVE, None, str, 5)]
+        with pytest.raises(throttling.OverloadError):
+            scheduler.run(INTERACTIVE, None, str, 6)
+        assert scheduler.stats()['rejected'] == 2
+        release.set()
+        assert running.result(5) is True
+        assert [future.result(5) for future in queued] == ['1', '2', '4', '5']
+        # There is room again once the queue is worked off
+        assert scheduler.run(BULK, 'job', str, 7).result(5) == '7'
@@ -0,0 +1,71 @@
+'''
+Tests for the capture and replay of slow lookups.
+'''
+import cProfile
+import json
+import os
+import pstats
+
+import pytest
+
+from susaki.wiktionary import lookup, slow_queries
+from tests.wiktionary.lookup_test import RawPagesConnector
+
+
+def test_slow_lookups_are_captured(tmpdir):
+    recorder = slow_queries.SlowQueryRecorder(str(tmpdir), threshold=0, profile=True,
+                                              max_captures=2)
+    word_lookup = lookup.Lookup(RawPagesConnector(), slow_recorder=recorder)
+    word_lookup.lookup('koira')
+    word_lookup.invalidate('koira')
+    word_lookup.lookup('koira')
+    word_lookup.lookup('hello')
+    word_lookup.lookup('kuu')
+    recorder.flush()
+    assert [capture for capture, _ in recorder.captured] == [
+        ('koira', 'Finnish'), ('hello', 'Finnish')]
+    path = recorder.captured[0][1]
+    assert sorted(os.listdir(path)) == ['article.html', 'capture.json', 'profile.prof']
+    with open(os.path.join(path, 'capture.json')) as f:
+        capture = json.load(f)
+    assert capture['parser'] == 'susaki.wiktionary.wiki_parsing.article_parsing'
+    assert sorted(capture['timings']) == ['convert', 'fetch', 'parse']
+    assert capture['total'] >= capture['processing'] >= capture['timings']['parse'] > 0
+    assert pstats.Stats(os.path.join(path, 'profile.prof')).total_calls > 0
+
+
+def test_fast_lookups_are_not_captured(tmpdir):
+    recorder = slow_queries.SlowQueryRecorder(str(tmpdir), threshold=60)
+    lookup.Lookup(RawPagesConnector(), slow_recorder=recorder).lookup('koira')
+    recorder.close()
+    assert recorder.captured == [] and os.listdir(str(tmpdir)) == []
+
+
+def test_only_parsing_and_converting_count(tmpdir):
+    recorder = slow_queries.SlowQueryRecorder(str(tmpdir), threshold=1)
+    assert recorder.check('koira', 'Finnish', '', lookup.article_parsing,
+                          [('fetch', 30.0), ('parse', 0.5), ('convert', 0.1)]) is None
+    path = recorder.check('koira', 'Finnish', '', lookup.article_parsing,
+                          [('fetch', 0.1), ('parse', 1.5), ('convert', 0.1)])
+    recorder.close()
+    with open(os.path.join(path, 'capture.json')) as f:
+        assert json.load(f)['processing'] == pytest.approx(1.6)
+
+
+def test_replay(tmpdir):
+    recorder = slow_queries.SlowQueryRecorder(str(tmpdir), threshold=0)
+    word_lookup = lookup.Lookup(RawPagesConnector(), slow_recorder=recorder)
+    for word in ['kuu', 'hello']:
+        word_lookup.lookup(word)
+    recorder.flush()
+    captures = sorted(slow_queries.load_captures(str(tmpdir)),
+                      key=lambda capture: capture[1]['word'], reverse=True)
+    assert [capture['word'] for _, capture in captures] == ['kuu', 'hello']
+    profiler = cProfile.Profile()
+    report = slow_queries.replay(captures, repeat=2, profiler=profiler)
+    assert [(word, error is None) for word, _, _, error in report] == [
+        ('kuu', True), ('hello', False)]
+    assert all(replayed > 0 for _, _, replayed, _ in report)
+    assert pstats.Stats(profiler).total_calls > 0
+    # A single capture can be replayed on its own
+    assert len(list(slow_queries.load_captures(captures[0][0]))) == 1
@@ -0,0 +1,112 @@
+'''
+Tests for the snapshot of the hot cache and the lazy start up of the
+command line tools.
+'''
+import logging
+import os
+import sys
+import threading
+
+import pytest
+
+from susaki.definitions import ROOT_DIR
+from susaki.wiktionary.debugging.startup_benchmark import measure_import
+from susaki.wiktionary.lookup import create_result
+from susaki.wiktionary.snapshot import HotCache
+
+sys.path.insert(0, os.path.join(ROOT_DIR, 'susaki', 'wiktionary', 'examples'))
+
+
+def test_round_trip(tmpdir):
+    path = str(tmpdir.join('cache', 'hot_cache.json'))
+    cache = HotCache()
+    cache.put('Koira', 'Finnish', create_result('koira', 'Finnish', 'missing'))
+    assert cache.changed
+    cache.save(path)
+    assert not cache.changed
+    loaded = HotCache.load(path)
+    assert loaded.get('koira ', 'Finnish')['status'] == 'missing'
+    assert loaded.get('koira', 'Swedish') is None
+
+
+def test_hottest_entries_are_kept(tmpdir):
+    path = str(tmpdir.join('hot_cache.json'))
+    cache = HotCache(max_entries=2)
+    for word in ('a', 'b', 'c'):
+        cache.put(word, 'Finnish', create_result(word, 'Finnish', 'missing'))
+    cache.get('c', 'Finnish')
+    cache.get('a', 'Finnish')
+    cache.save(path)
+    assert sorted(HotCache.load(path).entries) == ['api|Finnish|a', 'api|Finnish|c']
+
+
+def test_unreadable_snapshot_is_ignored(tmpdir):
+    path = tmpdir.join('hot_cache.json')
+    path.write('{"api|Finnish|koira": ')
+    assert len(HotCache.load(str(path))) == 0
+
+
+def test_entries_expire(tmpdir):
+    now = [1000.0]
+    cache = HotCache(ttl=100, missing_ttl=10, clock=lambda: now[0])
+    cache.put('koira', 'Finnish', create_result('koira', 'Finnish', 'found'))
+    cache.put('qwerty', 'Finnish', create_result('qwerty', 'Finnish', 'missing'))
+    now[0] += 50
+    assert ('koira', 'Finnish') in cache and ('qwerty', 'Finnish') not in cache
+    assert cache.get('qwerty', 'Finnish') is None
+    path = str(tmpdir.join('hot_cache.json'))
+    cache.save(path)
+    now[0] += 100
+    loaded = HotCache.load(path, ttl=100, clock=lambda: now[0])
+    assert list(loaded.entries) == ['api|Finnish|koira']
+    assert loaded.get('koira', 'Finnish') is None
+
+
+def test_results_are_only_served_to_their_mode(tmpdir):
+    path = str(tmpdir.join('hot_cache.json'))
+    cache = HotCache(mode='wikitext')
+    cache.put('koira', 'Finnish', create_result('koira', 'Finnish', 'missing'))
+    cache.save(path)
+    assert HotCache.load(path).get('koira', 'Finnish') is None
+    assert HotCache.load(path, mode='wikitext').get('koira', 'Finnish')['status'] == 'missing'
+
+
+def test_threads_share_the_cache(tmpdir):
+    # Every other get finds the entry expired and drops it
+    cache = HotCache(missing_ttl=-1)
+    result = create_result('koira', 'Finnish', 'missing')
+
+    def work():
+        for _ in range(2000):
+            cache.put('koira', 'Finnish', result)
+            cache.get('koira', 'Finnish')
+            cache.get('koira', 'Finnish')
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.get('koira', 'Finnish') is None and len(cache) == 0
+
+
+@pytest.mark.parametrize('module', ['dictionary', 'translate'])
+def test_heavy_modules_are_not_imported_at_start_up(module):
+    _, heavy = measure_import(module, repeat=1)
+    assert heavy == []
+
+
+def test_dictionary_answers_from_the_snapshot(tmpdir, capsys, monkeypatch):
+    import dictionary
+    monkeypatch.setattr(dictionary, 'setup_logging', lambda debugging: logging.getLogger())
+    path = str(tmpdir.join('hot_cache.json'))
+    cache = HotCache()
+    cache.put('koira', 'Finnish', create_result('koira', 'Finnish', 'found', [
+        {'pos': 'Noun', 'translations': [
+            {'text': 'dog', 'examples': [{'text': 'Koira haukkuu.', 'translation': None}]}]}]))
+    cache.save(path)
+    wiktionary = dictionary.Wiktionary('Finnish', snapshot_path=path)
+    wiktionary.run_once(['Koira'])
+    assert wiktionary._lookup is None
+    output = capsys.readouterr().out
+    assert '- dog' in output and '* Koira haukkuu.' in output
+    assert HotCache.load(path).entries['api|Finnish|koira']['hits'] == 2
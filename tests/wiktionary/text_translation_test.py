@@ -0,0 +1,98 @@
+'''
+Tests for the translation of running text.
+'''
+import io
+
+from susaki.wiktionary import lookup, text_translation
+from susaki.wiktionary.snapshot import HotCache
+from susaki.wiktionary.wiki_parsing import article_parsing
+from tests.wiktionary.lookup_test import RawPagesConnector
+
+TEXT = 'Koira ja kuu. Kuussa koirat, koiran kuu! Ilma on ilmaa. Päästä pääsen.'
+
+
+def test_tokenize():
+    tokens = text_translation.tokenize("Kuu-ukko, 3 koiraa ja vaa'an_osa.")
+    assert [token.group() for token in tokens] == ['Kuu-ukko', 'koiraa', 'ja', "vaa'an", 'osa']
+
+
+def test_form_index():
+    forms = text_translation.FormIndex()
+    forms.add('päästä', {'indicative/present/negative/first': 'en pääse',
+                         'indicative/present/positive/first': 'pääsen',
+                         'potential/perfect/first': '—'})
+    forms.add('pää', {'elative/singular': 'päästä'})
+    assert forms.lemma('pääse') == 'päästä' and forms.lemma('pääsen') == 'päästä'
+    assert forms.lemma('päästä') == 'pää'
+    assert forms.lemma('en') is None and forms.lemma('—') is None
+
+
+def test_inflected_forms_are_not_looked_up():
+    connector = RawPagesConnector()
+    translator = text_translation.TextTranslator(
+        lookup.Lookup(connector), workers=2, batch_size=2)
+    translation = translator.translate(TEXT)
+    assert sorted(connector.requests) == sorted(['kuu', 'koira', 'ja', 'ilma', 'on', 'päästä'])
+    assert translator.fetched == 6
+    assert translation.lemmas['kuussa'] == 'kuu'
+    assert translation.lemmas['koiran'] == translation.lemmas['koirat'] == 'koira'
+    assert translation.lemmas['ilmaa'] == 'ilma'
+    assert translation.lemmas['pääsen'] == 'päästä'
+    assert translation.lemmas['on'] is None
+    glossary = translation.glossary()
+    assert [entry[:3] for entry in glossary[:2]] == [
+        ('koira', 3, ['koira', 'koirat', 'koiran']), ('kuu', 3, ['kuu', 'kuussa'])]
+    assert glossary[-1] == (None, 1, ['on'], [])
+
+
+def test_form_article_leads_to_its_lemma():
+    connector = RawPagesConnector()
+    translator = text_translation.TextTranslator(lookup.Lookup(connector), workers=1)
+    translation = translator.translate('Kuussa.')
+    assert connector.requests == ['kuussa', 'kuu']
+    assert translation.lemmas['kuussa'] == 'kuu'
+    assert translation.glossary()[0][:3] == ('kuu', 1, ['kuussa'])
+
+
+def test_outputs():
+    translator = text_translation.TextTranslator(lookup.Lookup(RawPagesConnector()))
+    translation = translator.translate(TEXT)
+    f = io.StringIO()
+    translation.write_glossary(f)
+    lines = f.getvalue().splitlines()
+    assert lines[0].startswith('koira\t3\tkoira, koirat, koiran\tdog | ')
+    assert lines[-1] == 'on\t1\ton\t[UNKNOWN]'
+    annotated = translation.annotate(TEXT)
+    assert annotated.startswith('Koira[koira: dog] ja kuu[kuu: moon')
+    assert 'on ilmaa[ilma: air].' in annotated
+
+
+def test_failures_and_known_words():
+    class Parser:
+        def parse_article(self, raw_article, word, language, parse_tables=True):
+            if word == 'ilma':
+                raise ValueError('Unreadable article')
+            return article_parsing.parse_article(raw_article, word, language, parse_tables)
+
+    class Store:
+        def __init__(self):
+            self.words = []
+
+        def save(self, word, language, raw_article, err, parser):
+            self.words.append(word)
+
+    connector = RawPagesConnector()
+    store = Store()
+    hot_cache = HotCache()
+    hot_cache.put('ja', 'Finnish', lookup.create_result('ja', 'Finnish', lookup.MISSING))
+    word_lookup = lookup.Lookup(connector, Parser(), failure_store=store,
+                                existence_filter={'koira', 'ilma', 'ja', 'hello'})
+    translator = text_translation.TextTranslator(word_lookup, hot_cache=hot_cache)
+    translation = translator.translate('Koira, ilma ja kuu. Hello.')
+    # kuu isn't in the existence filter and ja is known to be missing
+    assert sorted(connector.requests) == ['hello', 'ilma', 'koira']
+    assert translator.failed == 1 and store.words == ['ilma']
+    assert translation.lemmas['koira'] == 'koira' and translation.lemmas['ilma'] is None
+    assert hot_cache.get('koira', 'Finnish')['status'] == lookup.FOUND
+    assert hot_cache.get('kuu', 'Finnish')['status'] == lookup.MISSING
+    assert hot_cache.get('hello', 'Finnish')['status'] == lookup.MISSING
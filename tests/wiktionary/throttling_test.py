@@ -0,0 +1,159 @@
+'''
+Tests for the rate limiting and retrying of requests.
+'''
+import pytest
+import requests
+
+from susaki.wiktionary import throttling
+from susaki.wiktionary.connectors import APIConnector
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+
+    def __init__(self, status_code=200, headers=None, content=b''):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+
+
+class FakeSession:
+    """Returns (or raises) the given replies in order"""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.urls = []
+
+    def get(self, url, timeout=None):
+        self.urls.append(url)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def rate_limiter(clock):
+    return throttling.RateLimiter(rate=2.0, burst=2, clock=clock, sleep=clock.sleep)
+
+
+class TestRateLimiter:
+
+    def test_burst_then_rate(self, rate_limiter, clock):
+        waits = [rate_limiter.acquire() for _ in range(4)]
+        assert waits == [0.0, 0.0, 0.5, 0.5]
+
+    def test_throttling_lowers_the_rate_and_blocks(self, rate_limiter, clock):
+        rate_limiter.on_throttle(retry_after=10)
+        assert rate_limiter.rate == 1.0
+        assert rate_limiter.acquire() == 10
+        for _ in range(20):
+            rate_limiter.on_success()
+        assert rate_limiter.rate == pytest.approx(3.0)
+
+    def test_rate_stays_within_bounds(self, clock):
+        rate_limiter = throttling.RateLimiter(rate=1.0, min_rate=0.5, max_rate=1.2, clock=clock)
+        for _ in range(5):
+            rate_limiter.on_throttle()
+        assert rate_limiter.rate == 0.5
+        for _ in range(20):
+            rate_limiter.on_success()
+        assert rate_limiter.rate == 1.2
+
+    def test_bulk_requests_use_the_spare_tokens(self, rate_limiter, clock):
+        with throttling.priority(throttling.BULK):
+            assert rate_limiter.acquire() == 0.0
+        # The interactive request reserves the last token and the next one
+        assert [rate_limiter.acquire() for _ in range(2)] == [0.0, 0.5]
+        with throttling.priority(throttling.BULK):
+            # Waits until a token is left over after the reserved one
+            assert rate_limiter.acquire() == 0.5
+            rate_limiter.on_throttle(retry_after=3)
+            assert rate_limiter.acquire() == 3
+        assert throttling.current_priority() == throttling.INTERACTIVE
+
+    def test_promoted_bulk_request_reserves_its_token(self, rate_limiter, clock):
+        assert [rate_limiter.acquire() for _ in range(2)] == [0.0, 0.0]
+        with throttling.priority(throttling.BULK) as current:
+            sleep = clock.sleep
+
+            def promote_while_waiting(seconds):
+                current.promote()
+                sleep(seconds)
+            rate_limiter._sleep = promote_while_waiting
+            # Waits for one spare token, then goes on as an interactive request
+            assert rate_limiter.acquire() == 0.5
+        rate_limiter._sleep = sleep
+        # The interactive request after it waits behind the promoted one
+        assert rate_limiter.acquire() == 0.5
+
+
+class TestRetry:
+
+    def get(self, session, rate_limiter, clock, max_retries=2):
+        return throttling.get_with_retry(
+            session, 'http://example.org', rate_limiter, max_retries, sleep=clock.sleep)
+
+    def test_retries_transient_failures(self, rate_limiter, clock):
+        session = FakeSession(requests.ConnectionError('Refused'), FakeResponse(502),
+                              FakeResponse(200))
+        assert self.get(session, rate_limiter, clock).status_code == 200
+        assert len(session.urls) == 3
+
+    def test_missing_page_is_not_retried(self, rate_limiter, clock):
+        session = FakeSession(FakeResponse(404))
+        assert self.get(session, rate_limiter, clock).status_code == 404
+        assert len(session.urls) == 1
+
+    def test_gives_up_with_transient_error(self, rate_limiter, clock):
+        session = FakeSession(*[FakeResponse(503)] * 3)
+        with pytest.raises(throttling.TransientError):
+            self.get(session, rate_limiter, clock)
+
+    def test_honours_retry_after_and_maxlag(self, rate_limiter, clock):
+        session = FakeSession(
+            FakeResponse(429, {'Retry-After': '7'}),
+            FakeResponse(200, {'Retry-After': '5', 'MediaWiki-API-Error': 'maxlag'}),
+            FakeResponse(200))
+        self.get(session, rate_limiter, clock)
+        assert rate_limiter.throttled == 2
+        assert clock.slept[:2] == [7, 5]
+        assert rate_limiter.rate < 2.0
+
+    @pytest.mark.parametrize('value,seconds', [
+        ('120', 120), (None, None), ('soon', None), ('Wed, 21 Oct 2015 07:28:00 GMT', 0)])
+    def test_parse_retry_after(self, value, seconds):
+        assert throttling.parse_retry_after(value) == seconds
+
+
+def test_api_error_is_transient(rate_limiter):
+    session = FakeSession(FakeResponse(200, content=b'<api><error code="readonly"/></api>'))
+    connector = APIConnector(session, rate_limiter, max_retries=0)
+    with pytest.raises(throttling.TransientError):
+        connector.collect_raw_article('koira')
+
+
+def test_missing_article_is_lookup_error(rate_limiter):
+    session = FakeSession(FakeResponse(200, content=(
+        b'<api><query><pages><page ns="0" title="qwerty" missing=""/></pages></query></api>')))
+    connector = APIConnector(session, rate_limiter, max_retries=0)
+    with pytest.raises(LookupError):
+        connector.collect_raw_article('qwerty')
@@ -0,0 +1,193 @@
+'''
+Tests for the incremental refresh of an archive, against a local stand-in
+for the MediaWiki API.
+'''
+import json
+import os
+import threading
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import pytest
+
+from susaki.wiktionary import archive, updater
+from susaki.wiktionary.connectors import APIConnector
+from susaki.wiktionary.lookup import Lookup
+from susaki.wiktionary.throttling import RateLimiter
+from susaki.wiktionary.wiki_parsing import article_parsing
+
+RAW_PAGES_DIR = os.path.join(os.path.dirname(__file__), 'parsing_test', 'raw_pages')
+
+
+def read_raw_page(word):
+    with open(os.path.join(RAW_PAGES_DIR, '{}.html'.format(word))) as f:
+        return f.read()
+
+
+class FakeWiki:
+    """The pages and the recent changes served by the stand-in"""
+
+    def __init__(self):
+        self.pages = {}
+        self.changes = []
+        self.requests = []
+
+    def edit(self, title, content, revid, timestamp):
+        self.pages[title] = (content, revid)
+        self.changes.append({'type': 'edit', 'title': title, 'revid': revid,
+                             'timestamp': timestamp})
+
+
+def create_handler(wiki, page_size=2):
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            query = {name: values[0] for name, values in parse_qs(urlsplit(self.path).query).items()}
+            wiki.requests.append(query)
+            if query.get('list') == 'recentchanges':
+                self.reply('application/json', json.dumps(self.recent_changes(query)))
+            else:
+                self.reply('text/xml', self.revision(query['titles']))
+
+        def recent_changes(self, query):
+            changes = [change for change in wiki.changes
+                       if change['timestamp'] >= query.get('rcstart', '')]
+            start = int(query.get('rccontinue', 0))
+            data = {'query': {'recentchanges': changes[start:start + page_size]}}
+            if start + page_size < len(changes):
+                data['continue'] = {'rccontinue': str(start + page_size)}
+            return data
+
+        def revision(self, title):
+            if title not in wiki.pages:
+                return '<api><query><pages><page title="{}" missing=""/></pages></query></api>'.format(
+                    title)
+            content, revid = wiki.pages[title]
+            return ('<api><query><pages><page title="{}"><revisions>'
+                    '<rev revid="{}" xml:space="preserve">{}</rev>'
+                    '</revisions></page></pages></query></api>').format(title, revid, escape(content))
+
+        def reply(self, content_type, body):
+            body = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+
+@pytest.fixture
+def wiki():
+    return FakeWiki()
+
+
+@pytest.fixture
+def api_url(wiki):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), create_handler(wiki))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}/w/api.php'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def archive_path(tmpdir):
+    path = str(tmpdir.join('articles.archive'))
+    with archive.ArchiveWriter(path) as writer:
+        writer.add('koira', read_raw_page('koira'), 1)
+        writer.add('kuu', read_raw_page('kuu'), 5)
+        writer.add('ilma', read_raw_page('ilma'), 3)
+    return path
+
+
+@pytest.fixture
+def create_updater(api_url, archive_path, tmpdir):
+    def create(lookup=None, include_new=False):
+        rate_limiter = RateLimiter(rate=1000, burst=1000)
+        feed = updater.RecentChangesFeed(
+            rate_limiter=rate_limiter, url=api_url + '?format=json&action=query&list=recentchanges')
+        connector = APIConnector(rate_limiter=rate_limiter,
+                                 url=api_url + '?format=xml&action=query&titles={}')
+        return updater.IncrementalUpdater(
+            feed, connector, archive_path, lookup, state_path=str(tmpdir.join('state.json')),
+            include_new=include_new)
+    return create
+
+
+def test_latest_revisions():
+    changes = [{'title': 'a', 'revid': 2}, {'title': 'a', 'revid': 7}, {'title': 'b', 'revid': 3}]
+    latest = updater.latest_revisions(changes)
+    assert latest['a']['revid'] == 7 and latest['b']['revid'] == 3
+
+
+def test_only_changed_articles_are_refetched(wiki, create_updater, archive_path):
+    wiki.edit('koira', read_raw_page('koira').replace('>dog<', '>hound<'), 2, '2016-05-12T10:00:00Z')
+    wiki.edit('kuu', read_raw_page('kuu'), 5, '2016-05-12T11:00:00Z')
+    wiki.edit('hello', read_raw_page('hello'), 9, '2016-05-12T12:00:00Z')
+    wiki.edit('koira', read_raw_page('koira').replace('>dog<', '>hound<'), 4, '2016-05-12T13:00:00Z')
+    connector = archive.ArchiveConnector(archive_path)
+    lookup = Lookup(connector, connector.parser)
+    assert lookup.lookup('koira')['pos'][0]['translations'][0]['text'] == 'dog'
+
+    report = create_updater(lookup).refresh()
+    assert report['updated'] == ['koira']
+    assert report['unchanged'] == 1
+    assert report['last_timestamp'] == '2016-05-12T13:00:00Z'
+    fetched = [request['titles'] for request in wiki.requests if 'titles' in request]
+    assert fetched == ['koira']
+    with archive.ArchiveReader(archive_path) as reader:
+        assert reader.revision('koira') == 4
+        assert reader.get('ilma') == read_raw_page('ilma')
+    assert lookup.lookup('koira')['pos'][0]['translations'][0]['text'] == 'hound'
+
+
+def test_state_continues_from_the_last_run(wiki, create_updater):
+    wiki.edit('koira', read_raw_page('koira'), 2, '2016-05-12T10:00:00Z')
+    create_updater().refresh()
+    wiki.edit('ilma', read_raw_page('ilma'), 6, '2016-05-13T10:00:00Z')
+    wiki.requests.clear()
+    report = create_updater().refresh()
+    assert report['since'] == '2016-05-12T10:00:00Z'
+    assert report['updated'] == ['ilma']
+    assert report['unchanged'] == 1
+
+
+def test_deleted_and_new_articles(wiki, create_updater, archive_path):
+    wiki.changes.append({'type': 'edit', 'title': 'ilma', 'revid': 8,
+                         'timestamp': '2016-05-12T10:00:00Z'})
+    wiki.edit('kuussa', read_raw_page('kuussa'), 11, '2016-05-12T11:00:00Z')
+    wiki.edit('hello', read_raw_page('hello'), 12, '2016-05-12T12:00:00Z')
+    report = create_updater(include_new=True).refresh()
+    assert report['removed'] == ['ilma']
+    assert report['added'] == ['kuussa']
+    with archive.ArchiveReader(archive_path) as reader:
+        assert sorted(reader.words()) == ['koira', 'kuu', 'kuussa']
+
+
+def test_parser_errors_dont_remove_or_abort(wiki, create_updater, archive_path, monkeypatch):
+    parse_article = article_parsing.parse_article
+
+    def failing_parse_article(raw_article, word, language='Finnish', parse_tables=True):
+        if word == 'koira':
+            raise LookupError('No POS-parts present')
+        if word == 'kuu':
+            raise ValueError('Unexpected header level')
+        return parse_article(raw_article, word, language, parse_tables=parse_tables)
+    monkeypatch.setattr(article_parsing, 'parse_article', failing_parse_article)
+    wiki.edit('koira', read_raw_page('koira'), 2, '2016-05-12T10:00:00Z')
+    wiki.edit('kuu', read_raw_page('kuu'), 6, '2016-05-12T11:00:00Z')
+    wiki.edit('ilma', read_raw_page('ilma'), 7, '2016-05-12T12:00:00Z')
+    report = create_updater().refresh()
+    assert [change['title'] for change in report['failed']] == ['koira', 'kuu']
+    assert report['removed'] == []
+    assert report['updated'] == ['ilma']
+    assert report['last_timestamp'] == '2016-05-12T12:00:00Z'
+    with archive.ArchiveReader(archive_path) as reader:
+        assert sorted(reader.words()) == ['ilma', 'koira', 'kuu']
+        assert (reader.revision('koira'), reader.revision('ilma')) == (1, 7)